@@ -0,0 +1,270 @@
+"""
+Aggregate Cube Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Precompute distinct-user aggregates once and answer chart queries by roll-up
+"""
+
+import numpy as np
+import pandas as pd
+
+from timestamp_parser import timestamp_nanos
+
+NANOS_PER_HOUR = 3_600_000_000_000
+NANOS_PER_DAY = 24 * NANOS_PER_HOUR
+
+CATEGORICAL_DIMENSIONS = ['event_type', 'platform', 'country', 'traffic_source']
+CUBE_DIMENSIONS = CATEGORICAL_DIMENSIONS + ['date', 'hour']
+
+# Dimensions derived from the date dimension at query time
+DERIVED_DIMENSIONS = ['month', 'day_of_week']
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def _pack(code_arrays, radices):
+    """Pack several non-negative code arrays into one int64 key (mixed radix)."""
+    if np.prod([float(radix) for radix in radices]) >= 2 ** 63:
+        raise OverflowError("Cube key space does not fit in int64")
+
+    key = np.zeros(len(code_arrays[0]) if code_arrays else 0, dtype=np.int64)
+    for codes, radix in zip(code_arrays, radices):
+        key = key * radix + codes
+    return key
+
+
+def _unpack(key, radices):
+    """Invert _pack."""
+    code_arrays = []
+    for radix in reversed(radices):
+        key, codes = np.divmod(key, radix)
+        code_arrays.append(codes)
+    return code_arrays[::-1]
+
+
+class CubeCells:
+    """
+    Cell layout shared by the exact and the sketch cubes.
+
+    I hold the dimension levels and the per-cell dimension codes, and do the
+    encoding, filtering and grouping both cubes need. What a cell stores
+    (user codes or sketch registers) and how groups are counted is left to
+    the subclasses.
+    """
+
+    def __init__(self, dimensions=None):
+        """
+        Initialize an empty cube.
+
+        Args:
+            dimensions (list): Cube dimensions (defaults to CUBE_DIMENSIONS)
+        """
+        self.dimensions = list(dimensions) if dimensions is not None else list(CUBE_DIMENSIONS)
+        self.levels = {}
+        self.cells = {}
+        self.first_day = 0
+
+    def _encode(self, events_df):
+        """
+        Encode every event's cube dimensions as dense non-negative codes.
+
+        Args:
+            events_df (pd.DataFrame or EventStore): Events with parsed event_timestamp
+
+        Returns:
+            tuple: (dimension -> codes, user ids) for events with a user and timestamp
+        """
+        users = np.asarray(events_df['user_id'])
+        timestamps = timestamp_nanos(events_df['event_timestamp'])
+
+        valid = ~pd.isna(users) & (timestamps != np.iinfo(np.int64).min)
+        users, timestamps = users[valid], timestamps[valid]
+
+        codes = {}
+        for dimension in self.dimensions:
+            if dimension in CATEGORICAL_DIMENSIONS:
+                # Code 0 is reserved for missing values so they never match a level
+                categorical = pd.Categorical(events_df[dimension])
+                codes[dimension] = categorical.codes[valid].astype(np.int64) + 1
+                self.levels[dimension] = pd.Index([None] + list(categorical.categories), dtype=object)
+            elif dimension == 'date':
+                days = timestamps // NANOS_PER_DAY
+                self.first_day = int(days.min()) if len(days) else 0
+                codes[dimension] = days - self.first_day
+                n_days = int(codes[dimension].max()) + 1 if len(days) else 0
+                self.levels[dimension] = pd.DatetimeIndex(
+                    (np.arange(n_days) + self.first_day).astype('datetime64[D]')
+                )
+            elif dimension == 'hour':
+                codes[dimension] = (timestamps // NANOS_PER_HOUR) % 24
+                self.levels[dimension] = pd.Index(range(24))
+            else:
+                raise ValueError(f"Unknown cube dimension: {dimension}")
+
+        return codes, users
+
+    def _radices(self):
+        """Return the number of levels of every stored dimension."""
+        return [len(self.levels[dimension]) for dimension in self.dimensions]
+
+    def __len__(self):
+        return len(self.cells[self.dimensions[0]]) if self.cells else 0
+
+    def _dimension_codes(self, dimension):
+        """Return per-cell codes and levels for a stored or derived dimension."""
+        if dimension in self.cells:
+            return self.cells[dimension], self.levels[dimension]
+
+        days = self.cells['date'].astype(np.int64) + self.first_day
+        if dimension == 'month':
+            months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+            first_month = months.min() if len(months) else 0
+            n_months = int(months.max() - first_month) + 1 if len(months) else 0
+            levels = pd.PeriodIndex(
+                (np.arange(n_months) + first_month).astype('datetime64[M]'), freq='M'
+            )
+            return months - first_month, levels
+        if dimension == 'day_of_week':
+            return (days + 3) % 7, pd.Index(DAY_NAMES)
+
+        raise ValueError(f"Unknown cube dimension: {dimension}")
+
+    def _filter_mask(self, where):
+        """Return a boolean mask of cells matching {dimension: allowed values}."""
+        mask = np.ones(len(self), dtype=bool)
+        for dimension, values in (where or {}).items():
+            cell_codes, levels = self._dimension_codes(dimension)
+            allowed = levels.get_indexer(pd.Index(list(values)))
+            mask &= np.isin(cell_codes, allowed[allowed >= 0])
+        return mask
+
+    def _group_keys(self, by, mask):
+        """Return the packed group key of every selected cell, the group levels and radices."""
+        group_codes, group_levels = [], []
+        for dimension in by:
+            cell_codes, levels = self._dimension_codes(dimension)
+            group_codes.append(cell_codes[mask].astype(np.int64))
+            group_levels.append(levels)
+
+        radices = [len(levels) for levels in group_levels]
+        return _pack(group_codes, radices), group_levels, radices
+
+    def _group_index(self, by, groups, group_levels, radices):
+        """Decode packed group keys into an index, dropping missing categorical levels."""
+        decoded = _unpack(groups, radices)
+
+        # Drop groups on the reserved missing-value level of categorical dimensions
+        keep = np.ones(len(groups), dtype=bool)
+        for dimension, codes in zip(by, decoded):
+            if dimension in CATEGORICAL_DIMENSIONS:
+                keep &= codes > 0
+
+        index = pd.MultiIndex.from_arrays(
+            [levels[codes[keep]] for levels, codes in zip(group_levels, decoded)], names=by
+        )
+        if len(by) == 1:
+            index = index.get_level_values(0)
+
+        return keep, index
+
+
+class AggregateCube(CubeCells):
+    """
+    Distinct-user aggregate cube over the chart dimensions.
+
+    I build this once per visualizer: every event is reduced to its
+    (event_type, platform, country, traffic_source, date, hour) cell codes plus
+    its user code, and the distinct (cell, user) tuples are kept. Distinct
+    counts cannot be summed across cells, so keeping the user in the cube is
+    what makes exact roll-ups possible. At hour grain a user rarely repeats an
+    event type within the same cell, so the cube has about as many rows as
+    there are events (20752 for 20752 on the sample data); the gain is the
+    compact int32 codes and not having to rescan the events per chart.
+
+    Every chart query is then a roll-up on the cube (distinct users per
+    combination of dimensions, with optional filters), so the raw events are
+    scanned exactly once.
+    """
+
+    def __init__(self, dimensions=None):
+        """
+        Initialize an empty cube.
+
+        Args:
+            dimensions (list): Cube dimensions (defaults to CUBE_DIMENSIONS)
+        """
+        super().__init__(dimensions)
+        self.user_ids = None
+
+    def fit(self, events_df):
+        """
+        Build the cube from the events (the only pass over the raw events).
+
+        Args:
+            events_df (pd.DataFrame or EventStore): Events with parsed event_timestamp
+
+        Returns:
+            AggregateCube: The fitted cube
+        """
+        codes, users = self._encode(events_df)
+        user_codes, self.user_ids = pd.factorize(users)
+
+        radices = self._radices() + [len(self.user_ids)]
+        keys = np.unique(_pack([codes[dimension] for dimension in self.dimensions] + [user_codes], radices))
+
+        unpacked = _unpack(keys, radices)
+        self.cells = {
+            dimension: array.astype(np.int32)
+            for dimension, array in zip(self.dimensions + ['user'], unpacked)
+        }
+        return self
+
+    def distinct_users(self, by, where=None):
+        """
+        Roll the cube up to distinct user counts.
+
+        Args:
+            by (list): Dimensions to group by (cube or derived dimensions)
+            where (dict): Optional filters, dimension -> allowed values
+
+        Returns:
+            pd.Series: Distinct users per group (groups without users are omitted)
+        """
+        mask = self._filter_mask(where)
+        group_key, group_levels, radices = self._group_keys(by, mask)
+        n_groups = int(np.prod(radices))
+
+        pairs = np.unique(_pack([group_key, self.cells['user'][mask]], [n_groups, len(self.user_ids)]))
+        counts = np.bincount(pairs // len(self.user_ids), minlength=n_groups)
+
+        present = np.flatnonzero(counts)
+        keep, index = self._group_index(by, present, group_levels, radices)
+
+        return pd.Series(counts[present][keep], index=index, name='user_id')
+
+    def to_frame(self, columns):
+        """
+        Return distinct rows of the cube for the given columns.
+
+        Args:
+            columns (list): 'user_id' and/or cube dimensions
+
+        Returns:
+            pd.DataFrame: Decoded distinct rows
+        """
+        dimensions = [column for column in columns if column != 'user_id']
+        code_arrays = [self._dimension_codes(dimension)[0].astype(np.int64) for dimension in dimensions]
+        radices = [len(self._dimension_codes(dimension)[1]) for dimension in dimensions]
+
+        if 'user_id' in columns:
+            code_arrays.append(self.cells['user'].astype(np.int64))
+            radices.append(len(self.user_ids))
+
+        unique_codes = _unpack(np.unique(_pack(code_arrays, radices)), radices)
+
+        frame = {}
+        for dimension, codes in zip(dimensions, unique_codes):
+            frame[dimension] = self._dimension_codes(dimension)[1][codes]
+        if 'user_id' in columns:
+            frame['user_id'] = np.asarray(self.user_ids)[unique_codes[-1]]
+
+        return pd.DataFrame(frame)[columns]
@@ -0,0 +1,409 @@
+"""
+Benchmark Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Time and memory-profile the pipeline on synthetic data from 10^5 to 10^8 events
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import matplotlib
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import DataPreprocessor
+from funnel_engine import FUNNEL_STEPS
+from visualization import FunnelVisualizer
+
+BENCHMARK_VERSION = 1
+
+DEFAULT_SIZES = [100_000, 1_000_000]
+
+# Share of users on each attribute level, measured on data/user_events.csv
+PLATFORM_SHARES = {'web': 0.445, 'mobile_web': 0.247, 'ios_app': 0.213, 'android_app': 0.095}
+COUNTRY_SHARES = {
+    'US': 0.395, 'UK': 0.154, 'Canada': 0.118, 'Germany': 0.094,
+    'France': 0.088, 'Australia': 0.052, 'Israel': 0.05, 'Netherlands': 0.049
+}
+TRAFFIC_SOURCE_SHARES = {
+    'organic_search': 0.313, 'paid_search': 0.254, 'social_media': 0.196,
+    'email_campaign': 0.1, 'direct': 0.093, 'referral': 0.044
+}
+
+# Probability of reaching each funnel step after the previous one
+STEP_CONTINUATION = [0.65, 0.449, 0.852, 0.768, 0.386, 0.703, 0.8, 0.743]
+APP_DOWNLOAD_RATE = 0.0084
+APP_LOGIN_RATE = 0.94
+
+DEMOGRAPHIC_SHARES = {
+    'age_group': {'25-34': 0.348, '35-44': 0.254, '18-24': 0.15, '45-54': 0.148, '55-64': 0.069, '65+': 0.031},
+    'gender': {'Male': 0.524, 'Female': 0.456, 'Other': 0.02},
+    'annual_income_range': {
+        '50k-75k': 0.193, '30k-50k': 0.181, '<30k': 0.14, '75k-100k': 0.14, '25k-40k': 0.082,
+        '<25k': 0.072, '40k-60k': 0.07, '100k+': 0.066, '60k-80k': 0.042, '80k+': 0.014
+    },
+    'preferred_device': {'Mobile': 0.444, 'Desktop': 0.354, 'Mixed': 0.151, 'Tablet': 0.051},
+}
+PREMIUM_RATE = 0.154
+
+DATA_START = np.datetime64('2024-06-01', 'ns')
+DATA_DAYS = 183
+
+# Gaps between a user's events: minutes within a visit, days between visits
+VISIT_GAP_SECONDS = 900
+RETURN_GAP_SECONDS = 3 * 86_400
+RETURN_RATE = 0.02
+SESSION_TIMEOUT_SECONDS = 1800
+
+CAMPAIGN_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'campaign_data.csv')
+
+
+def _choice(rng, shares, size):
+    """Draw category labels with the given shares."""
+    labels = list(shares)
+    probabilities = np.array(list(shares.values()), dtype=float)
+    return pd.Categorical.from_codes(
+        rng.choice(len(labels), size=size, p=probabilities / probabilities.sum()), categories=labels
+    )
+
+
+def expected_events_per_user():
+    """Mean number of events per synthetic user."""
+    funnel = 1 + np.cumprod(STEP_CONTINUATION).sum()
+    return funnel + APP_DOWNLOAD_RATE * (1 + APP_LOGIN_RATE)
+
+
+def _synthetic_chunk(rng, first_user, n_users, duplicate_rate):
+    """Generate the events and demographics of users first_user .. first_user + n_users - 1."""
+    user_ids = np.arange(first_user, first_user + n_users, dtype=np.int64)
+
+    # Funnel depth: keep going while every continuation draw succeeds
+    continues = rng.random((n_users, len(STEP_CONTINUATION))) < STEP_CONTINUATION
+    depth = 1 + np.cumprod(continues, axis=1).sum(axis=1)
+    downloads = rng.random(n_users) < APP_DOWNLOAD_RATE
+    logins = downloads & (rng.random(n_users) < APP_LOGIN_RATE)
+    counts = depth + downloads + logins
+
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    position = np.arange(counts.sum()) - np.repeat(starts, counts)
+    users = np.repeat(user_ids, counts)
+
+    # Funnel steps first, then app_download and first_login_app
+    event_types = np.array(FUNNEL_STEPS + ['app_download', 'first_login_app'])
+    step = np.where(position < np.repeat(depth, counts), position, len(FUNNEL_STEPS) + position - np.repeat(depth, counts))
+
+    gaps = rng.exponential(VISIT_GAP_SECONDS, len(users))
+    returning = rng.random(len(users)) < RETURN_RATE
+    gaps[returning] = rng.exponential(RETURN_GAP_SECONDS, returning.sum())
+    gaps[starts] = 0
+
+    elapsed = np.cumsum(gaps)
+    elapsed -= np.repeat(elapsed[starts], counts)
+    first_seconds = rng.random(n_users) * DATA_DAYS * 86_400
+    seconds = np.repeat(first_seconds, counts) + elapsed
+    timestamps = DATA_START + (seconds * 1e6).astype(np.int64).astype('timedelta64[us]')
+
+    # A session ends after SESSION_TIMEOUT_SECONDS without events
+    new_session = gaps > SESSION_TIMEOUT_SECONDS
+    new_session[starts] = True
+    session_index = np.maximum.accumulate(np.where(new_session, np.arange(len(users)), 0))
+    session_epoch = timestamps[session_index].astype('datetime64[s]').astype(np.int64)
+
+    attributes = {
+        'platform': _choice(rng, PLATFORM_SHARES, n_users),
+        'country': _choice(rng, COUNTRY_SHARES, n_users),
+        'traffic_source': _choice(rng, TRAFFIC_SOURCE_SHARES, n_users)
+    }
+    user_rows = np.repeat(np.arange(n_users), counts)
+
+    events = pd.DataFrame({
+        'user_id': users,
+        'event_timestamp': timestamps,
+        'event_type': event_types[step],
+        'platform': attributes['platform'][user_rows],
+        'country': attributes['country'][user_rows],
+        'traffic_source': attributes['traffic_source'][user_rows],
+        'session_id': 'sess_' + pd.Series(users).astype(str) + '_' + pd.Series(session_epoch).astype(str)
+    })
+
+    # Re-delivered events, so cleaning has duplicates to remove
+    duplicates = np.flatnonzero(rng.random(len(events)) < duplicate_rate)
+    if len(duplicates):
+        events = pd.concat([events, events.iloc[duplicates]]).sort_index(kind='stable').reset_index(drop=True)
+
+    demographics = pd.DataFrame({'user_id': user_ids})
+    for column, shares in DEMOGRAPHIC_SHARES.items():
+        demographics[column] = _choice(rng, shares, n_users)
+    demographics.insert(3, 'country', attributes['country'])
+    demographics['primary_traffic_source'] = attributes['traffic_source']
+    demographics['registration_date'] = (DATA_START + (first_seconds * 1e9).astype('timedelta64[ns]')).astype('datetime64[D]')
+    demographics['is_premium_user'] = rng.random(n_users) < PREMIUM_RATE
+
+    return events, demographics
+
+
+def iter_synthetic_data(n_events, chunk_events=1_000_000, seed=0, duplicate_rate=0.001):
+    """
+    Generate synthetic events (and matching demographics) chunk by chunk.
+
+    Users get one platform, country and traffic source each, walk down the
+    funnel with the step continuation rates measured on the real export, and
+    space their events minutes apart with occasional multi-day returns.
+
+    Args:
+        n_events (int): Total number of event rows to generate
+        chunk_events (int): Approximate event rows per chunk
+        seed (int): Random seed
+        duplicate_rate (float): Share of events delivered twice
+
+    Yields:
+        tuple: (events, demographics) DataFrames for a batch of new users
+    """
+    rng = np.random.default_rng(seed)
+    users_per_chunk = max(1, int(chunk_events / (expected_events_per_user() * (1 + duplicate_rate))))
+
+    generated, next_user = 0, 1
+    while generated < n_events:
+        events, demographics = _synthetic_chunk(rng, next_user, users_per_chunk, duplicate_rate)
+
+        # Cut the last chunk at a user boundary at or after n_events
+        remaining = n_events - generated
+        if len(events) > remaining:
+            last_user = events['user_id'].iloc[remaining - 1]
+            events = events[events['user_id'] <= last_user].iloc[:remaining]
+            demographics = demographics[demographics['user_id'] <= last_user]
+
+        generated += len(events)
+        next_user += users_per_chunk
+        yield events, demographics
+
+
+def write_synthetic_dataset(output_dir, n_events, seed=0, chunk_events=1_000_000):
+    """
+    Write a synthetic copy of the three input CSV files.
+
+    Args:
+        output_dir (str): Directory for the generated files
+        n_events (int): Number of event rows
+        seed (int): Random seed
+        chunk_events (int): Event rows generated per chunk
+
+    Returns:
+        list: Events, demographics and campaign CSV paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [
+        os.path.join(output_dir, 'user_events.csv'),
+        os.path.join(output_dir, 'user_demographics.csv'),
+        os.path.join(output_dir, 'campaign_data.csv')
+    ]
+
+    for index, (events, demographics) in enumerate(iter_synthetic_data(n_events, chunk_events, seed)):
+        header, mode = index == 0, 'w' if index == 0 else 'a'
+        events.to_csv(paths[0], mode=mode, header=header, index=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+        demographics.to_csv(paths[1], mode=mode, header=header, index=False)
+
+    # Campaigns do not scale with traffic, so the real table is reused
+    shutil.copyfile(CAMPAIGN_SOURCE, paths[2])
+    return paths
+
+
+def measure(stage, func, rows, trace_memory=True, quiet=True):
+    """
+    Run one pipeline stage and record its cost.
+
+    Args:
+        stage (str): Stage name for the report
+        func (callable): Stage to run
+        rows (int): Input event rows
+        trace_memory (bool): Track the stage's peak allocations with tracemalloc
+            (adds overhead to allocation-heavy stages)
+        quiet (bool): Hide the stage's progress output
+
+    Returns:
+        dict: Benchmark record
+    """
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+
+    output = io.StringIO() if quiet else sys.stdout
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    with contextlib.redirect_stdout(output):
+        func()
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    record = {
+        'stage': stage,
+        'rows': rows,
+        'wall_seconds': round(wall, 6),
+        'cpu_seconds': round(cpu, 6),
+        'rows_per_second': round(rows / wall, 1) if wall > 0 else None,
+        'peak_traced_mb': None,
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'max_rss_mb': round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1
+        )
+    }
+    if trace_memory:
+        record['peak_traced_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+        tracemalloc.stop()
+
+    plt.close('all')
+    return record
+
+
+def benchmark_size(paths, rows, chart_dir=None, trace_memory=True, quiet=True):
+    """
+    Time every DataPreprocessor step and FunnelVisualizer method on one dataset.
+
+    Args:
+        paths (list): Events, demographics and campaign CSV paths
+        rows (int): Event rows in the dataset
+        chart_dir (str): Directory for the charts (charts are skipped if None)
+        trace_memory (bool): Record peak traced memory per stage
+        quiet (bool): Hide the pipeline's progress output
+
+    Returns:
+        list: Benchmark records
+    """
+    records = []
+
+    def run(stage, func):
+        records.append(measure(stage, func, rows, trace_memory, quiet))
+        if not quiet:
+            print(f"⏱️ {stage}: {records[-1]['wall_seconds']:.3f}s")
+
+    preprocessor = DataPreprocessor()
+    run('DataPreprocessor.load_data', lambda: preprocessor.load_data(*paths))
+    run('DataPreprocessor.clean_user_events', preprocessor.clean_user_events)
+    run('DataPreprocessor.create_user_journey_summary', preprocessor.create_user_journey_summary)
+    run('DataPreprocessor.merge_with_demographics', preprocessor.merge_with_demographics)
+    run('DataPreprocessor.calculate_funnel_metrics', preprocessor.calculate_funnel_metrics)
+
+    holder = {}
+    run('FunnelVisualizer.__init__', lambda: holder.setdefault('visualizer', FunnelVisualizer(
+        preprocessor.user_events, preprocessor.user_demographics, preprocessor.campaign_data
+    )))
+    visualizer = holder['visualizer']
+    run('FunnelVisualizer.cube', lambda: visualizer.cube)
+
+    def funnel_metrics():
+        visualizer.funnel_engine = None
+        visualizer._calculate_funnel_metrics()
+
+    run('FunnelVisualizer._calculate_funnel_metrics', funnel_metrics)
+    run('FunnelVisualizer._calculate_platform_metrics', visualizer._calculate_platform_metrics)
+    run('FunnelVisualizer._calculate_time_metrics', visualizer._calculate_time_metrics)
+
+    if chart_dir is not None:
+        for method in ['create_funnel_chart', 'create_platform_comparison', 'create_cohort_heatmap',
+                       'create_time_trends', 'create_campaign_performance']:
+            save_path = os.path.join(chart_dir, f"{method}.png")
+            run(f"FunnelVisualizer.{method}", lambda method=method, save_path=save_path:
+                getattr(visualizer, method)(save_path))
+
+    return records
+
+
+def run_benchmarks(sizes=None, output_path='benchmark_results.json', seed=0, charts=True,
+                   trace_memory=True, quiet=True, chunk_events=1_000_000, work_dir=None):
+    """
+    Run the benchmark suite over several dataset sizes and write a JSON report.
+
+    Args:
+        sizes (list): Event row counts (defaults to DEFAULT_SIZES)
+        output_path (str): JSON report path
+        seed (int): Random seed of the synthetic data
+        charts (bool): Also time the chart methods
+        trace_memory (bool): Record peak traced memory per stage
+        quiet (bool): Hide the pipeline's progress output
+        chunk_events (int): Event rows generated per chunk
+        work_dir (str): Directory for generated data (a temporary one if None)
+
+    Returns:
+        dict: The report written to output_path
+    """
+    sizes = [int(size) for size in (sizes or DEFAULT_SIZES)]
+    report = {
+        'benchmark_version': BENCHMARK_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'settings': {'seed': seed, 'charts': charts, 'trace_memory': trace_memory},
+        'results': []
+    }
+
+    with tempfile.TemporaryDirectory(prefix='funnel_benchmark_', dir=work_dir) as base_dir:
+        for rows in sizes:
+            print(f"🏗️ Generating {rows:,} synthetic events...")
+            data_dir = os.path.join(base_dir, f"rows_{rows}")
+            generation_start = time.perf_counter()
+            paths = write_synthetic_dataset(data_dir, rows, seed=seed, chunk_events=chunk_events)
+            print(f"✅ Generated in {time.perf_counter() - generation_start:.1f}s")
+
+            chart_dir = os.path.join(data_dir, 'charts') if charts else None
+            if chart_dir:
+                os.makedirs(chart_dir, exist_ok=True)
+
+            records = benchmark_size(paths, rows, chart_dir, trace_memory, quiet)
+            report['results'].extend(records)
+            print(f"⏱️ {rows:,} events: {sum(record['wall_seconds'] for record in records):.2f}s total")
+
+            shutil.rmtree(data_dir)
+
+    with open(output_path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f"💾 Saved benchmark results to {output_path}")
+
+    return report
+
+
+def main():
+    """
+    Command line entry point.
+
+    I run this before every release and diff the JSON against the previous one.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the funnel analysis pipeline')
+    parser.add_argument('--sizes', nargs='+', type=float, default=DEFAULT_SIZES,
+                        help='Event row counts, e.g. 1e5 1e6 1e7')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON report path')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--chunk-events', type=int, default=1_000_000, help='Rows generated per chunk')
+    parser.add_argument('--work-dir', default=None, help='Directory for the generated data')
+    parser.add_argument('--no-charts', action='store_true', help='Skip the chart methods')
+    parser.add_argument('--no-memory', action='store_true', help='Skip tracemalloc peak memory tracking')
+    parser.add_argument('--verbose', action='store_true', help='Show pipeline progress output')
+    args = parser.parse_args()
+
+    run_benchmarks(
+        sizes=args.sizes, output_path=args.output, seed=args.seed, charts=not args.no_charts,
+        trace_memory=not args.no_memory, quiet=not args.verbose,
+        chunk_events=args.chunk_events, work_dir=args.work_dir
+    )
+
+    print("🎉 Benchmark completed successfully!")
+
+if __name__ == "__main__":
+    main()
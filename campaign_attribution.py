@@ -0,0 +1,190 @@
+"""
+Campaign Attribution Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Attribute users to campaigns through a sorted interval index and recompute campaign KPIs
+"""
+
+import numpy as np
+import pandas as pd
+
+from event_store import sorted_user_runs
+from event_stream import group_starts
+from timestamp_parser import NANOS_PER_DAY, NAT, timestamp_nanos
+
+# Event type counted as a conversion of an attributed user
+CONVERSION_EVENT = 'purchase_completed'
+
+# Campaign end dates are inclusive: a campaign runs until midnight after end_date
+END_DATE_PADDING = NANOS_PER_DAY
+
+# Marks users (and interval segments) without a campaign
+NO_CAMPAIGN = -1
+
+
+def user_entries(events, user_index=None, conversion_event=CONVERSION_EVENT):
+    """
+    Reduce events to each user's entry event and conversion flag.
+
+    Args:
+        events (pd.DataFrame or EventStore): Events with user_id, event_timestamp,
+            event_type and traffic_source
+        user_index (UserIndex): Offset index when events are cleaned and sorted
+            by user and time (skips the sort)
+        conversion_event (str): Event type that marks a conversion
+
+    Returns:
+        pd.DataFrame: user_id, entry_time, traffic_source and converted per user
+    """
+    users = events['user_id'].to_numpy(np.int64)
+    timestamps = timestamp_nanos(events['event_timestamp'])
+    sources = pd.Categorical(events['traffic_source'])
+    converted = (events['event_type'] == conversion_event).to_numpy(dtype=bool, na_value=False)
+
+    order, starts = sorted_user_runs(users, timestamps, user_index)
+    users, timestamps, converted = users[order], timestamps[order], converted[order]
+    source_codes = sources.codes[order]
+
+    entries = pd.DataFrame({
+        'user_id': users[starts],
+        'entry_time': timestamps[starts].view('datetime64[ns]'),
+        'traffic_source': pd.Categorical.from_codes(source_codes[starts], categories=sources.categories),
+        'converted': np.logical_or.reduceat(converted, starts) if len(starts) else converted[:0]
+    })
+    return entries
+
+
+class CampaignIndex:
+    """
+    Sorted interval index over campaign date ranges, one per channel.
+
+    I cut each channel's timeline at every campaign start and end into
+    elementary segments and store, for every segment, the campaign that owns
+    it: among the campaigns running in the segment, the one that started most
+    recently (the later row on ties). Attributing a timestamp is then one
+    binary search over the channel's segment boundaries, so the cost grows with
+    log(campaigns) per user instead of with a users x campaigns cross join.
+
+    Boundaries and owners of all channels are concatenated with per-channel
+    offsets, the same layout as UserIndex.
+    """
+
+    def __init__(self, campaigns):
+        """
+        Build the index.
+
+        Args:
+            campaigns (pd.DataFrame): Campaigns with start_date, end_date and channel
+        """
+        self.campaigns = campaigns.reset_index(drop=True)
+        starts = timestamp_nanos(self.campaigns['start_date'])
+        stops = timestamp_nanos(self.campaigns['end_date']) + END_DATE_PADDING
+        channel_codes, self.channels = pd.factorize(self.campaigns['channel'], sort=True)
+
+        boundaries, owners, offsets = [], [], [0]
+        for code in range(len(self.channels)):
+            rows = np.flatnonzero((channel_codes == code) & (starts != NAT) & (stops > starts))
+            channel_bounds, channel_owners = self._segments(rows, starts[rows], stops[rows])
+            boundaries.append(channel_bounds)
+            owners.append(channel_owners)
+            offsets.append(offsets[-1] + len(channel_bounds))
+
+        self.boundaries = np.concatenate(boundaries) if boundaries else np.zeros(0, dtype=np.int64)
+        self.owners = np.concatenate(owners) if owners else np.zeros(0, dtype=np.int64)
+        self.offsets = np.array(offsets, dtype=np.int64)
+
+    @staticmethod
+    def _segments(rows, starts, stops):
+        """
+        Elementary segments of one channel.
+
+        Returns:
+            tuple: (sorted boundaries, owner row of the segment starting at each
+                boundary, NO_CAMPAIGN after the last one and in gaps)
+        """
+        boundaries = np.unique(np.concatenate([starts, stops]))
+        owners = np.full(len(boundaries), NO_CAMPAIGN, dtype=np.int64)
+        if len(rows) == 0:
+            return boundaries, owners
+
+        # Every campaign covers the segments first..last-1
+        first = np.searchsorted(boundaries, starts)
+        lengths = np.searchsorted(boundaries, stops) - first
+        segments = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        segments += np.repeat(first, lengths)
+        covering = np.repeat(np.arange(len(rows)), lengths)
+
+        # Within a segment the most recent start (then the later row) sorts last
+        order = np.lexsort((rows[covering], starts[covering], segments))
+        segments, covering = segments[order], covering[order]
+        last = np.append(group_starts(segments)[1:], len(segments)) - 1
+        owners[segments[last]] = rows[covering[last]]
+        return boundaries, owners
+
+    def lookup(self, channels, timestamps):
+        """
+        Find the campaign attributed to each (channel, timestamp).
+
+        Args:
+            channels (array-like): Channel (traffic source) of every entry
+            timestamps (pd.Series or np.ndarray): Entry times
+
+        Returns:
+            np.ndarray: int64 campaign row positions, NO_CAMPAIGN where no
+                campaign of the channel was running
+        """
+        codes = self.channels.get_indexer(pd.Index(channels, dtype=object))
+        timestamps = timestamp_nanos(pd.Series(timestamps, copy=False))
+        positions = np.full(len(codes), NO_CAMPAIGN, dtype=np.int64)
+
+        # Group entries by channel with one counting sort, then binary search
+        # each group in its channel's boundaries
+        order = np.argsort(codes, kind='stable')
+        group_bounds = np.searchsorted(codes[order], np.arange(len(self.channels) + 1))
+        for code in range(len(self.channels)):
+            rows = order[group_bounds[code]:group_bounds[code + 1]]
+            low, high = self.offsets[code], self.offsets[code + 1]
+            segment = np.searchsorted(self.boundaries[low:high], timestamps[rows], side='right') - 1
+            inside = (segment >= 0) & (timestamps[rows] != NAT)
+            positions[rows[inside]] = self.owners[low + segment[inside]]
+
+        return positions
+
+    def performance(self, entries):
+        """
+        Recompute campaign KPIs from attributed user entries.
+
+        Args:
+            entries (pd.DataFrame): user_id, entry_time, traffic_source and
+                converted per user (see user_entries)
+
+        Returns:
+            tuple: (entries with a campaign_id column, per-campaign performance
+                with users_acquired, conversions, conversion_rate_percent,
+                cost_per_acquisition and cost_per_conversion)
+        """
+        positions = self.lookup(entries['traffic_source'], entries['entry_time'])
+        attributed = positions != NO_CAMPAIGN
+
+        campaign_ids = self.campaigns['campaign_id'].to_numpy()
+        entries = entries.assign(campaign_id=pd.arrays.IntegerArray(
+            campaign_ids[np.maximum(positions, 0)].astype(np.int64), ~attributed
+        ))
+
+        n_campaigns = len(self.campaigns)
+        acquired = np.bincount(positions[attributed], minlength=n_campaigns)
+        converted = np.bincount(
+            positions[attributed], weights=entries['converted'].to_numpy(bool)[attributed], minlength=n_campaigns
+        ).astype(np.int64)
+
+        performance = self.campaigns[['campaign_id', 'campaign_name', 'channel', 'start_date', 'end_date', 'budget']].copy()
+        performance['users_acquired'] = acquired
+        performance['conversions'] = converted
+        with np.errstate(divide='ignore', invalid='ignore'):
+            budget = performance['budget'].to_numpy(float)
+            performance['conversion_rate_percent'] = np.round(
+                np.where(acquired > 0, converted / acquired * 100, 0.0), 2
+            )
+            performance['cost_per_acquisition'] = np.round(np.where(acquired > 0, budget / acquired, np.nan), 2)
+            performance['cost_per_conversion'] = np.round(np.where(converted > 0, budget / converted, np.nan), 2)
+
+        return entries, performance
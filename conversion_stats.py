@@ -0,0 +1,244 @@
+"""
+Conversion Statistics Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Confidence intervals and significance tests for funnel and segment conversion rates
+"""
+
+from itertools import combinations
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+from scipy.special import erfc
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_RESAMPLES = 2000
+DEFAULT_SEED = 2025
+
+# Rates whose denominator has at least this many users use the analytic
+# (Wilson interval, two-proportion z-test) fast path instead of the bootstrap
+ANALYTIC_MIN_TRIALS = 1000
+
+
+def _z_value(confidence):
+    """Two-sided standard normal quantile of a confidence level."""
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def wilson_interval(successes, trials, confidence=DEFAULT_CONFIDENCE):
+    """
+    Wilson score interval of proportions (vectorized).
+
+    Args:
+        successes (array-like): Successes per rate
+        trials (array-like): Trials per rate (ratios above 1 are clipped)
+        confidence (float): Confidence level
+
+    Returns:
+        tuple: (low, high) proportions, NaN where trials is 0
+    """
+    successes = np.asarray(successes, dtype=float)
+    trials = np.asarray(trials, dtype=float)
+    z = _z_value(confidence)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = np.clip(successes / trials, 0, 1)
+        denominator = 1 + z ** 2 / trials
+        center = (p + z ** 2 / (2 * trials)) / denominator
+        half = z * np.sqrt(p * (1 - p) / trials + z ** 2 / (4 * trials ** 2)) / denominator
+
+    return center - half, center + half
+
+
+def two_proportion_p_values(successes_a, trials_a, successes_b, trials_b):
+    """
+    Two-sided p-values of pooled two-proportion z-tests (vectorized).
+
+    Returns:
+        np.ndarray: p-values, NaN where a group has no trials
+    """
+    successes_a, trials_a = np.asarray(successes_a, dtype=float), np.asarray(trials_a, dtype=float)
+    successes_b, trials_b = np.asarray(successes_b, dtype=float), np.asarray(trials_b, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pooled = np.clip((successes_a + successes_b) / (trials_a + trials_b), 0, 1)
+        error = np.sqrt(pooled * (1 - pooled) * (1 / trials_a + 1 / trials_b))
+        z = (successes_a / trials_a - successes_b / trials_b) / error
+
+    p_values = erfc(np.abs(z) / np.sqrt(2))
+    return np.where(np.isnan(z), np.where(error == 0, 1.0, np.nan), p_values)
+
+
+def bootstrap_counts(indicators, resamples=DEFAULT_RESAMPLES, rng=None):
+    """
+    Column sums of bootstrap resamples of per-user indicator rows.
+
+    Users with the same indicator row are interchangeable, so a resample of n
+    users is a multinomial draw over the distinct rows (at most 2**columns
+    of them) and all resamples are one matrix product, whatever the number
+    of users.
+
+    Args:
+        indicators (np.ndarray): Boolean matrix (users, columns)
+        resamples (int): Number of bootstrap resamples
+        rng (np.random.Generator): Random generator
+
+    Returns:
+        np.ndarray: int64 resampled column sums (resamples, columns)
+    """
+    rng = rng if rng is not None else np.random.default_rng(DEFAULT_SEED)
+    indicators = np.asarray(indicators, dtype=bool)
+    n_users, n_columns = indicators.shape
+    if n_users == 0:
+        return np.zeros((resamples, n_columns), dtype=np.int64)
+
+    # Pack each row into an integer to find the distinct rows and their users
+    weights = np.left_shift(1, np.arange(n_columns, dtype=np.int64))
+    patterns, users = np.unique(indicators.astype(np.int64) @ weights, return_counts=True)
+    pattern_matrix = ((patterns[:, None] & weights) > 0).astype(np.int64)
+
+    draws = rng.multinomial(n_users, users / n_users, size=resamples)
+    return draws @ pattern_matrix
+
+
+def _percentile_interval(samples, confidence):
+    """Percentile bootstrap interval of every column (NaN-aware)."""
+    alpha = (1 - confidence) / 2 * 100
+    with np.errstate(invalid='ignore'):
+        return np.nanpercentile(samples, alpha, axis=0), np.nanpercentile(samples, 100 - alpha, axis=0)
+
+
+def _ratios(numerators, denominators):
+    """Element-wise ratios, NaN where the denominator is 0."""
+    numerators, denominators = np.asarray(numerators, dtype=float), np.asarray(denominators, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominators > 0, numerators / denominators, np.nan)
+
+
+def funnel_intervals(funnel_engine, confidence=DEFAULT_CONFIDENCE, resamples=DEFAULT_RESAMPLES,
+                     seed=DEFAULT_SEED):
+    """
+    Confidence intervals of the step and overall conversion rates of a funnel.
+
+    Steps whose denominator is small are bootstrapped over the engine's
+    per-user presence rows; the others (and engines holding counts only) use
+    the Wilson interval.
+
+    Args:
+        funnel_engine (FunnelEngine): Fitted engine
+        confidence (float): Confidence level
+        resamples (int): Bootstrap resamples
+        seed (int): Random seed of the bootstrap
+
+    Returns:
+        pd.DataFrame: event_type and, for step_conversion_rate and
+            overall_conversion_rate, the CI bounds (percent) and the method
+            used per step (<rate>_ci_method: 'bootstrap' or 'wilson')
+    """
+    users = np.asarray(funnel_engine.step_users, dtype=np.int64)
+    previous = np.concatenate([users[:1], users[:-1]])
+    first = np.full(len(users), users[0] if len(users) else 0)
+
+    intervals = {}
+    for rate, denominators in [('step_conversion_rate', previous), ('overall_conversion_rate', first)]:
+        low, high = wilson_interval(users, denominators, confidence)
+        intervals[rate] = [low * 100, high * 100, denominators < ANALYTIC_MIN_TRIALS]
+
+    if funnel_engine.presence is not None and any(small.any() for _, _, small in intervals.values()):
+        counts = bootstrap_counts(funnel_engine.reached_matrix(), resamples, np.random.default_rng(seed))
+        resampled = {
+            'step_conversion_rate': _ratios(counts, np.concatenate([counts[:, :1], counts[:, :-1]], axis=1)),
+            'overall_conversion_rate': _ratios(counts, counts[:, :1])
+        }
+        for rate, (low, high, small) in intervals.items():
+            boot_low, boot_high = _percentile_interval(resampled[rate] * 100, confidence)
+            low[small], high[small] = boot_low[small], boot_high[small]
+    else:
+        for _, _, small in intervals.values():
+            small[:] = False
+
+    result = pd.DataFrame({'event_type': funnel_engine.steps})
+    for rate, (low, high, bootstrapped) in intervals.items():
+        # The first step is the reference of both rates
+        low[:1], high[:1] = 100.0, 100.0
+        result[f'{rate}_ci_low'] = low
+        result[f'{rate}_ci_high'] = high
+        result[f'{rate}_ci_method'] = np.where(bootstrapped, 'bootstrap', 'wilson')
+    return result
+
+
+def group_rate_statistics(counts, rates, group_column, indicators=None, confidence=DEFAULT_CONFIDENCE,
+                          resamples=DEFAULT_RESAMPLES, seed=DEFAULT_SEED):
+    """
+    Confidence intervals and pairwise significance of rates compared across groups.
+
+    Args:
+        counts (pd.DataFrame): One row per group with the count columns, e.g.
+            platform_data (visitors, signups, purchases)
+        rates (dict): Rate column -> (numerator count column, denominator count column)
+        group_column (str): Column of counts naming the groups
+        indicators (pd.DataFrame): Optional per-user rows with group_column and
+            one boolean column per count column; enables the bootstrap for
+            small groups (otherwise every rate is analytic)
+        confidence (float): Confidence level
+        resamples (int): Bootstrap resamples
+        seed (int): Random seed of the bootstrap
+
+    Returns:
+        tuple: (counts with <rate>_ci_low/_ci_high columns in percent,
+            pairwise DataFrame with group_a, group_b, rate, difference,
+            p_value, significant and method)
+    """
+    rng = np.random.default_rng(seed)
+    groups = counts[group_column].tolist()
+    count_columns = sorted({column for pair in rates.values() for column in pair})
+
+    # Bootstrap only the groups with a small denominator for some rate
+    samples = {}
+    if indicators is not None:
+        for position, group in enumerate(groups):
+            trials = [counts[denominator].iloc[position] for _, denominator in rates.values()]
+            if min(trials) >= ANALYTIC_MIN_TRIALS:
+                continue
+            rows = indicators.loc[indicators[group_column] == group, count_columns].to_numpy(bool)
+            resampled = bootstrap_counts(rows, resamples, rng)
+            samples[group] = {
+                rate: _ratios(resampled[:, count_columns.index(numerator)],
+                              resampled[:, count_columns.index(denominator)]) * 100
+                for rate, (numerator, denominator) in rates.items()
+            }
+
+    result = counts.copy()
+    for rate, (numerator, denominator) in rates.items():
+        low, high = wilson_interval(counts[numerator], counts[denominator], confidence)
+        low, high = low * 100, high * 100
+        for position, group in enumerate(groups):
+            if group in samples:
+                low[position], high[position] = _percentile_interval(samples[group][rate], confidence)
+        result[f'{rate}_ci_low'] = low
+        result[f'{rate}_ci_high'] = high
+
+    pairs = []
+    for rate, (numerator, denominator) in rates.items():
+        values = _ratios(counts[numerator], counts[denominator]) * 100
+        for (a, group_a), (b, group_b) in combinations(enumerate(groups), 2):
+            if group_a in samples and group_b in samples:
+                difference = samples[group_a][rate] - samples[group_b][rate]
+                tail = min(np.nanmean(difference <= 0), np.nanmean(difference >= 0))
+                p_value, method = min(1.0, 2 * tail), 'bootstrap'
+            else:
+                p_value = two_proportion_p_values(
+                    counts[numerator].iloc[a], counts[denominator].iloc[a],
+                    counts[numerator].iloc[b], counts[denominator].iloc[b]
+                ).item()
+                method = 'z_test'
+            pairs.append({
+                'group_a': group_a, 'group_b': group_b, 'rate': rate,
+                'difference': values[a] - values[b], 'p_value': p_value,
+                'significant': bool(p_value < 1 - confidence), 'method': method
+            })
+
+    pairwise = pd.DataFrame(
+        pairs, columns=['group_a', 'group_b', 'rate', 'difference', 'p_value', 'significant', 'method']
+    )
+    return result, pairwise
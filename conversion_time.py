@@ -0,0 +1,452 @@
+"""
+Conversion Time Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Time-between-steps distributions with mergeable streaming quantile sketches
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from event_store import BLOCK_USERS, SEGMENT_COLUMNS, sorted_user_runs
+from event_stream import group_starts, read_event_chunks
+from funnel_engine import FUNNEL_STEPS, NOT_REACHED
+from timestamp_parser import timestamp_nanos
+
+# Relative accuracy of every reported quantile (1% of the true value)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Durations below MIN_SECONDS share one bucket reported as 0; longer ones than
+# MAX_SECONDS (ten years) are clamped into the last bucket
+MIN_SECONDS = 1e-3
+MAX_SECONDS = 10 * 365 * 86_400.0
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+# Histogram bins reported for every step pair and segment
+HISTOGRAM_EDGES_HOURS = [0, 1 / 60, 0.25, 1, 6, 24, 72, 168, 720, np.inf]
+
+NANOS_PER_SECOND = 1e9
+
+
+class QuantileSketch:
+    """
+    Batch of mergeable log-bucket quantile sketches for durations.
+
+    I went with the DDSketch layout instead of a t-digest or KLL sketch: a
+    duration lands in bucket ceil(log_gamma(value / MIN_SECONDS)), so every
+    quantile read from the buckets is within relative_accuracy of the true
+    value, adding a whole array of values is a single np.bincount, and since
+    all sketches share one fixed bucket layout, merging two of them is adding
+    their counts - the result does not depend on how the data was split.
+
+    One instance holds n_sketches independent sketches as rows of a count
+    matrix, so thousands of (step pair, segment) distributions cost one pass.
+    """
+
+    def __init__(self, n_sketches=1, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """
+        Initialize empty sketches.
+
+        Args:
+            n_sketches (int): Number of independent sketches
+            relative_accuracy (float): Maximum relative error of the quantiles
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.n_buckets = int(math.ceil(math.log(MAX_SECONDS / MIN_SECONDS, self.gamma))) + 1
+        self.counts = np.zeros((n_sketches, self.n_buckets), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def bucket_index(self, seconds):
+        """
+        Map durations to their bucket (0 for durations below MIN_SECONDS).
+
+        Args:
+            seconds (np.ndarray): Non-negative durations in seconds
+
+        Returns:
+            np.ndarray: int64 bucket indices
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        with np.errstate(divide='ignore'):
+            index = np.ceil(np.log(seconds / MIN_SECONDS) / math.log(self.gamma))
+        index = np.where(seconds < MIN_SECONDS, 0, index)
+        return np.clip(index, 0, self.n_buckets - 1).astype(np.int64)
+
+    def bucket_values(self):
+        """
+        Representative duration of every bucket (seconds).
+
+        The value 2 * upper / (gamma + 1) is within relative_accuracy of every
+        duration in the bucket.
+
+        Returns:
+            np.ndarray: float64 values, 0 for the first bucket
+        """
+        upper = MIN_SECONDS * self.gamma ** np.arange(self.n_buckets)
+        values = 2 * upper / (self.gamma + 1)
+        values[0] = 0.0
+        return values
+
+    def add(self, seconds, sketch_ids=None):
+        """
+        Add durations to the sketches.
+
+        Args:
+            seconds (np.ndarray): Durations in seconds
+            sketch_ids (np.ndarray): Sketch of every duration (all to sketch 0 if None)
+        """
+        buckets = self.bucket_index(seconds)
+        if sketch_ids is None:
+            sketch_ids = np.zeros(len(buckets), dtype=np.int64)
+
+        flat = np.asarray(sketch_ids, dtype=np.int64) * self.n_buckets + buckets
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def merge(self, other):
+        """
+        Add another batch of sketches (same shape and accuracy) into this one.
+
+        Args:
+            other (QuantileSketch): Sketches of another chunk or shard
+
+        Returns:
+            QuantileSketch: This batch
+        """
+        if other.relative_accuracy != self.relative_accuracy or other.counts.shape != self.counts.shape:
+            raise ValueError("Only sketches with the same layout can be merged")
+        self.counts += other.counts
+        return self
+
+    def count(self):
+        """Number of durations in every sketch."""
+        return self.counts.sum(axis=1)
+
+    def quantiles(self, quantiles=QUANTILES):
+        """
+        Estimate quantiles of every sketch.
+
+        Args:
+            quantiles (list): Quantiles in [0, 1]
+
+        Returns:
+            np.ndarray: float64 seconds of shape (n_sketches, len(quantiles)),
+                NaN for empty sketches
+        """
+        quantiles = np.asarray(quantiles, dtype=np.float64)
+        cumulative = np.cumsum(self.counts, axis=1)
+        total = cumulative[:, -1]
+
+        # Bucket holding the value of rank q * (n - 1) (lower quantile)
+        rank = np.floor(quantiles[None, :] * np.maximum(total[:, None] - 1, 0))
+        bucket = (cumulative[:, None, :] <= rank[:, :, None]).sum(axis=2)
+        bucket = np.minimum(bucket, self.n_buckets - 1)
+
+        values = self.bucket_values()[bucket]
+        values[total == 0] = np.nan
+        return values
+
+    def histogram(self, edges_seconds):
+        """
+        Count the durations of every sketch in coarser bins.
+
+        Buckets are assigned by their representative value, so bin edges are
+        respected up to relative_accuracy.
+
+        Args:
+            edges_seconds (list): Increasing bin edges in seconds
+
+        Returns:
+            np.ndarray: int64 counts of shape (n_sketches, len(edges_seconds) - 1)
+        """
+        edges = np.asarray(edges_seconds, dtype=np.float64)
+        bins = np.searchsorted(edges, self.bucket_values(), side='right') - 1
+        inside = (bins >= 0) & (bins < len(edges) - 1)
+
+        histogram = np.zeros((len(self.counts), len(edges) - 1), dtype=np.int64)
+        np.add.at(histogram.T, bins[inside], self.counts[:, inside].T)
+        return histogram
+
+
+class ConversionTimes:
+    """
+    Time-between-steps distributions of a set of users.
+
+    Holds one QuantileSketch per (from step, to step, segment value) group.
+    Results of user-disjoint partitions (e.g. user_id shards) are combined
+    with merge(), which aligns the groups and adds the sketches.
+    """
+
+    def __init__(self, groups, sketch):
+        """
+        Initialize the distributions.
+
+        Args:
+            groups (pd.DataFrame): from_step, to_step, dimension and value of every sketch
+            sketch (QuantileSketch): One sketch per groups row
+        """
+        self.groups = groups.reset_index(drop=True)
+        self.sketch = sketch
+
+    def merge(self, other):
+        """
+        Combine with the distributions of other users.
+
+        Args:
+            other (ConversionTimes): Distributions of a user-disjoint partition
+
+        Returns:
+            ConversionTimes: Combined distributions
+        """
+        keys = ['from_step', 'to_step', 'dimension', 'value']
+        mine = pd.MultiIndex.from_frame(self.groups[keys])
+        theirs = pd.MultiIndex.from_frame(other.groups[keys])
+        union = mine.append(theirs).unique()
+
+        merged = QuantileSketch(len(union), self.sketch.relative_accuracy)
+        if other.sketch.relative_accuracy != merged.relative_accuracy:
+            raise ValueError("Only sketches with the same accuracy can be merged")
+        np.add.at(merged.counts, union.get_indexer(mine), self.sketch.counts)
+        np.add.at(merged.counts, union.get_indexer(theirs), other.sketch.counts)
+
+        return ConversionTimes(union.to_frame(index=False), merged)
+
+    def summary(self, quantiles=QUANTILES):
+        """
+        Report users and elapsed-time quantiles for every group.
+
+        Args:
+            quantiles (list): Quantiles to report
+
+        Returns:
+            pd.DataFrame: groups columns, users and one p<q>_hours column per quantile
+        """
+        summary = self.groups.copy()
+        summary['users'] = self.sketch.count()
+        hours = self.sketch.quantiles(quantiles) / 3600
+        for position, quantile in enumerate(quantiles):
+            summary[f"p{round(quantile * 100):g}_hours"] = hours[:, position]
+        return summary[summary['users'] > 0].reset_index(drop=True)
+
+    def histogram(self, edges_hours=HISTOGRAM_EDGES_HOURS):
+        """
+        Report elapsed-time histograms for every group.
+
+        Args:
+            edges_hours (list): Increasing bin edges in hours
+
+        Returns:
+            pd.DataFrame: One row per group and bin with the bin edges and users
+        """
+        edges = np.asarray(edges_hours, dtype=np.float64)
+        counts = self.sketch.histogram(edges * 3600)
+
+        histogram = self.groups.loc[self.groups.index.repeat(len(edges) - 1)].reset_index(drop=True)
+        histogram['bin_start_hours'] = np.tile(edges[:-1], len(self.groups))
+        histogram['bin_end_hours'] = np.tile(edges[1:], len(self.groups))
+        histogram['users'] = counts.ravel()
+        return histogram
+
+
+class ConversionTimeEngine:
+    """
+    Per-user elapsed time between every pair of funnel steps.
+
+    I measure the time from a user's first event of one step to their first
+    event of a later step, for users who reached both in that order. Events
+    are folded chunk by chunk into per-user first-reach times (users may span
+    chunks), entirely with array operations on the user-sorted events; the
+    distributions are then expanded user block by user block into
+    QuantileSketch batches broken down by SEGMENT_COLUMNS.
+    """
+
+    def __init__(self, steps=None, segments=None, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """
+        Initialize an empty engine.
+
+        Args:
+            steps (list): Ordered funnel event types (defaults to FUNNEL_STEPS)
+            segments (list): First-touch user attributes to break down by
+                (defaults to SEGMENT_COLUMNS)
+            relative_accuracy (float): Maximum relative error of the quantiles
+        """
+        self.steps = list(steps) if steps is not None else list(FUNNEL_STEPS)
+        self.segments = list(segments) if segments is not None else list(SEGMENT_COLUMNS)
+        self.relative_accuracy = relative_accuracy
+
+        pairs = [(i, j) for i in range(len(self.steps)) for j in range(i + 1, len(self.steps))]
+        self.pair_from = np.array([i for i, _ in pairs], dtype=np.int64)
+        self.pair_to = np.array([j for _, j in pairs], dtype=np.int64)
+
+        self._dictionaries = {column: {} for column in self.segments}
+        self._state = None
+
+    def consume(self, events_path, chunksize=1_000_000):
+        """
+        Stream an events CSV file through the engine.
+
+        Args:
+            events_path (str): Path to user events CSV file
+            chunksize (int): Rows per chunk
+
+        Returns:
+            ConversionTimeEngine: The updated engine
+        """
+        for chunk in read_event_chunks(events_path, chunksize):
+            self.add(chunk)
+        return self
+
+    def _encode(self, column, values):
+        """Map a chunk's values onto the engine-wide dictionary codes."""
+        categorical = pd.Categorical(values)
+        lookup = self._dictionaries[column]
+        for value in categorical.categories:
+            if value not in lookup:
+                lookup[value] = len(lookup)
+
+        if len(categorical.categories) == 0:
+            return np.full(len(categorical), -1, dtype=np.int32)
+
+        mapping = np.array([lookup[value] for value in categorical.categories], dtype=np.int32)
+        codes = categorical.codes
+        return np.where(codes >= 0, mapping[codes], -1).astype(np.int32)
+
+    def add(self, events, user_index=None):
+        """
+        Fold a chunk of events into the per-user first-reach times.
+
+        Args:
+            events (pd.DataFrame or EventStore): Events with user_id,
+                event_timestamp, event_type and the segment columns
+            user_index (UserIndex): Offset index when events are cleaned and
+                sorted by user and time (skips the sort)
+
+        Returns:
+            ConversionTimeEngine: The updated engine
+        """
+        users = events['user_id'].to_numpy(np.int64)
+        timestamps = timestamp_nanos(events['event_timestamp'])
+        step_codes = pd.Categorical(events['event_type'], categories=self.steps).codes
+        segments = {column: self._encode(column, events[column]) for column in self.segments}
+
+        order, starts = sorted_user_runs(users, timestamps, user_index)
+        users, timestamps, step_codes = users[order], timestamps[order], step_codes[order]
+        segments = {column: codes[order] for column, codes in segments.items()}
+        user_codes = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(users))))
+
+        if len(users) == 0:
+            return self
+
+        reach = np.full((len(starts), len(self.steps)), NOT_REACHED, dtype=np.int64)
+        on_step = step_codes >= 0
+        np.minimum.at(reach, (user_codes[on_step], step_codes[on_step]), timestamps[on_step])
+
+        partial = {'user_id': users[starts], 'first_event': timestamps[starts], 'reach': reach}
+        for column, codes in segments.items():
+            partial[column] = codes[starts]
+
+        self._merge_state(partial)
+        return self
+
+    def _merge_state(self, partial):
+        """Combine a chunk's per-user rows with the running state."""
+        if self._state is None:
+            self._state = partial
+            return
+
+        combined = {key: np.concatenate([self._state[key], partial[key]]) for key in partial}
+        order = np.lexsort((combined['first_event'], combined['user_id']))
+        combined = {key: values[order] for key, values in combined.items()}
+        starts = group_starts(combined['user_id'])
+
+        # Rows are ordered by first_event within each user, so the group start
+        # carries the first-touch segment values
+        state = {key: combined[key][starts] for key in ['user_id', 'first_event'] + self.segments}
+        state['reach'] = np.minimum.reduceat(combined['reach'], starts, axis=0)
+        self._state = state
+
+    def merge(self, other):
+        """
+        Fold another engine's per-user state into this one (any partition).
+
+        Args:
+            other (ConversionTimeEngine): Engine over other chunks or shards
+
+        Returns:
+            ConversionTimeEngine: This engine
+        """
+        if other._state is None:
+            return self
+
+        partial = {key: other._state[key] for key in ['user_id', 'first_event', 'reach']}
+        for column in self.segments:
+            values = pd.Categorical.from_codes(
+                other._state[column], categories=list(other._dictionaries[column])
+            )
+            partial[column] = self._encode(column, values)
+
+        self._merge_state(partial)
+        return self
+
+    def _groups(self):
+        """Group table and sketch offset of every breakdown dimension."""
+        dimensions = [('all', ['all'])] + [
+            (column, list(self._dictionaries[column])) for column in self.segments
+        ]
+
+        frames, offsets, offset = [], {}, 0
+        for dimension, values in dimensions:
+            offsets[dimension] = offset
+            frames.append(pd.DataFrame({
+                'from_step': np.array(self.steps)[np.repeat(self.pair_from, len(values))],
+                'to_step': np.array(self.steps)[np.repeat(self.pair_to, len(values))],
+                'dimension': dimension,
+                'value': np.tile(np.array(values, dtype=object), len(self.pair_from))
+            }))
+            offset += len(self.pair_from) * len(values)
+
+        return pd.concat(frames, ignore_index=True), offsets
+
+    def conversion_times(self, block_users=BLOCK_USERS):
+        """
+        Build the elapsed-time distributions of the users seen so far.
+
+        Args:
+            block_users (int): Users expanded into step pairs at a time
+
+        Returns:
+            ConversionTimes: Sketches per step pair and segment value
+        """
+        groups, offsets = self._groups()
+        sketch = QuantileSketch(len(groups), self.relative_accuracy)
+        if self._state is None:
+            return ConversionTimes(groups, sketch)
+
+        reach = self._state['reach']
+        for start in range(0, len(reach), block_users):
+            block = reach[start:start + block_users]
+            begin, end = block[:, self.pair_from], block[:, self.pair_to]
+            converted = (begin != NOT_REACHED) & (end != NOT_REACHED) & (end >= begin)
+
+            users, pairs = np.nonzero(converted)
+            seconds = (end[users, pairs] - begin[users, pairs]) / NANOS_PER_SECOND
+
+            sketch_ids = [offsets['all'] + pairs]
+            values = [seconds]
+            for column in self.segments:
+                codes = self._state[column][start + users]
+                known = codes >= 0
+                n_values = len(self._dictionaries[column])
+                sketch_ids.append(offsets[column] + pairs[known] * n_values + codes[known])
+                values.append(seconds[known])
+
+            sketch.add(np.concatenate(values), np.concatenate(sketch_ids))
+
+        return ConversionTimes(groups, sketch)
@@ -4,12 +4,163 @@ Author: Data Analyst Portfolio Project 2024-2025
 Purpose: Clean, validate and prepare data for funnel analysis
 """
 
+import argparse
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import warnings
+from campaign_attribution import CampaignIndex, user_entries
+from conversion_time import DEFAULT_RELATIVE_ACCURACY, ConversionTimeEngine
+from distinct_sketch import DEFAULT_RELATIVE_ERROR, SketchCube
+from event_cache import ColumnarCache, source_key
+from event_store import EventStore, UserIndex
+from event_stream import EventStreamAggregator
+from funnel_engine import CONVERSION_FLAGS, FUNNEL_ORDER, FUNNEL_STEPS, FunnelEngine
+from incremental import IncrementalJourneyStore
+from instrumentation import instrumented
+from path_mining import DEFAULT_CAPACITY, PathMiner
+from segment_index import SegmentIndex
+from sessionization import DEFAULT_SESSION_TIMEOUT, Sessionizer
+from timestamp_parser import parse_timestamp_column
 warnings.filterwarnings('ignore')
 
+# Frames stored in the columnar cache between runs
+CACHED_FRAMES = [
+    'user_events', 'user_demographics', 'campaign_data',
+    'user_journey_summary', 'enriched_data'
+]
+
+DATA_SOURCES = [
+    '../data/user_events.csv',
+    '../data/user_demographics.csv',
+    '../data/campaign_data.csv'
+]
+
+# Directory (under the export directory) of the memory-mapped cleaned events
+BINARY_EVENTS_DIR = 'cleaned_user_events'
+
+def _distinct_per_user(user_index, user_codes, values):
+    """Number of distinct non-missing values of every user."""
+    codes = pd.factorize(values)[0]
+    first = ~pd.DataFrame({'user': user_codes, 'value': codes}).duplicated().to_numpy()
+    return user_index.reduce(np.add, (first & (codes >= 0)).astype(np.int64))
+
+
+def _first_valid_per_user(user_index, column):
+    """First non-missing value of every user (missing if the user has none)."""
+    valid_rows = np.flatnonzero(column.notna().to_numpy())
+    if len(valid_rows) == 0:
+        rows = np.full(len(user_index), -1)
+    else:
+        rows = valid_rows[np.minimum(np.searchsorted(valid_rows, user_index.starts), len(valid_rows) - 1)]
+        rows = np.where((rows >= user_index.starts) & (rows < user_index.offsets[1:]), rows, -1)
+    return column.array.take(rows, allow_fill=True)
+
+
+def _indexed_journey_summary(user_events, user_index, conversion_flags, sessions):
+    """
+    Journey summary of user-sorted events as contiguous per-user reductions.
+
+    Rows of a user are one slice of the index, so first/last event are the
+    slice ends and the other statistics are ufunc.reduceat calls.
+    """
+    timestamps = user_events['event_timestamp']
+    event_types = user_events['event_type']
+    user_codes = user_index.user_codes()
+    starts, stops = user_index.starts, user_index.offsets[1:]
+
+    funnel_steps = user_events['funnel_step'].to_numpy()
+    step_reduce = np.fmax if funnel_steps.dtype.kind == 'f' else np.maximum
+
+    return pd.DataFrame({
+        'user_id': user_index.user_ids,
+        'first_event': timestamps.iloc[starts].to_numpy(),
+        'last_event': timestamps.iloc[stops - 1].to_numpy(),
+        'total_events': user_index.reduce(np.add, timestamps.notna().to_numpy().astype(np.int64)),
+        'unique_event_types': _distinct_per_user(user_index, user_codes, event_types),
+        'max_funnel_step': user_index.reduce(step_reduce, funnel_steps),
+        'total_sessions': _distinct_per_user(user_index, user_codes, sessions),
+        **{
+            column: _first_valid_per_user(user_index, user_events[column])
+            for column in ['platform', 'country', 'traffic_source']
+        },
+        **{
+            flag: user_index.reduce(np.logical_or, (event_types == event_type).to_numpy())
+            for flag, event_type in conversion_flags.items()
+        }
+    })
+
+
+def build_user_journey_summary(user_events, conversion_flags=None, user_index=None, session_ids=None):
+    """
+    Aggregate cleaned events into one row per user.
+
+    Every statistic is a native groupby reduction (min/max/count/nunique/first)
+    in a single aggregation call. Conversion flags are per-event boolean columns
+    reduced with max, so no per-user Python lists are built. With a UserIndex
+    of the (user and time sorted) events the groupby is replaced by per-user
+    slice reductions.
+
+    Args:
+        user_events (pd.DataFrame or EventStore): Cleaned events with a funnel_step column
+        conversion_flags (dict): Flag column -> event type that sets it
+        user_index (UserIndex): Offset index of user_events, if sorted by user and time
+        session_ids (np.ndarray): Integer session id per event (e.g. from
+            Sessionizer) counted for total_sessions instead of session_id
+
+    Returns:
+        pd.DataFrame: User journey summary sorted by user_id
+    """
+    if conversion_flags is None:
+        conversion_flags = CONVERSION_FLAGS
+
+    sessions = user_events['session_id'] if session_ids is None else pd.Series(session_ids)
+
+    if user_index is not None:
+        return _finish_journey_summary(
+            _indexed_journey_summary(user_events, user_index, conversion_flags, sessions), conversion_flags
+        )
+
+    flag_columns = {
+        flag: user_events['event_type'] == event_type
+        for flag, event_type in conversion_flags.items()
+    }
+    events = user_events.assign(**flag_columns)
+    if session_ids is not None:
+        events['session_id'] = np.where(session_ids >= 0, session_ids, np.nan)
+
+    user_summary = events.groupby('user_id').agg(
+        first_event=('event_timestamp', 'min'),
+        last_event=('event_timestamp', 'max'),
+        total_events=('event_timestamp', 'count'),
+        unique_event_types=('event_type', 'nunique'),
+        max_funnel_step=('funnel_step', 'max'),
+        total_sessions=('session_id', 'nunique'),
+        platform=('platform', 'first'),
+        country=('country', 'first'),
+        traffic_source=('traffic_source', 'first'),
+        **{flag: (flag, 'max') for flag in conversion_flags}
+    ).reset_index()
+
+    return _finish_journey_summary(user_summary, conversion_flags)
+
+
+def _finish_journey_summary(user_summary, conversion_flags):
+    """Add session duration and turn the conversion flags into 0/1 integers."""
+    # Calculate time metrics
+    session_duration = (
+        (user_summary['last_event'] - user_summary['first_event']).dt.total_seconds() / 3600
+    )
+    user_summary.insert(
+        len(user_summary.columns) - len(conversion_flags), 'session_duration_hours', session_duration
+    )
+
+    # Add conversion flags as 0/1 integers
+    for flag in conversion_flags:
+        user_summary[flag] = user_summary[flag].astype(np.int64)
+
+    return user_summary
+
 class DataPreprocessor:
     """
     Data preprocessing class for funnel analysis data.
@@ -18,13 +169,52 @@ class DataPreprocessor:
     that are essential for accurate funnel analysis.
     """
 
-    def __init__(self):
-        """Initialize the preprocessor with default settings."""
+    def __init__(self, cache_dir=None, instrumentation=None):
+        """
+        Initialize the preprocessor with default settings.
+
+        Args:
+            cache_dir (str): Optional directory for the columnar cache of
+                cleaned data; warm runs load from it instead of the CSV files
+            instrumentation (Instrumentation): Optional per-stage timing/memory
+                recorder; its verbose flag also controls the progress messages
+        """
         self.user_events = None
         self.user_demographics = None
         self.campaign_data = None
-
-    def load_data(self, events_path, demographics_path, campaigns_path):
+        self.user_journey_summary = None
+        self.enriched_data = None
+        self.event_store = None
+        self.user_index = None
+        self.conversion_times = None
+        self.campaign_attribution = None
+        self.campaign_performance = None
+        self.funnel_engine = None
+        self.segment_index = None
+        self.sessionizer = None
+        self.sessions = None
+        self.session_funnel_metrics = None
+        self.path_miner = None
+        self.top_paths = None
+
+        self.cache = ColumnarCache(cache_dir) if cache_dir else None
+        self.source_paths = None
+        self.loaded_from_cache = False
+        self.summary_from_cache = False
+        self.summary_settings = None
+        self.cached_summary_settings = None
+        self.instrumentation = instrumentation
+
+    def _log(self, message):
+        """Print a progress message (through the instrumentation if attached)."""
+        if self.instrumentation is None:
+            print(message)
+        else:
+            self.instrumentation.log(message)
+
+    @instrumented('load_data', outputs=['user_events', 'user_demographics', 'campaign_data'])
+    def load_data(self, events_path, demographics_path, campaigns_path, chunksize=None,
+                  event_store=False):
         """
         Load all datasets and perform initial validation.
 
@@ -32,37 +222,203 @@ class DataPreprocessor:
             events_path (str): Path to user events CSV file
             demographics_path (str): Path to user demographics CSV file  
             campaigns_path (str): Path to campaign data CSV file
+            chunksize (int): Stream the events file in chunks of this many rows
+                instead of loading it (see stream_user_events)
+            event_store (bool): Hold the events in a compact EventStore and keep
+                derived time features lazy instead of adding them as columns
 
         Returns:
             dict: Summary of loaded data
         """
-        print("🔄 Loading datasets...")
+        self._log("🔄 Loading datasets...")
+
+        self.source_paths = [events_path, demographics_path, campaigns_path]
+        self.user_index = None
+        self.loaded_from_cache = self.cache is not None and self._load_from_cache()
+        self.summary_from_cache = self.loaded_from_cache
+
+        if chunksize and not self.loaded_from_cache:
+            return self._load_streaming(events_path, demographics_path, campaigns_path, chunksize)
+
+        if not self.loaded_from_cache:
+            self._load_raw_data(events_path, demographics_path, campaigns_path, event_store)
 
+        summary = {
+            'user_events_rows': len(self.user_events),
+            'unique_users': self.user_events['user_id'].nunique(),
+            'date_range': f"{self.user_events['event_timestamp'].min()} to {self.user_events['event_timestamp'].max()}",
+            'demographics_rows': len(self.user_demographics),
+            'campaigns': len(self.campaign_data)
+        }
+
+        self._log(f"✅ Data loaded successfully!")
+        self._log(f"📊 Summary: {summary}")
+        return summary
+
+    def _load_raw_data(self, events_path, demographics_path, campaigns_path, event_store=False):
+        """Parse the raw CSV files."""
         # Load user events data
-        self.user_events = pd.read_csv(events_path)
-        self.user_events['event_timestamp'] = pd.to_datetime(self.user_events['event_timestamp'])
+        if event_store:
+            self.use_event_store(EventStore.from_csv(events_path))
+        else:
+            self.user_events = pd.read_csv(events_path)
+            self.user_events['event_timestamp'] = parse_timestamp_column(self.user_events['event_timestamp'])
+
+        # Load user demographics and campaign data
+        self._load_support_tables(demographics_path, campaigns_path)
+
+    def use_event_store(self, store):
+        """
+        Work on events held in an EventStore.
+
+        The user_events frame becomes a compact view of the store (categorical
+        columns and integer session keys) and clean_user_events leaves the time
+        features to the store, which derives them lazily.
+
+        Args:
+            store (EventStore): Encoded user events
+        """
+        self.event_store = store
+        self.user_events = store.to_frame()
+
+    def _load_from_cache(self):
+        """Restore cleaned frames from the columnar cache if it is still valid."""
+        frames = self.cache.load(self.source_paths, CACHED_FRAMES)
+        if frames is None:
+            return False
 
+        for name, frame in frames.items():
+            setattr(self, name, frame)
+        self.user_index = UserIndex.from_sorted(self.user_events['user_id'])
+        self.cached_summary_settings = (self.cache.load_metadata(self.source_paths) or {}).get('summary_settings')
+
+        self._log("⚡ Loaded cleaned data from cache (CSV parsing skipped)")
+        return True
+
+    def cache_cleaned_data(self):
+        """
+        Write the cleaned frames to the columnar cache.
+
+        Returns:
+            str: Cache entry directory, or None if caching is disabled
+        """
+        if self.cache is None or self.user_events is None or self.enriched_data is None:
+            return None
+
+        frames = {name: getattr(self, name) for name in CACHED_FRAMES}
+        frames['user_events'] = self._cleaned_events_frame()
+        entry_dir = self.cache.save(
+            self.source_paths, frames,
+            metadata={'summary_settings': self.summary_settings}
+        )
+        self._log(f"⚡ Cached cleaned data in {entry_dir}")
+        return entry_dir
+
+    def _cleaned_events_frame(self):
+        """Cleaned events in the pandas pipeline's schema, however they are held."""
+        if self.event_store is not None:
+            return self.event_store.to_cleaned_frame()
+        return self.user_events
+
+    def _load_support_tables(self, demographics_path, campaigns_path):
+        """Load the demographics and campaign tables."""
         # Load user demographics
         self.user_demographics = pd.read_csv(demographics_path)
-        self.user_demographics['registration_date'] = pd.to_datetime(self.user_demographics['registration_date'])
+        self.user_demographics['registration_date'] = parse_timestamp_column(self.user_demographics['registration_date'])
 
         # Load campaign data
         self.campaign_data = pd.read_csv(campaigns_path)
-        self.campaign_data['start_date'] = pd.to_datetime(self.campaign_data['start_date'])
-        self.campaign_data['end_date'] = pd.to_datetime(self.campaign_data['end_date'])
+        self.campaign_data['start_date'] = parse_timestamp_column(self.campaign_data['start_date'])
+        self.campaign_data['end_date'] = parse_timestamp_column(self.campaign_data['end_date'])
+
+    def _load_streaming(self, events_path, demographics_path, campaigns_path, chunksize):
+        """Load the support tables and stream the events file."""
+        self.stream_user_events(events_path, chunksize)
+        self._load_support_tables(demographics_path, campaigns_path)
 
+        first_event, last_event = self.event_aggregator.date_range()
         summary = {
-            'user_events_rows': len(self.user_events),
-            'unique_users': self.user_events['user_id'].nunique(),
-            'date_range': f"{self.user_events['event_timestamp'].min()} to {self.user_events['event_timestamp'].max()}",
+            'user_events_rows': self.event_aggregator.rows_read,
+            'unique_users': len(self.user_journey_summary),
+            'date_range': f"{first_event} to {last_event}",
             'demographics_rows': len(self.user_demographics),
             'campaigns': len(self.campaign_data)
         }
 
-        print(f"✅ Data loaded successfully!")
-        print(f"📊 Summary: {summary}")
+        self._log(f"✅ Data loaded successfully!")
+        self._log(f"📊 Summary: {summary}")
         return summary
 
+    @instrumented('stream_user_events', outputs=['user_journey_summary'])
+    def stream_user_events(self, events_path, chunksize=1_000_000):
+        """
+        Build the journey summary and funnel metrics without loading all events.
+
+        I added this for exports that do not fit in memory: the events file is
+        read in chunks with compact dtypes and each chunk is folded into per-user
+        aggregates. The cleaned event-level frame is not materialized, so
+        clean_user_events and create_user_journey_summary are not needed afterwards.
+
+        Args:
+            events_path (str): Path to user events CSV file
+            chunksize (int): Rows per chunk
+
+        Returns:
+            pd.DataFrame: User journey summary
+        """
+        self._log(f"🌊 Streaming user events in chunks of {chunksize:,} rows...")
+
+        self.event_aggregator = EventStreamAggregator().consume(events_path, chunksize)
+        self.user_journey_summary = self.event_aggregator.journey_summary()
+
+        self.funnel_engine = self.event_aggregator.funnel_engine()
+        self.funnel_metrics = self.funnel_engine.step_summary()
+
+        aggregator = self.event_aggregator
+        self._log(f"✅ Streamed events: {aggregator.rows_read} → {aggregator.rows_kept} rows "
+                  f"for {len(self.user_journey_summary)} users")
+
+        return self.user_journey_summary
+
+    @instrumented('update_incremental', outputs=['user_journey_summary'])
+    def update_incremental(self, events_path, state_dir, chunksize=1_000_000, lateness=None):
+        """
+        Merge a new day of events into the persisted journey state.
+
+        I use this in the nightly job instead of main(): only the new file is
+        read, and the journey summary, funnel metrics and weekly cohort
+        retention are rebuilt from the stored per-user state.
+
+        Args:
+            events_path (str): Path to the new day's events CSV file
+            state_dir (str): Directory holding the persisted journey state
+            chunksize (int): Rows per chunk when reading the new file
+            lateness (str or timedelta): Optional cutoff: events further behind
+                the newest stored event are dropped instead of merged
+
+        Returns:
+            dict: Batch statistics (new events, duplicates skipped, late and expired events)
+        """
+        self._log(f"📅 Appending {events_path} to journey state in {state_dir}...")
+
+        self.journey_state = IncrementalJourneyStore(state_dir, lateness=lateness)
+        batch_stats = self.journey_state.append_csv(events_path, chunksize)
+
+        self.user_journey_summary = self.journey_state.journey_summary()
+        self.funnel_engine = self.journey_state.funnel_engine()
+        self.funnel_metrics = self.funnel_engine.step_summary()
+        self.cohort_retention = self.journey_state.cohort_retention()
+
+        if batch_stats['expired_events']:
+            self._log(f"⚠️ Dropped {batch_stats['expired_events']} events older than the "
+                      f"{self.journey_state.lateness} lateness cutoff")
+        self._log(f"✅ Appended {batch_stats['new_events']} new events "
+                  f"({batch_stats['duplicates_skipped']} duplicates, {batch_stats['late_events']} late); "
+                  f"state covers {len(self.user_journey_summary)} users")
+
+        return batch_stats
+
+    @instrumented('clean_user_events', inputs=['user_events'], outputs=['user_events'])
     def clean_user_events(self):
         """
         Clean and validate user events data.
@@ -73,10 +429,23 @@ class DataPreprocessor:
         - Handle missing values
         - Add derived features
         """
-        print("🧹 Cleaning user events data...")
+        if self.loaded_from_cache:
+            self._log("⚡ Using cleaned user events from cache")
+            return
+
+        self._log("🧹 Cleaning user events data...")
 
         initial_rows = len(self.user_events)
 
+        if self.event_store is not None:
+            self.event_store = self.event_store.cleaned()
+            self.user_events = self.event_store.to_frame(self.event_store.columns + ['funnel_step'])
+            self.user_index = self.event_store.user_index()
+
+            cleaned_rows = len(self.user_events)
+            self._log(f"✅ Cleaned events: {initial_rows} → {cleaned_rows} rows ({initial_rows-cleaned_rows} removed)")
+            return
+
         # Remove duplicate events (same user, event, timestamp)
         self.user_events = self.user_events.drop_duplicates(
             subset=['user_id', 'event_type', 'event_timestamp']
@@ -93,29 +462,66 @@ class DataPreprocessor:
         self.user_events['month'] = self.user_events['event_timestamp'].dt.month
 
         # Add funnel step ordering
-        funnel_order = {
-            'landing_page_view': 1,
-            'signup_page_view': 2,
-            'email_verification': 3,
-            'profile_setup': 4,
-            'first_product_view': 5,
-            'add_to_cart': 6,
-            'checkout_start': 7,
-            'payment_info_entered': 8,
-            'purchase_completed': 9,
-            'app_download': 10,
-            'first_login_app': 11
-        }
-
-        self.user_events['funnel_step'] = self.user_events['event_type'].map(funnel_order)
+        self.user_events['funnel_step'] = self.user_events['event_type'].map(FUNNEL_ORDER)
 
         # Sort by user and timestamp for proper sequence analysis
         self.user_events = self.user_events.sort_values(['user_id', 'event_timestamp']).reset_index(drop=True)
+        self.user_index = UserIndex.from_sorted(self.user_events['user_id'])
 
         cleaned_rows = len(self.user_events)
-        print(f"✅ Cleaned events: {initial_rows} → {cleaned_rows} rows ({initial_rows-cleaned_rows} removed)")
+        self._log(f"✅ Cleaned events: {initial_rows} → {cleaned_rows} rows ({initial_rows-cleaned_rows} removed)")
+
+    def user_journey(self, user_id):
+        """
+        Return one user's cleaned events in time order.
+
+        The row range comes from the user offset index, so the lookup does not
+        scan or regroup the events.
+
+        Args:
+            user_id (int): User id
+
+        Returns:
+            pd.DataFrame: The user's events
+        """
+        if self.user_index is None:
+            raise ValueError("No user index; run clean_user_events first")
+        return self.user_events.iloc[self.user_index.rows(user_id)]
+
+    @instrumented('sessionize_events', inputs=['user_events'], outputs=['sessions'])
+    def sessionize_events(self, timeout=DEFAULT_SESSION_TIMEOUT):
+        """
+        Reconstruct sessions from inactivity gaps.
+
+        I split every user's cleaned events into sessions wherever they were
+        inactive for longer than the timeout, instead of trusting the upstream
+        session_id strings. create_user_journey_summary then counts these
+        sessions, and session-level funnel metrics are kept next to the
+        user-level ones.
+
+        Args:
+            timeout (str or timedelta): Inactivity gap that ends a session, e.g. '30min'
+
+        Returns:
+            pd.DataFrame: One row per session with duration, event count and
+                furthest funnel step
+        """
+        if self.user_events is None:
+            raise ValueError("Sessionization needs event-level data; load_data without chunksize")
+
+        self._log(f"⏲️ Reconstructing sessions with a {pd.Timedelta(timeout)} inactivity timeout...")
+
+        self.sessionizer = Sessionizer(timeout).fit(self.user_events, user_index=self.user_index)
+        self.sessions = self.sessionizer.sessions
+        self.session_funnel_metrics = self.sessionizer.metrics()
+
+        self._log(f"✅ Reconstructed {len(self.sessions)} sessions "
+                  f"({self.sessions['duration_minutes'].median():.1f} min median duration)")
+
+        return self.sessions
 
-    def create_user_journey_summary(self):
+    @instrumented('create_user_journey_summary', inputs=['user_events'], outputs=['user_journey_summary'])
+    def create_user_journey_summary(self, conversion_flags=None):
         """
         Create summary of each user's journey through the funnel.
 
@@ -123,50 +529,91 @@ class DataPreprocessor:
         - How far each user progressed in the funnel
         - Time spent in the funnel
         - Conversion outcomes
-        """
-        print("🗺️ Creating user journey summaries...")
-
-        user_summary = self.user_events.groupby('user_id').agg({
-            'event_timestamp': ['min', 'max', 'count'],
-            'event_type': ['nunique', lambda x: list(x.unique())],
-            'funnel_step': 'max',
-            'session_id': 'nunique',
-            'platform': 'first',
-            'country': 'first',
-            'traffic_source': 'first'
-        }).reset_index()
-
-        # Flatten column names
-        user_summary.columns = [
-            'user_id', 'first_event', 'last_event', 'total_events',
-            'unique_event_types', 'event_types_list', 'max_funnel_step',
-            'total_sessions', 'platform', 'country', 'traffic_source'
-        ]
-
-        # Calculate time metrics
-        user_summary['session_duration_hours'] = (
-            (user_summary['last_event'] - user_summary['first_event']).dt.total_seconds() / 3600
-        )
 
-        # Add conversion flags
-        user_summary['converted_to_purchase'] = user_summary['event_types_list'].apply(
-            lambda x: 1 if 'purchase_completed' in x else 0
-        )
-        user_summary['downloaded_app'] = user_summary['event_types_list'].apply(
-            lambda x: 1 if 'app_download' in x else 0
-        )
-        user_summary['completed_signup'] = user_summary['event_types_list'].apply(
-            lambda x: 1 if 'email_verification' in x else 0
+        Args:
+            conversion_flags (dict): Flag column -> event type that sets it
+                (defaults to CONVERSION_FLAGS)
+        """
+        settings = self._summary_settings(conversion_flags)
+        if self.summary_from_cache and settings == self.cached_summary_settings:
+            self._log("⚡ Using user journey summaries from cache")
+            self.summary_settings = settings
+            return self.user_journey_summary
+
+        if self.summary_from_cache:
+            self._log("♻️ Summary settings differ from the cached ones; rebuilding from cached events")
+            self.summary_from_cache = False
+
+        self._log("🗺️ Creating user journey summaries...")
+
+        # Gap-based sessions (when sessionize_events ran) replace the upstream session ids
+        session_ids = self.sessionizer.event_sessions if self.sessionizer is not None else None
+        user_summary = build_user_journey_summary(
+            self.user_events, conversion_flags, self.user_index, session_ids=session_ids
         )
 
-        # Drop the event_types_list column as it's no longer needed
-        user_summary = user_summary.drop('event_types_list', axis=1)
-
         self.user_journey_summary = user_summary
-        print(f"✅ Created journey summaries for {len(user_summary)} users")
+        self.summary_settings = settings
+        self._log(f"✅ Created journey summaries for {len(user_summary)} users")
 
         return user_summary
 
+    @instrumented('run_parallel', inputs=['user_events'], outputs=['user_events', 'user_journey_summary'])
+    def run_parallel(self, n_workers=None, n_shards=None, conversion_flags=None,
+                     session_timeout=DEFAULT_SESSION_TIMEOUT):
+        """
+        Clean, sessionize and summarize the events on user shards in a process pool.
+
+        This is the parallel mode of clean_user_events, sessionize_events and
+        create_user_journey_summary: the events are hash-partitioned by user
+        and every shard is cleaned and summarized in its own worker (see
+        run_parallel_preprocessing), with the same results as the single
+        process steps. A run loaded from the cache has nothing left to clean,
+        so it takes the single process path.
+
+        Args:
+            n_workers (int): Worker processes (defaults to the CPU count)
+            n_shards (int): Number of user shards (defaults to n_workers)
+            conversion_flags (dict): Flag column -> event type that sets it
+                (defaults to CONVERSION_FLAGS)
+            session_timeout (str or timedelta): Inactivity gap that ends a session
+
+        Returns:
+            pd.DataFrame: User journey summary
+        """
+        if self.user_events is None:
+            raise ValueError("Parallel preprocessing needs event-level data; load_data without chunksize")
+
+        if self.loaded_from_cache:
+            self.clean_user_events()
+            self.sessionize_events(session_timeout)
+            return self.create_user_journey_summary(conversion_flags)
+
+        # Imported here because parallel_preprocessing builds on this module
+        from parallel_preprocessing import run_parallel_preprocessing
+
+        run_parallel_preprocessing(self, n_workers, n_shards, conversion_flags, session_timeout)
+
+        # The workers counted the same gap-based sessions per user; the session
+        # table itself is one more pass over the merged, user-indexed events
+        self.sessionize_events(session_timeout)
+        self.summary_settings = self._summary_settings(conversion_flags)
+        return self.user_journey_summary
+
+    def _summary_settings(self, conversion_flags=None):
+        """Settings a journey summary is built with (compared against the cached summary's)."""
+        flags = CONVERSION_FLAGS if conversion_flags is None else conversion_flags
+
+        # total_sessions counts gap-based sessions when sessionize_events ran
+        # and the upstream session ids otherwise
+        timeout = str(self.sessionizer.timeout) if self.sessionizer is not None else None
+        return {
+            'conversion_flags': [[flag, event_type] for flag, event_type in flags.items()],
+            'session_timeout': timeout
+        }
+
+    @instrumented('merge_with_demographics', inputs=['user_journey_summary', 'user_demographics'],
+                  outputs=['enriched_data'])
     def merge_with_demographics(self):
         """
         Merge user journey data with demographics information.
@@ -174,7 +621,11 @@ class DataPreprocessor:
         This creates a comprehensive dataset combining behavioral and demographic data
         for deeper analysis.
         """
-        print("🔗 Merging with demographics data...")
+        if self.summary_from_cache:
+            self._log("⚡ Using enriched user data from cache")
+            return self.enriched_data
+
+        self._log("🔗 Merging with demographics data...")
 
         # Merge journey summary with demographics
         self.enriched_data = self.user_journey_summary.merge(
@@ -186,12 +637,14 @@ class DataPreprocessor:
         # Handle any missing demographic data
         missing_demographics = self.enriched_data['age_group'].isna().sum()
         if missing_demographics > 0:
-            print(f"⚠️ Warning: {missing_demographics} users missing demographic data")
+            self._log(f"⚠️ Warning: {missing_demographics} users missing demographic data")
 
-        print(f"✅ Merged data: {len(self.enriched_data)} users with full profiles")
+        self._log(f"✅ Merged data: {len(self.enriched_data)} users with full profiles")
         return self.enriched_data
 
-    def calculate_funnel_metrics(self):
+    @instrumented('calculate_funnel_metrics', inputs=['user_events'], outputs=['funnel_metrics'])
+    def calculate_funnel_metrics(self, ordered=False, conversion_window=None, approximate=False,
+                                 relative_error=DEFAULT_RELATIVE_ERROR):
         """
         Calculate key funnel metrics for analysis.
 
@@ -199,78 +652,280 @@ class DataPreprocessor:
         - Conversion rates at each step
         - Drop-off rates
         - Time to conversion
-        """
-        print("📈 Calculating funnel metrics...")
 
-        # Overall funnel performance
-        funnel_steps = self.user_events['event_type'].value_counts().sort_index()
+        Args:
+            ordered (bool): Only count a step if the previous steps happened first
+            conversion_window (str or timedelta): Time limit from landing to each
+                later step in ordered mode, e.g. '7D'
+            approximate (bool): Estimate step users with HyperLogLog sketches
+                (kept in self.funnel_sketches for merging with other partitions)
+            relative_error (float): Target relative standard error in approximate mode
+        """
+        self._log("📈 Calculating funnel metrics...")
+
+        if approximate and (ordered or conversion_window is not None):
+            # Step order needs every user's timestamps, which sketches do not keep
+            self._log("⚠️ Ordered funnels need exact per-user data, falling back to exact counts")
+            approximate = False
+
+        if approximate:
+            self.funnel_sketches = SketchCube(['event_type'], relative_error=relative_error).fit(self.user_events)
+            step_users = self.funnel_sketches.distinct_users(['event_type']).reindex(FUNNEL_STEPS, fill_value=0)
+            self.funnel_engine = FunnelEngine.from_counts(
+                step_users.to_numpy(), self.funnel_sketches.total_users(), steps=FUNNEL_STEPS
+            )
+            self._log(f"🔢 Approximate counts (±{self.funnel_sketches.relative_error:.1%} standard error)")
+        else:
+            # Single pass over the events shared with the visualizer
+            self.funnel_engine = FunnelEngine(
+                ordered=ordered, conversion_window=conversion_window
+            ).fit(self.user_events, user_index=self.user_index)
 
         # Step-by-step conversion rates
-        step_conversions = {}
-        total_users = self.user_events['user_id'].nunique()
-
-        for event_type in ['landing_page_view', 'signup_page_view', 'email_verification', 
-                          'profile_setup', 'first_product_view', 'add_to_cart', 
-                          'checkout_start', 'payment_info_entered', 'purchase_completed']:
-
-            users_at_step = self.user_events[self.user_events['event_type'] == event_type]['user_id'].nunique()
-            step_conversions[event_type] = {
-                'users': users_at_step,
-                'conversion_rate': (users_at_step / total_users) * 100
-            }
+        step_conversions = self.funnel_engine.step_summary()
 
         self.funnel_metrics = step_conversions
-        print(f"✅ Calculated metrics for {len(step_conversions)} funnel steps")
+        self._log(f"✅ Calculated metrics for {len(step_conversions)} funnel steps")
 
         return step_conversions
 
-    def export_cleaned_data(self, output_dir):
+    @instrumented('calculate_conversion_times', inputs=['user_events'])
+    def calculate_conversion_times(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, chunksize=1_000_000):
+        """
+        Calculate time-between-steps distributions for every pair of funnel steps.
+
+        I report p50/p90/p99 elapsed hours from each step to every later step,
+        overall and by first-touch platform and traffic source. Streaming mode
+        keeps no event-level frame, so the events file is read again in chunks.
+
+        Args:
+            relative_accuracy (float): Maximum relative error of the quantiles
+            chunksize (int): Rows per chunk in streaming mode
+
+        Returns:
+            pd.DataFrame: Users and quantiles per step pair and segment
+        """
+        self._log("⏱️ Calculating time between funnel steps...")
+
+        engine = ConversionTimeEngine(relative_accuracy=relative_accuracy)
+        if self.user_events is not None:
+            engine.add(self.user_events, user_index=self.user_index)
+        else:
+            engine.consume(self.source_paths[0], chunksize)
+
+        self.conversion_times = engine.conversion_times()
+        summary = self.conversion_times.summary()
+
+        self._log(f"✅ Calculated conversion times for {len(summary)} step pair segments "
+                  f"(±{relative_accuracy:.0%} relative accuracy)")
+
+        return summary
+
+    @instrumented('mine_journey_paths', inputs=['user_events'], outputs=['top_paths'])
+    def mine_journey_paths(self, top_k=10, capacity=DEFAULT_CAPACITY):
+        """
+        Find the most common event paths users take.
+
+        I collapse consecutive repeats of an event type, count every user's
+        path and keep event type transition counts (start and exit included),
+        overall and by first-touch platform and traffic source.
+
+        Args:
+            top_k (int): Number of paths reported
+            capacity (int): Distinct paths tracked per segment (bounds memory)
+
+        Returns:
+            pd.DataFrame: Top paths with their users and share of all users
+        """
+        if self.user_events is None:
+            raise ValueError("Path mining needs event-level data; load_data without chunksize")
+
+        self._log("🧭 Mining user journey paths...")
+
+        self.path_miner = PathMiner(capacity=capacity).fit(self.user_events, user_index=self.user_index)
+        self.top_paths = self.path_miner.top_paths(top_k)
+
+        self._log(f"✅ Top path covers {self.top_paths['user_share'].iloc[0]:.1f}% of users: "
+                  f"{self.top_paths['path'].iloc[0]}")
+
+        return self.top_paths
+
+    @instrumented('attribute_campaigns', inputs=['user_events', 'campaign_data'],
+                  outputs=['campaign_attribution', 'campaign_performance'])
+    def attribute_campaigns(self):
+        """
+        Attribute users to campaigns and recompute campaign KPIs from the events.
+
+        I attribute each user's entry event (first event) to the campaign of
+        its traffic source that was running at that time, the most recently
+        started one when campaigns overlap, and recount acquisitions,
+        conversions and costs per campaign. Streaming mode keeps no event-level
+        frame, so the entries come from the journey summary, which holds the
+        same first event and first-touch traffic source.
+
+        Returns:
+            pd.DataFrame: Campaign performance recomputed from the events
+        """
+        self._log("🎯 Attributing users to campaigns...")
+
+        if self.user_events is not None:
+            entries = user_entries(self.user_events, user_index=self.user_index)
+        else:
+            entries = self.user_journey_summary[['user_id', 'first_event', 'traffic_source']].rename(
+                columns={'first_event': 'entry_time'}
+            ).assign(converted=self.user_journey_summary['converted_to_purchase'].astype(bool))
+
+        self.campaign_attribution, self.campaign_performance = CampaignIndex(self.campaign_data).performance(entries)
+
+        attributed = self.campaign_attribution['campaign_id'].notna().sum()
+        self._log(f"✅ Attributed {attributed} of {len(entries)} users to "
+                  f"{(self.campaign_performance['users_acquired'] > 0).sum()} campaigns")
+
+        return self.campaign_performance
+
+    @instrumented('build_segment_index', inputs=['user_events', 'user_demographics'])
+    def build_segment_index(self):
+        """
+        Build the bitmap segment index for drill-down funnels.
+
+        Step bitmaps come from the fitted funnel engine when it has a presence
+        matrix (so ordered mode carries over); streaming mode keeps no event-level
+        frame, so the event attributes come from the journey summary
+        (first-touch values).
+
+        Returns:
+            SegmentIndex: The fitted index
+        """
+        self._log("🗂️ Building segment bitmap index...")
+
+        events = self.user_events if self.user_events is not None else self.user_journey_summary
+        self.segment_index = SegmentIndex().fit(
+            events, demographics=self.user_demographics, funnel_engine=self.funnel_engine
+        )
+
+        indexed_values = sum(len(bitmaps) for bitmaps in self.segment_index.bitmaps.values())
+        self._log(f"✅ Indexed {len(self.segment_index.users)} users over {indexed_values} attribute values")
+        return self.segment_index
+
+    def segment_funnel(self, **filters):
+        """
+        Funnel metrics of a user segment from the segment index.
+
+        Args:
+            **filters: Attribute -> value or list of values, e.g.
+                platform='mobile', country='Germany', age_group='25-34'
+
+        Returns:
+            pd.DataFrame: FunnelEngine.metrics of the segment
+        """
+        if self.segment_index is None:
+            self.build_segment_index()
+        return self.segment_index.funnel(**filters).metrics()
+
+    @instrumented('export_cleaned_data', inputs=['user_events', 'user_journey_summary', 'enriched_data'])
+    def export_cleaned_data(self, output_dir, binary=False):
         """
         Export all cleaned and processed data.
 
         Args:
             output_dir (str): Directory to save processed data files
+            binary (bool): Also write the cleaned events in the memory-mapped
+                EventStore layout (see EventStore.to_binary), which analysis
+                runs open with EventStore.from_binary instead of parsing CSV
+
+        Returns:
+            dict: Paths of the exported files
         """
-        print(f"💾 Exporting cleaned data to {output_dir}...")
+        self._log(f"💾 Exporting cleaned data to {output_dir}...")
 
-        # Export cleaned datasets
-        self.user_events.to_csv(f"{output_dir}/cleaned_user_events.csv", index=False)
+        # Export cleaned datasets (streaming mode keeps no event-level frame)
+        if self.user_events is not None:
+            self._cleaned_events_frame().to_csv(f"{output_dir}/cleaned_user_events.csv", index=False)
         self.user_journey_summary.to_csv(f"{output_dir}/user_journey_summary.csv", index=False)
         self.enriched_data.to_csv(f"{output_dir}/enriched_user_data.csv", index=False)
 
-        print("✅ All cleaned data exported successfully!")
-
-        return {
+        exported = {
             'events_file': f"{output_dir}/cleaned_user_events.csv",
             'journey_file': f"{output_dir}/user_journey_summary.csv", 
             'enriched_file': f"{output_dir}/enriched_user_data.csv"
         }
 
+        if self.sessionizer is not None:
+            self.sessions.to_csv(f"{output_dir}/sessions.csv", index=False)
+            self.session_funnel_metrics.to_csv(f"{output_dir}/session_funnel_metrics.csv", index=False)
+            exported['sessions_file'] = f"{output_dir}/sessions.csv"
+            exported['session_funnel_file'] = f"{output_dir}/session_funnel_metrics.csv"
+
+        if self.path_miner is not None:
+            self.top_paths.to_csv(f"{output_dir}/top_paths.csv", index=False)
+            self.path_miner.transition_matrix().to_csv(f"{output_dir}/path_transitions.csv")
+            exported['top_paths_file'] = f"{output_dir}/top_paths.csv"
+            exported['path_transitions_file'] = f"{output_dir}/path_transitions.csv"
+
+        if self.campaign_performance is not None:
+            self.campaign_performance.to_csv(f"{output_dir}/campaign_performance.csv", index=False)
+            exported['campaign_performance_file'] = f"{output_dir}/campaign_performance.csv"
+
+        if self.conversion_times is not None:
+            self.conversion_times.summary().to_csv(f"{output_dir}/conversion_times.csv", index=False)
+            self.conversion_times.histogram().to_csv(f"{output_dir}/conversion_time_histograms.csv", index=False)
+            exported['conversion_times_file'] = f"{output_dir}/conversion_times.csv"
+            exported['conversion_histograms_file'] = f"{output_dir}/conversion_time_histograms.csv"
+
+        if binary and self.user_events is not None:
+            store = self.event_store
+            if store is None:
+                # The cleaned frame is deduplicated and sorted by user and time
+                store = EventStore.from_frame(self.user_events)
+                store.sorted_by_user = self.user_index is not None
+
+            # Lets readers tell whether the export still matches the raw files
+            if self.cache is not None:
+                key = self.cache.cache_key(self.source_paths)
+            else:
+                key = source_key(self.source_paths)
+            exported['events_binary_dir'] = store.to_binary(f"{output_dir}/{BINARY_EVENTS_DIR}", source_key=key)
+
+        self._log("✅ All cleaned data exported successfully!")
+
+        if not self.loaded_from_cache:
+            self.cache_cleaned_data()
+
+        return exported
+
 def main():
     """
     Main preprocessing pipeline.
 
     I designed this pipeline to be run independently for data preparation.
     """
-    preprocessor = DataPreprocessor()
+    parser = argparse.ArgumentParser(description='Prepare the funnel analysis data')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes; more than one cleans and summarizes user shards in parallel')
+    args = parser.parse_args()
 
-    # Load data
-    data_summary = preprocessor.load_data(
-        '../data/user_events.csv',
-        '../data/user_demographics.csv',
-        '../data/campaign_data.csv'
-    )
+    preprocessor = DataPreprocessor(cache_dir='../data/processed/cache')
+
+    # Load data (from the columnar cache when the CSV files are unchanged)
+    data_summary = preprocessor.load_data(*DATA_SOURCES, event_store=args.workers > 1)
 
     # Clean and process
-    preprocessor.clean_user_events()
-    preprocessor.create_user_journey_summary()
+    if args.workers > 1:
+        preprocessor.run_parallel(n_workers=args.workers)
+    else:
+        preprocessor.clean_user_events()
+        preprocessor.sessionize_events()
+        preprocessor.create_user_journey_summary()
     preprocessor.merge_with_demographics()
     preprocessor.calculate_funnel_metrics()
+    preprocessor.calculate_conversion_times()
+    preprocessor.mine_journey_paths()
+    preprocessor.attribute_campaigns()
 
     # Export results
-    preprocessor.export_cleaned_data('../data/processed')
+    preprocessor.export_cleaned_data('../data/processed', binary=True)
 
-    print("🎉 Data preprocessing completed successfully!")
+    preprocessor._log("🎉 Data preprocessing completed successfully!")
 
 if __name__ == "__main__":
     main()
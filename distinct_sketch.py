@@ -0,0 +1,334 @@
+"""
+Distinct Sketch Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Approximate, mergeable distinct-user counts with HyperLogLog sketches
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from aggregate_cube import CATEGORICAL_DIMENSIONS, CubeCells, _pack, _unpack
+
+# Target relative standard error of the approximate counts
+DEFAULT_RELATIVE_ERROR = 0.01
+
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+
+def precision_for_error(relative_error):
+    """
+    Return the smallest HyperLogLog precision meeting a relative standard error.
+
+    The standard error of HyperLogLog is about 1.04 / sqrt(2 ** precision).
+
+    Args:
+        relative_error (float): Target relative standard error, e.g. 0.01
+
+    Returns:
+        int: Number of index bits (registers = 2 ** precision)
+    """
+    if relative_error <= 0:
+        raise ValueError("relative_error must be positive (use exact mode for exact counts)")
+
+    precision = math.ceil(math.log2((1.04 / relative_error) ** 2))
+    return int(min(max(precision, MIN_PRECISION), MAX_PRECISION))
+
+
+def hash_user_ids(user_ids):
+    """
+    Hash user ids into uint64 values.
+
+    The hash only depends on the id value, so sketches built on different
+    days, shards or processes can be merged.
+
+    Args:
+        user_ids (array-like): Integer user ids
+
+    Returns:
+        np.ndarray: uint64 hashes
+    """
+    return pd.util.hash_array(np.asarray(user_ids).astype(np.int64))
+
+
+def _bit_length(values):
+    """Exact bit length of every uint64 value (0 for 0)."""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= np.uint64(1 << shift)
+        length[high] += shift
+        values[high] >>= np.uint64(shift)
+    return length + (values > 0)
+
+
+def register_ranks(hashes, precision):
+    """
+    Split hashes into a register index and the rank of the remaining bits.
+
+    Args:
+        hashes (np.ndarray): uint64 hashes
+        precision (int): Number of index bits
+
+    Returns:
+        tuple: (register index as int64, rank as uint8)
+    """
+    suffix_bits = 64 - precision
+    index = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+    remainder = hashes & np.uint64((1 << suffix_bits) - 1)
+    rank = suffix_bits - _bit_length(remainder) + 1
+    return index, rank.astype(np.uint8)
+
+
+def estimate_cardinality(inverse_sum, zero_registers, precision):
+    """
+    HyperLogLog estimate with the linear counting correction for small counts.
+
+    Args:
+        inverse_sum (np.ndarray): Sum of 2 ** -rank over all registers of each sketch
+        zero_registers (np.ndarray): Number of empty registers of each sketch
+        precision (int): Number of index bits
+
+    Returns:
+        np.ndarray: Estimated distinct counts
+    """
+    m = 1 << precision
+    alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+
+    raw = alpha * m * m / np.asarray(inverse_sum, dtype=float)
+    zero_registers = np.asarray(zero_registers, dtype=float)
+    linear = m * np.log(m / np.maximum(zero_registers, 1))
+
+    return np.where((raw <= 2.5 * m) & (zero_registers > 0), linear, raw)
+
+
+class HyperLogLog:
+    """
+    Single dense HyperLogLog sketch of distinct users.
+
+    I use this where one distinct count is needed without keeping the user ids,
+    e.g. total users per daily partition. Two sketches with the same precision
+    merge by taking the register-wise maximum.
+    """
+
+    def __init__(self, relative_error=DEFAULT_RELATIVE_ERROR, precision=None):
+        """
+        Initialize an empty sketch.
+
+        Args:
+            relative_error (float): Target relative standard error
+            precision (int): Number of index bits (overrides relative_error)
+        """
+        self.precision = precision if precision is not None else precision_for_error(relative_error)
+        self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        """Relative standard error of the estimate."""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, user_ids):
+        """
+        Add user ids to the sketch.
+
+        Args:
+            user_ids (array-like): Integer user ids
+
+        Returns:
+            HyperLogLog: The updated sketch
+        """
+        index, rank = register_ranks(hash_user_ids(user_ids), self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        """
+        Merge another sketch into this one.
+
+        Args:
+            other (HyperLogLog): Sketch with the same precision
+
+        Returns:
+            HyperLogLog: The merged sketch
+        """
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        """Return the estimated number of distinct users."""
+        inverse_sum = np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        zero_registers = np.count_nonzero(self.registers == 0)
+        return int(np.rint(estimate_cardinality(inverse_sum, zero_registers, self.precision)))
+
+
+class SketchCube(CubeCells):
+    """
+    Aggregate cube holding a HyperLogLog sketch per cell instead of user ids.
+
+    I store the sketches sparsely: one (cell, register, max rank) row per
+    register that is actually set, which is never more rows than the exact
+    cube has (cell, user) tuples. Roll-ups take the register-wise maximum over
+    the merged cells, so any combination of dimensions can be estimated, and
+    cubes built on different days or user shards merge without shipping user
+    ids around. The query interface matches AggregateCube.distinct_users; there
+    are no per-user rows, so callers needing them (e.g. the cohort heatmap)
+    check for approximate mode and use the events instead.
+    """
+
+    def __init__(self, dimensions=None, relative_error=DEFAULT_RELATIVE_ERROR, precision=None):
+        """
+        Initialize an empty sketch cube.
+
+        Args:
+            dimensions (list): Cube dimensions (defaults to CUBE_DIMENSIONS)
+            relative_error (float): Target relative standard error per roll-up
+            precision (int): Number of index bits (overrides relative_error)
+        """
+        super().__init__(dimensions)
+        self.precision = precision if precision is not None else precision_for_error(relative_error)
+
+    @property
+    def relative_error(self):
+        """Relative standard error of every roll-up estimate."""
+        return 1.04 / math.sqrt(1 << self.precision)
+
+    def fit(self, events_df):
+        """
+        Build the per-cell sketches from the events.
+
+        Args:
+            events_df (pd.DataFrame or EventStore): Events with parsed event_timestamp
+
+        Returns:
+            SketchCube: The fitted cube
+        """
+        codes, users = self._encode(events_df)
+        index, rank = register_ranks(hash_user_ids(users), self.precision)
+
+        self._store(
+            [codes[dimension] for dimension in self.dimensions] + [index], rank
+        )
+        return self
+
+    def _store(self, code_arrays, ranks):
+        """Keep the maximum rank of every distinct (cell, register) key."""
+        radices = self._radices() + [1 << self.precision]
+        keys = _pack(code_arrays, radices)
+
+        # Highest rank first within each key, so unique() keeps the maximum
+        order = np.lexsort((-ranks.astype(np.int64), keys))
+        keys, first = np.unique(keys[order], return_index=True)
+
+        unpacked = _unpack(keys, radices)
+        self.cells = {
+            dimension: array.astype(np.int32)
+            for dimension, array in zip(self.dimensions + ['register'], unpacked)
+        }
+        self.cells['rank'] = ranks[order][first]
+
+    def merge(self, other):
+        """
+        Merge another sketch cube (e.g. another day or user shard) into this one.
+
+        Args:
+            other (SketchCube): Cube with the same dimensions and precision
+
+        Returns:
+            SketchCube: The merged cube
+        """
+        if other.precision != self.precision or other.dimensions != self.dimensions:
+            raise ValueError("Cannot merge sketch cubes with different dimensions or precision")
+        if not other.cells:
+            return self
+        if not self.cells:
+            self.levels, self.first_day = dict(other.levels), other.first_day
+            self.cells = dict(other.cells)
+            return self
+
+        first_day = min(self.first_day, other.first_day)
+        code_arrays = [[], []]
+        levels = {}
+        for dimension in self.dimensions:
+            if dimension in CATEGORICAL_DIMENSIONS:
+                values = self.levels[dimension][1:].union(other.levels[dimension][1:])
+                levels[dimension] = pd.Index([None] + list(values), dtype=object)
+                for side, cube in enumerate([self, other]):
+                    remap = np.concatenate([[0], values.get_indexer(cube.levels[dimension][1:]) + 1])
+                    code_arrays[side].append(remap[cube.cells[dimension]])
+            elif dimension == 'date':
+                last_day = max(self.first_day + len(self.levels['date']), other.first_day + len(other.levels['date']))
+                levels[dimension] = pd.DatetimeIndex(
+                    np.arange(first_day, last_day).astype('datetime64[D]')
+                )
+                for side, cube in enumerate([self, other]):
+                    code_arrays[side].append(cube.cells[dimension] + (cube.first_day - first_day))
+            else:
+                levels[dimension] = self.levels[dimension]
+                for side, cube in enumerate([self, other]):
+                    code_arrays[side].append(cube.cells[dimension])
+
+        for side, cube in enumerate([self, other]):
+            code_arrays[side].append(cube.cells['register'])
+
+        ranks = np.concatenate([self.cells['rank'], other.cells['rank']])
+        self.levels, self.first_day = levels, first_day
+        self._store(
+            [np.concatenate(pair).astype(np.int64) for pair in zip(*code_arrays)], ranks
+        )
+        return self
+
+    def _estimate(self, group_key, mask, n_groups):
+        """Estimate distinct users of every group from the selected cells."""
+        m = 1 << self.precision
+
+        # Register-wise maximum over the cells merged into each group
+        keys = group_key * m + self.cells['register'][mask]
+        ranks = self.cells['rank'][mask].astype(np.int64)
+        order = np.lexsort((-ranks, keys))
+        keys, first = np.unique(keys[order], return_index=True)
+        ranks = ranks[order][first]
+
+        groups = keys // m
+        set_registers = np.bincount(groups, minlength=n_groups)
+        inverse_sum = np.bincount(groups, weights=np.ldexp(1.0, -ranks), minlength=n_groups)
+
+        estimates = estimate_cardinality(inverse_sum + (m - set_registers), m - set_registers, self.precision)
+        return np.where(set_registers > 0, np.rint(estimates), 0).astype(np.int64)
+
+    def distinct_users(self, by, where=None):
+        """
+        Estimate distinct user counts per group.
+
+        Args:
+            by (list): Dimensions to group by (cube or derived dimensions)
+            where (dict): Optional filters, dimension -> allowed values
+
+        Returns:
+            pd.Series: Estimated distinct users per group (empty groups are omitted)
+        """
+        mask = self._filter_mask(where)
+        group_key, group_levels, radices = self._group_keys(by, mask)
+
+        counts = self._estimate(group_key, mask, int(np.prod(radices)))
+        present = np.flatnonzero(counts)
+        keep, index = self._group_index(by, present, group_levels, radices)
+
+        return pd.Series(counts[present][keep], index=index, name='user_id')
+
+    def total_users(self, where=None):
+        """
+        Estimate the number of distinct users over all (or the filtered) cells.
+
+        Args:
+            where (dict): Optional filters, dimension -> allowed values
+
+        Returns:
+            int: Estimated distinct users
+        """
+        mask = self._filter_mask(where)
+        group_key = np.zeros(int(mask.sum()), dtype=np.int64)
+        return int(self._estimate(group_key, mask, 1)[0])
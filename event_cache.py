@@ -0,0 +1,200 @@
+"""
+Columnar Cache Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Keep cleaned pipeline outputs on disk so warm runs skip CSV parsing
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+
+import pandas as pd
+
+# Bump whenever cleaning or summary logic changes so stale caches are ignored
+PIPELINE_VERSION = '2'
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def source_key(source_paths, verify_contents=False):
+    """
+    Fingerprint a set of source files and the pipeline version.
+
+    Args:
+        source_paths (list): Paths of the raw input files
+        verify_contents (bool): Also hash the source file contents
+
+    Returns:
+        str: Hex digest identifying the sources and pipeline version
+    """
+    digest = hashlib.sha256(f"pipeline={PIPELINE_VERSION}".encode())
+
+    for path in source_paths:
+        stat = os.stat(path)
+        digest.update(f"|{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+        if verify_contents:
+            with open(path, 'rb') as source:
+                for block in iter(lambda: source.read(1 << 20), b''):
+                    digest.update(block)
+
+    return digest.hexdigest()[:16]
+
+
+class ColumnarCache:
+    """
+    On-disk columnar cache for cleaned frames.
+
+    I key every cache entry on the source files (path, size and modification
+    time, optionally a content hash) plus PIPELINE_VERSION. Any change to a
+    source CSV or to the pipeline produces a new key, so an outdated entry is
+    simply never found, and it is removed the next time the cache is written
+    for the same source files. Entries of other source sets sharing the cache
+    directory are left alone.
+    """
+
+    def __init__(self, cache_dir, file_format=None, verify_contents=False):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir (str): Directory that holds the cache entries
+            file_format (str): 'parquet' or 'feather' (pyarrow), or 'pickle';
+                defaults to parquet when pyarrow is installed
+            verify_contents (bool): Also hash the source file contents
+        """
+        if file_format is None:
+            file_format = 'parquet' if importlib.util.find_spec('pyarrow') else 'pickle'
+
+        self.cache_dir = cache_dir
+        self.file_format = file_format
+        self.verify_contents = verify_contents
+
+    def cache_key(self, source_paths):
+        """
+        Compute the cache key for a set of source files.
+
+        Args:
+            source_paths (list): Paths of the raw input files
+
+        Returns:
+            str: Hex digest identifying the sources and pipeline version
+        """
+        return source_key(source_paths, self.verify_contents)
+
+    def _entry_dir(self, key):
+        """Return the directory of one cache entry."""
+        return os.path.join(self.cache_dir, key)
+
+    def _frame_path(self, key, name):
+        """Return the file path of one cached frame."""
+        return os.path.join(self._entry_dir(key), f"{name}.{self.file_format}")
+
+    def load(self, source_paths, names):
+        """
+        Load cached frames if a valid entry exists.
+
+        Args:
+            source_paths (list): Paths of the raw input files
+            names (list): Frame names to load
+
+        Returns:
+            dict: Frame name -> DataFrame, or None if the cache is missing or stale
+        """
+        key, manifest = self._manifest(source_paths)
+        if manifest is None:
+            return None
+
+        if manifest.get('format') != self.file_format or not set(names) <= set(manifest.get('frames', [])):
+            return None
+
+        readers = {
+            'parquet': pd.read_parquet,
+            'feather': pd.read_feather,
+            'pickle': pd.read_pickle
+        }
+        return {name: readers[self.file_format](self._frame_path(key, name)) for name in names}
+
+    def load_metadata(self, source_paths):
+        """
+        Return the metadata saved with the valid entry of the source files.
+
+        Args:
+            source_paths (list): Paths of the raw input files
+
+        Returns:
+            dict: Metadata passed to save (empty if none), or None if the cache
+                is missing or stale
+        """
+        _, manifest = self._manifest(source_paths)
+        return None if manifest is None else manifest.get('metadata', {})
+
+    def _manifest(self, source_paths):
+        """Return the key and manifest of the entry of the source files (manifest None if missing)."""
+        try:
+            key = self.cache_key(source_paths)
+        except OSError:
+            return None, None
+
+        manifest_path = os.path.join(self._entry_dir(key), MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return key, None
+
+        with open(manifest_path) as manifest_file:
+            return key, json.load(manifest_file)
+
+    def save(self, source_paths, frames, metadata=None):
+        """
+        Write frames to the cache and drop older entries for the same sources.
+
+        Args:
+            source_paths (list): Paths of the raw input files
+            frames (dict): Frame name -> DataFrame
+            metadata (dict): JSON-serializable settings the frames were built
+                with (see load_metadata)
+
+        Returns:
+            str: Directory of the written cache entry
+        """
+        key = self.cache_key(source_paths)
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+
+        for name, frame in frames.items():
+            path = self._frame_path(key, name)
+            if self.file_format == 'parquet':
+                frame.to_parquet(path, index=False)
+            elif self.file_format == 'feather':
+                frame.reset_index(drop=True).to_feather(path)
+            else:
+                frame.to_pickle(path)
+
+        sources = [os.path.abspath(path) for path in source_paths]
+
+        # Written last so a partially written entry is never considered valid
+        with open(os.path.join(entry_dir, MANIFEST_FILE), 'w') as manifest_file:
+            json.dump({
+                'key': key,
+                'pipeline_version': PIPELINE_VERSION,
+                'format': self.file_format,
+                'sources': sources,
+                'frames': sorted(frames),
+                'metadata': metadata or {}
+            }, manifest_file, indent=2)
+
+        for entry in os.listdir(self.cache_dir):
+            if entry != key and self._entry_sources(entry) == sources:
+                shutil.rmtree(os.path.join(self.cache_dir, entry), ignore_errors=True)
+
+        return entry_dir
+
+    def _entry_sources(self, entry):
+        """Return the source paths recorded in an entry's manifest (None if it has none)."""
+        manifest_path = os.path.join(self.cache_dir, entry, MANIFEST_FILE)
+        try:
+            with open(manifest_path) as manifest_file:
+                return json.load(manifest_file).get('sources')
+        except (OSError, ValueError):
+            return None
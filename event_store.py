@@ -0,0 +1,689 @@
+"""
+Event Store Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Hold user events as compact dictionary-encoded arrays
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from event_stream import group_starts, read_event_chunks
+from funnel_engine import FUNNEL_ORDER
+from timestamp_parser import NAT, timestamp_nanos
+
+CATEGORICAL_COLUMNS = ['event_type', 'platform', 'country', 'traffic_source']
+
+# First-touch user attributes the path and conversion time breakdowns use
+SEGMENT_COLUMNS = ['platform', 'traffic_source']
+
+# Users processed at a time by the per-user block loops, which bounds the
+# temporary arrays
+BLOCK_USERS = 1 << 16
+
+# Columns of the cleaned events written by the pandas pipeline (to_cleaned_frame)
+CLEANED_COLUMNS = [
+    'user_id', 'event_timestamp', 'event_type', 'platform', 'country', 'traffic_source', 'session_id',
+    'date', 'hour', 'day_of_week', 'week_number', 'month', 'funnel_step'
+]
+
+NANOS_PER_HOUR = 3_600_000_000_000
+NANOS_PER_DAY = 24 * NANOS_PER_HOUR
+
+# Epoch timestamps must fit in 32 bits to pack (user, epoch) into one session key
+SESSION_EPOCH_BITS = 32
+
+# Binary layout: one raw fixed-width file per array plus a JSON sidecar
+BINARY_ARRAYS = ['user_id', 'timestamp', 'session_user', 'session_epoch']
+BINARY_SIDECAR = 'dictionaries.json'
+BINARY_FORMAT_VERSION = 1
+
+
+def _parse_session_ids(session_ids):
+    """
+    Split 'sess_<user>_<epoch>' strings into integer parts.
+
+    Only the distinct ids are parsed. Ids that do not follow the pattern get
+    session_user -1 and an index into the returned label list as their epoch.
+
+    Returns:
+        tuple: (session_user int32, session_epoch int64, unparsed labels)
+    """
+    codes, uniques = pd.factorize(pd.Series(session_ids), use_na_sentinel=True)
+    parts = pd.Series(uniques, dtype=object).str.extract(r'^sess_(-?\d+)_(\d+)$')
+
+    parsed = parts.notna().all(axis=1).to_numpy()
+    unique_users = np.full(len(uniques), -1, dtype=np.int32)
+    unique_epochs = np.arange(len(uniques), dtype=np.int64)
+    unique_users[parsed] = parts.loc[parsed, 0].astype(np.int64).to_numpy()
+    unique_epochs[parsed] = parts.loc[parsed, 1].astype(np.int64).to_numpy()
+
+    # Keep the original text of ids that could not be decomposed
+    labels = list(pd.Index(uniques)[~parsed])
+    unique_epochs[~parsed] = np.arange(len(labels), dtype=np.int64)
+
+    session_user = np.where(codes >= 0, unique_users[codes], -1).astype(np.int32)
+    session_epoch = np.where(codes >= 0, unique_epochs[codes], -1).astype(np.int64)
+    return session_user, session_epoch, labels
+
+
+class UserIndex:
+    """
+    CSR-style offset index over events sorted by user.
+
+    The events of user_ids[k] are rows offsets[k]:offsets[k + 1], so per-user
+    work becomes contiguous slice scans or ufunc.reduceat calls instead of a
+    hash groupby, and one user's rows are found without scanning.
+    """
+
+    def __init__(self, user_ids, offsets):
+        """
+        Initialize the index.
+
+        Args:
+            user_ids (np.ndarray): Distinct user ids in row order (ascending)
+            offsets (np.ndarray): int64 row offsets, one more than user_ids
+        """
+        self.user_ids = user_ids
+        self.offsets = offsets
+        self._lookup = None
+
+    @classmethod
+    def from_sorted(cls, user_id):
+        """
+        Build the index from the user id column of user-sorted events.
+
+        Args:
+            user_id (array-like): User id of every event, in ascending order
+
+        Returns:
+            UserIndex: Offset index of the events
+        """
+        user_id = np.asarray(user_id)
+        if len(user_id) and np.any(user_id[1:] < user_id[:-1]):
+            raise ValueError("Events are not sorted by user_id")
+
+        starts = group_starts(user_id)
+        return cls(user_id[starts], np.append(starts, len(user_id)).astype(np.int64))
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @property
+    def starts(self):
+        """First row of every user."""
+        return self.offsets[:-1]
+
+    @property
+    def counts(self):
+        """Number of rows of every user."""
+        return np.diff(self.offsets)
+
+    def user_codes(self):
+        """
+        Return the position of every row's user in user_ids.
+
+        Returns:
+            np.ndarray: Dense user code per row (0..len-1)
+        """
+        return np.repeat(np.arange(len(self.user_ids), dtype=np.int64), self.counts)
+
+    def reduce(self, ufunc, values):
+        """
+        Reduce a row-aligned array per user, e.g. reduce(np.maximum, steps).
+
+        Args:
+            ufunc (np.ufunc): Binary ufunc with reduceat
+            values (np.ndarray): One value per row
+
+        Returns:
+            np.ndarray: One value per user
+        """
+        if len(self.user_ids) == 0:
+            return np.zeros(0, dtype=np.asarray(values).dtype)
+        return ufunc.reduceat(values, self.starts)
+
+    def position(self, user_id):
+        """
+        Find a user's position in user_ids.
+
+        Dense integer ids (the usual case) use a direct lookup table, so this
+        is O(1); sparse ids fall back to a binary search.
+
+        Args:
+            user_id (int): User id
+
+        Returns:
+            int: Position, or -1 if the user has no events
+        """
+        if len(self.user_ids) == 0:
+            return -1
+
+        if self._lookup is None:
+            low, high = int(self.user_ids[0]), int(self.user_ids[-1])
+            if high - low < 4 * len(self.user_ids) + 1024:
+                lookup = np.full(high - low + 1, -1, dtype=np.int64)
+                lookup[self.user_ids.astype(np.int64) - low] = np.arange(len(self.user_ids))
+                self._lookup = (low, lookup)
+            else:
+                self._lookup = (low, None)
+
+        low, lookup = self._lookup
+        if lookup is not None:
+            offset = user_id - low
+            return int(lookup[offset]) if 0 <= offset < len(lookup) else -1
+
+        position = int(np.searchsorted(self.user_ids, user_id))
+        return position if position < len(self.user_ids) and self.user_ids[position] == user_id else -1
+
+    def rows(self, user_id):
+        """
+        Return the row range of one user.
+
+        Args:
+            user_id (int): User id
+
+        Returns:
+            slice: The user's rows
+        """
+        position = self.position(user_id)
+        if position < 0:
+            raise KeyError(user_id)
+        return slice(int(self.offsets[position]), int(self.offsets[position + 1]))
+
+
+def sorted_user_runs(users, timestamps, user_index=None):
+    """
+    Order events by user and time and find where every user's run starts.
+
+    Args:
+        users (np.ndarray): int64 user id of every event
+        timestamps (np.ndarray): int64 nanoseconds of every event, NAT if missing
+        user_index (UserIndex): Offset index when the events are cleaned and
+            sorted by user and time (skips the sort)
+
+    Returns:
+        tuple: (row order, first position of every user in that order); events
+            without a timestamp are left out of the order, which is
+            slice(None) when user_index is given
+    """
+    if user_index is not None:
+        return slice(None), user_index.starts
+
+    keep = np.flatnonzero(timestamps != NAT)
+    order = keep[np.lexsort((timestamps[keep], users[keep]))]
+    return order, group_starts(users[order])
+
+
+def _keeps_order(indices):
+    """Whether selecting rows by indices keeps them in their original order."""
+    if isinstance(indices, slice):
+        return indices.step is None or indices.step > 0
+    indices = np.asarray(indices)
+    return indices.dtype == bool or bool(np.all(indices[1:] > indices[:-1]))
+
+
+class EventStore:
+    """
+    Compact in-memory event store.
+
+    I keep events as plain NumPy arrays instead of object columns: int32 user
+    ids, int64 epoch nanoseconds, small-int dictionary codes for the categorical
+    columns and session ids split into their user and epoch parts. That is
+    under 30 bytes per event. Time features (hour, date, ...) and funnel steps
+    are derived lazily from the timestamp and code arrays when first requested.
+
+    Indexing a store by column name returns a pandas Series, so code written
+    against the events DataFrame (e.g. FunnelEngine.fit) accepts a store as is.
+    The arrays can be written to one binary file each (to_binary) and opened
+    again as memory maps (from_binary), so analysis runs skip CSV parsing.
+
+    A cleaned store is sorted by user and time and says so (sorted_by_user),
+    which lets it serve a UserIndex of per-user row ranges and lets cleaned()
+    skip the sort when called again.
+    """
+
+    def __init__(self, user_id, timestamp, codes, dictionaries,
+                 session_user, session_epoch, session_labels=None, sorted_by_user=False):
+        """
+        Initialize a store from its column arrays.
+
+        Args:
+            user_id (np.ndarray): int32 user ids
+            timestamp (np.ndarray): int64 epoch nanoseconds
+            codes (dict): Column -> small-int dictionary codes (-1 for missing)
+            dictionaries (dict): Column -> list of values for each code
+            session_user (np.ndarray): int32 user part of each session id
+            session_epoch (np.ndarray): int64 epoch part of each session id
+            session_labels (list): Raw session ids that did not match the pattern
+            sorted_by_user (bool): Rows are in cleaned() order (user, time, event type)
+        """
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.codes = codes
+        self.dictionaries = dictionaries
+        self.session_user = session_user
+        self.session_epoch = session_epoch
+        self.session_labels = session_labels or []
+        self.sorted_by_user = sorted_by_user
+        self._derived = {}
+
+    @classmethod
+    def from_frame(cls, events_df):
+        """
+        Encode an events DataFrame into a store.
+
+        Args:
+            events_df (pd.DataFrame): Raw or cleaned user events
+
+        Returns:
+            EventStore: Encoded events
+        """
+        user_id = events_df['user_id'].to_numpy(np.int64)
+        if len(user_id) and (user_id.min() < np.iinfo(np.int32).min or user_id.max() > np.iinfo(np.int32).max):
+            raise ValueError("user_id values do not fit in int32")
+
+        timestamp = timestamp_nanos(events_df['event_timestamp'])
+
+        codes, dictionaries = {}, {}
+        for column in CATEGORICAL_COLUMNS:
+            categorical = pd.Categorical(events_df[column])
+            codes[column] = categorical.codes
+            dictionaries[column] = list(categorical.categories)
+
+        session_user, session_epoch, session_labels = _parse_session_ids(events_df['session_id'])
+
+        return cls(
+            user_id.astype(np.int32), timestamp.copy(), codes, dictionaries,
+            session_user, session_epoch, session_labels
+        )
+
+    @classmethod
+    def from_csv(cls, events_path, chunksize=1_000_000):
+        """
+        Read an events CSV file chunk by chunk into a store.
+
+        Args:
+            events_path (str): Path to user events CSV file
+            chunksize (int): Rows per chunk
+
+        Returns:
+            EventStore: Encoded events
+        """
+        return cls.concat([cls.from_frame(chunk) for chunk in read_event_chunks(events_path, chunksize)])
+
+    @classmethod
+    def from_binary(cls, directory):
+        """
+        Open a store written by to_binary without reading it into memory.
+
+        Every array is a read-only numpy.memmap of its column file, so opening
+        is instant and processes reading the same export share the OS page
+        cache instead of each holding a private copy.
+
+        Args:
+            directory (str): Directory written by to_binary
+
+        Returns:
+            EventStore: Store backed by the memory-mapped column files
+        """
+        with open(os.path.join(directory, BINARY_SIDECAR)) as sidecar:
+            meta = json.load(sidecar)
+        if meta.get('format_version') != BINARY_FORMAT_VERSION:
+            raise ValueError(f"Unsupported event store format in {directory}")
+
+        def open_array(name):
+            dtype = np.dtype(meta['dtypes'][name])
+            if meta['rows'] == 0:
+                return np.zeros(0, dtype=dtype)
+            return np.memmap(os.path.join(directory, f"{name}.bin"), dtype=dtype, mode='r', shape=(meta['rows'],))
+
+        return cls(
+            open_array('user_id'), open_array('timestamp'),
+            {column: open_array(f"codes_{column}") for column in meta['dictionaries']},
+            meta['dictionaries'], open_array('session_user'), open_array('session_epoch'),
+            meta['session_labels'], meta.get('sorted_by_user', False)
+        )
+
+    @classmethod
+    def concat(cls, stores):
+        """
+        Concatenate stores, merging their dictionaries.
+
+        Args:
+            stores (list): EventStore instances
+
+        Returns:
+            EventStore: Combined store
+        """
+        codes, dictionaries = {}, {}
+        for column in CATEGORICAL_COLUMNS:
+            merged = pd.Index([])
+            for store in stores:
+                merged = merged.append(pd.Index(store.dictionaries[column])).unique()
+            dictionaries[column] = list(merged)
+
+            remapped = []
+            for store in stores:
+                mapping = merged.get_indexer(pd.Index(store.dictionaries[column]))
+                store_codes = store.codes[column]
+                remapped.append(np.where(store_codes >= 0, mapping[store_codes] if len(mapping) else -1, -1))
+            codes[column] = np.concatenate(remapped).astype(_code_dtype(len(merged)))
+
+        session_labels, session_epochs = [], []
+        for store in stores:
+            epochs = store.session_epoch.copy()
+            unparsed = (store.session_user == -1) & (epochs >= 0)
+            epochs[unparsed] += len(session_labels)
+            session_labels.extend(store.session_labels)
+            session_epochs.append(epochs)
+
+        return cls(
+            np.concatenate([store.user_id for store in stores]),
+            np.concatenate([store.timestamp for store in stores]),
+            codes, dictionaries,
+            np.concatenate([store.session_user for store in stores]),
+            np.concatenate(session_epochs),
+            session_labels
+        )
+
+    def __len__(self):
+        return len(self.user_id)
+
+    def __getitem__(self, column):
+        return self.column(column)
+
+    @property
+    def columns(self):
+        """Names of the columns a store can produce."""
+        return ['user_id', 'event_timestamp'] + CATEGORICAL_COLUMNS + ['session_id']
+
+    @property
+    def nbytes(self):
+        """Memory held by the stored (non-derived) arrays in bytes."""
+        arrays = [self.user_id, self.timestamp, self.session_user, self.session_epoch]
+        arrays.extend(self.codes.values())
+        return sum(array.nbytes for array in arrays)
+
+    def take(self, indices):
+        """
+        Select rows by position.
+
+        Args:
+            indices (np.ndarray or slice): Row positions, boolean mask or slice
+
+        Returns:
+            EventStore: New store with the selected rows (views for a slice)
+        """
+        return EventStore(
+            self.user_id[indices], self.timestamp[indices],
+            {column: codes[indices] for column, codes in self.codes.items()},
+            self.dictionaries, self.session_user[indices], self.session_epoch[indices],
+            self.session_labels, self.sorted_by_user and _keeps_order(indices)
+        )
+
+    def to_binary(self, directory, source_key=None):
+        """
+        Write the store as fixed-width column files for from_binary.
+
+        Each array goes to its own raw little-endian file (int32 user ids, int64
+        nanosecond timestamps, small-int dictionary codes with -1 for missing,
+        session parts); dictionaries, dtypes, the row count and the source key
+        go to a JSON sidecar written last.
+
+        Args:
+            directory (str): Output directory (created if needed)
+            source_key (str): Fingerprint of the raw files the events were
+                cleaned from (event_cache.source_key), read back by
+                binary_source_key
+
+        Returns:
+            str: The output directory
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        arrays = {name: getattr(self, name) for name in BINARY_ARRAYS}
+        arrays.update({f"codes_{column}": codes for column, codes in self.codes.items()})
+
+        dtypes = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+            array.tofile(os.path.join(directory, f"{name}.bin"))
+            dtypes[name] = array.dtype.str
+
+        with open(os.path.join(directory, BINARY_SIDECAR), 'w') as sidecar:
+            json.dump({
+                'format_version': BINARY_FORMAT_VERSION,
+                'rows': len(self),
+                'dtypes': dtypes,
+                'dictionaries': self.dictionaries,
+                'session_labels': self.session_labels,
+                'sorted_by_user': self.sorted_by_user,
+                'source_key': source_key
+            }, sidecar)
+
+        return directory
+
+    @staticmethod
+    def binary_source_key(directory):
+        """
+        Return the source key stored by to_binary.
+
+        Args:
+            directory (str): Directory written by to_binary
+
+        Returns:
+            str: The stored source key, or None if the directory holds no
+                export or the export was written without one
+        """
+        try:
+            with open(os.path.join(directory, BINARY_SIDECAR)) as sidecar:
+                return json.load(sidecar).get('source_key')
+        except (OSError, ValueError):
+            return None
+
+    def cleaned(self):
+        """
+        Drop incomplete and duplicate events and sort by user and time.
+
+        The sort is skipped when the store is already sorted_by_user.
+
+        Returns:
+            EventStore: Cleaned store
+        """
+        complete = (self.codes['event_type'] >= 0) & (self.timestamp != np.iinfo(np.int64).min)
+        store = self.take(np.flatnonzero(complete)) if not complete.all() else self
+
+        if not store.sorted_by_user:
+            order = np.lexsort((store.codes['event_type'], store.timestamp, store.user_id))
+            store = store.take(order)
+            store.sorted_by_user = True
+
+        # Duplicates (same user, event, timestamp) are now adjacent
+        keep = np.ones(len(store), dtype=bool)
+        keep[1:] = (
+            (store.user_id[1:] != store.user_id[:-1])
+            | (store.timestamp[1:] != store.timestamp[:-1])
+            | (store.codes['event_type'][1:] != store.codes['event_type'][:-1])
+        )
+        return store.take(np.flatnonzero(keep)) if not keep.all() else store
+
+    def user_index(self):
+        """
+        Return the offset index of the users' row ranges.
+
+        Returns:
+            UserIndex: Index over this (sorted_by_user) store
+        """
+        if not self.sorted_by_user:
+            raise ValueError("The store is not sorted by user; call cleaned() first")
+        return self._lazy('user_index', lambda: UserIndex.from_sorted(self.user_id))
+
+    def journey(self, user_id, columns=None):
+        """
+        Return one user's events in time order.
+
+        Args:
+            user_id (int): User id
+            columns (list): Columns to include (defaults to the stored columns)
+
+        Returns:
+            pd.DataFrame: The user's events
+        """
+        return self.take(self.user_index().rows(user_id)).to_frame(columns)
+
+    def session_key(self):
+        """
+        Return one int64 key per event identifying its session.
+
+        Returns:
+            np.ndarray: Keys that are equal exactly when the session ids are equal
+        """
+        if 'session_key' not in self._derived:
+            epochs = self.session_epoch
+            if len(epochs) == 0 or (epochs.min() >= 0 and epochs.max() < (1 << SESSION_EPOCH_BITS)):
+                key = (self.session_user.astype(np.int64) << SESSION_EPOCH_BITS) | epochs
+            else:
+                key = pd.MultiIndex.from_arrays([self.session_user, epochs]).factorize()[0].astype(np.int64)
+            self._derived['session_key'] = key
+        return self._derived['session_key']
+
+    def session_ids(self):
+        """
+        Rebuild the original session id strings.
+
+        Returns:
+            pd.Series: 'sess_<user>_<epoch>' strings
+        """
+        parsed = self.session_user >= 0
+        ids = pd.Series('sess_', index=range(len(self)), dtype=object)
+        ids[parsed] = (
+            'sess_' + pd.Series(self.session_user[parsed]).astype(str)
+            + '_' + pd.Series(self.session_epoch[parsed]).astype(str)
+        ).to_numpy()
+
+        labels = np.asarray(self.session_labels + [None], dtype=object)
+        unparsed = np.flatnonzero(~parsed)
+        ids[unparsed] = labels[self.session_epoch[unparsed]]
+        return ids
+
+    def _lazy(self, name, compute):
+        """Compute a derived array once and keep it."""
+        if name not in self._derived:
+            self._derived[name] = compute()
+        return self._derived[name]
+
+    @property
+    def hour(self):
+        """Hour of day of every event."""
+        return self._lazy('hour', lambda: ((self.timestamp // NANOS_PER_HOUR) % 24).astype(np.int8))
+
+    @property
+    def day_number(self):
+        """Days since 1970-01-01 of every event."""
+        return self._lazy('day_number', lambda: (self.timestamp // NANOS_PER_DAY).astype(np.int32))
+
+    @property
+    def date(self):
+        """Calendar date of every event."""
+        return self._lazy('date', lambda: self.day_number.astype('datetime64[D]'))
+
+    @property
+    def day_of_week(self):
+        """Day of week of every event (Monday=0); 1970-01-01 was a Thursday."""
+        return self._lazy('day_of_week', lambda: ((self.day_number.astype(np.int64) + 3) % 7).astype(np.int8))
+
+    @property
+    def month(self):
+        """Calendar month (1-12) of every event."""
+        return self._lazy(
+            'month',
+            lambda: (self.date.astype('datetime64[M]').astype(np.int64) % 12 + 1).astype(np.int8)
+        )
+
+    @property
+    def week_number(self):
+        """ISO week number of every event."""
+        return self._lazy(
+            'week_number',
+            lambda: pd.DatetimeIndex(self.date).isocalendar()['week'].to_numpy(np.int8)
+        )
+
+    @property
+    def funnel_step(self):
+        """Funnel step of every event (NaN for events outside FUNNEL_ORDER)."""
+        def compute():
+            steps = np.array(
+                [FUNNEL_ORDER.get(event, np.nan) for event in self.dictionaries['event_type']] + [np.nan]
+            )
+            return steps[self.codes['event_type']]
+        return self._lazy('funnel_step', compute)
+
+    def column(self, name):
+        """
+        Materialize one column as a pandas Series.
+
+        Categorical columns share the stored code arrays, session_id is the
+        integer session key, and derived time fields are computed on demand.
+
+        Args:
+            name (str): Column name
+
+        Returns:
+            pd.Series: Column values
+        """
+        if name == 'user_id':
+            values = self.user_id
+        elif name == 'event_timestamp':
+            values = self.timestamp.view('datetime64[ns]')
+        elif name in self.codes:
+            values = pd.Categorical.from_codes(self.codes[name], categories=self.dictionaries[name])
+        elif name == 'session_id':
+            values = self.session_key()
+        elif name in ('hour', 'date', 'day_of_week', 'week_number', 'month', 'funnel_step'):
+            values = getattr(self, name)
+        else:
+            raise KeyError(name)
+        return pd.Series(values, name=name, copy=False)
+
+    def to_frame(self, columns=None):
+        """
+        Materialize the store as a compact DataFrame.
+
+        Args:
+            columns (list): Columns to include (defaults to the stored columns)
+
+        Returns:
+            pd.DataFrame: Events with categorical and integer columns
+        """
+        columns = columns or self.columns
+        # copy=False keeps the stored arrays (e.g. memory-mapped files) as the column data
+        return pd.DataFrame({name: self.column(name) for name in columns}, copy=False)
+
+    def to_cleaned_frame(self):
+        """
+        Materialize the store in the schema of the pandas pipeline's cleaned events.
+
+        Unlike to_frame, session ids are rebuilt as their original strings, the
+        time features are materialized and funnel steps are integers when every
+        event has one, so exports do not depend on how the events were held.
+
+        Returns:
+            pd.DataFrame: Events with the CLEANED_COLUMNS
+        """
+        frame = self.to_frame([name for name in CLEANED_COLUMNS if name not in ('session_id', 'date')])
+        frame.insert(CLEANED_COLUMNS.index('session_id'), 'session_id', self.session_ids().to_numpy())
+        frame.insert(CLEANED_COLUMNS.index('date'), 'date', pd.Series(self.date).dt.date.to_numpy())
+        if not frame['funnel_step'].isna().any():
+            frame['funnel_step'] = frame['funnel_step'].astype(np.int64)
+        return frame
+
+
+def _code_dtype(n_values):
+    """Return the smallest signed integer type holding codes 0..n_values-1 and -1."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_values <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
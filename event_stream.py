@@ -0,0 +1,358 @@
+"""
+Event Streaming Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Fold large user event exports into journey and funnel aggregates chunk by chunk
+"""
+
+import numpy as np
+import pandas as pd
+
+from funnel_engine import CONVERSION_FLAGS, FUNNEL_ORDER, FUNNEL_STEPS, FunnelEngine
+from timestamp_parser import parse_timestamp_column
+
+# Column types used when reading user_events.csv
+EVENT_DTYPES = {
+    'user_id': 'int32',
+    'event_type': 'category',
+    'platform': 'category',
+    'country': 'category',
+    'traffic_source': 'category'
+}
+
+ATTRIBUTE_COLUMNS = ['platform', 'country', 'traffic_source']
+
+# Event types are tracked per user as bits of a uint64 mask
+MAX_EVENT_TYPES = 64
+
+
+def read_event_chunks(events_path, chunksize=1_000_000):
+    """
+    Read user_events.csv lazily with compact dtypes.
+
+    Chunks are yielded in file order; EventStreamAggregator.consume needs the
+    file sorted by user_id (as the exports are written).
+
+    Args:
+        events_path (str): Path to user events CSV file
+        chunksize (int): Rows per chunk
+
+    Yields:
+        pd.DataFrame: Chunk with parsed event_timestamp
+    """
+    for chunk in pd.read_csv(events_path, dtype=EVENT_DTYPES, chunksize=chunksize):
+        chunk['event_timestamp'] = parse_timestamp_column(chunk['event_timestamp'])
+        yield chunk
+
+
+def popcount(values):
+    """Count set bits of a uint64 array."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int64)
+    bits = np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1)
+    return bits.sum(axis=1).astype(np.int64)
+
+
+def group_starts(keys):
+    """Return the start index of every run of equal values in a sorted array."""
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+
+
+def merge_positions(left, right):
+    """
+    Place the elements of two sorted arrays in their merged order.
+
+    Equal elements of right go after those of left, so scattering both arrays
+    to these positions is a stable merge without sorting the concatenation.
+
+    Args:
+        left (np.ndarray): Sorted array
+        right (np.ndarray): Sorted array
+
+    Returns:
+        tuple: (positions of left, positions of right) in the merged array
+    """
+    left_positions = np.arange(len(left)) + np.searchsorted(right, left, side='left')
+    right_positions = np.arange(len(right)) + np.searchsorted(left, right, side='right')
+    return left_positions, right_positions
+
+
+def merge_sorted(left, right):
+    """Merge two sorted arrays into one sorted array."""
+    merged = np.empty(len(left) + len(right), dtype=np.result_type(left, right))
+    left_positions, right_positions = merge_positions(left, right)
+    merged[left_positions] = left
+    merged[right_positions] = right
+    return merged
+
+
+class EventStreamAggregator:
+    """
+    Incremental journey and funnel aggregates over a stream of event chunks.
+
+    I use this when the events export is too large to load at once. Each chunk
+    is reduced to one row per user (first/last event, event count, event type
+    bitmask, max funnel step, first-touch attributes, session count) and
+    merged into the running per-user state, which stays sorted by user, so
+    peak memory is one chunk plus the per-user state.
+
+    Duplicate events are removed within each chunk; the exports are written in
+    user and time order, so duplicates never straddle a chunk boundary there.
+    For the same reason only the last user of a chunk can continue in the next
+    one: distinct sessions are counted per chunk and only that user's session
+    keys are carried over, which keeps the counts exact. Input that is not
+    sorted by user_id would make those counts wrong, so add_chunk raises a
+    ValueError as soon as a user_id decreases.
+    """
+
+    def __init__(self, steps=None, conversion_flags=None):
+        """
+        Initialize an empty aggregator.
+
+        Args:
+            steps (list): Funnel event types for the funnel metrics
+            conversion_flags (dict): Journey flag column -> event type
+        """
+        self.steps = list(steps) if steps is not None else list(FUNNEL_STEPS)
+        self.conversion_flags = dict(conversion_flags or CONVERSION_FLAGS)
+        self.rows_read = 0
+        self.rows_kept = 0
+
+        self._dictionaries = {column: {} for column in ['event_type'] + ATTRIBUTE_COLUMNS}
+        self._state = None
+        self._open_sessions = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64))
+        self._last_user = np.iinfo(np.int64).min
+
+    def consume(self, events_path, chunksize=1_000_000):
+        """
+        Stream an events CSV file through the aggregator.
+
+        The file must be sorted by user_id (rows of a user may be in any time
+        order); a ValueError is raised otherwise.
+
+        Args:
+            events_path (str): Path to user events CSV file
+            chunksize (int): Rows per chunk
+
+        Returns:
+            EventStreamAggregator: The updated aggregator
+        """
+        for chunk in read_event_chunks(events_path, chunksize):
+            self.add_chunk(chunk)
+        return self
+
+    def _encode(self, column, values):
+        """Map a chunk's values onto the aggregator-wide dictionary codes."""
+        categorical = pd.Categorical(values)
+        lookup = self._dictionaries[column]
+        for value in categorical.categories:
+            if value not in lookup:
+                lookup[value] = len(lookup)
+
+        if len(categorical.categories) == 0:
+            return np.full(len(categorical), -1, dtype=np.int32)
+
+        mapping = np.array([lookup[value] for value in categorical.categories], dtype=np.int32)
+        codes = categorical.codes
+        return np.where(codes >= 0, mapping[codes], -1).astype(np.int32)
+
+    def add_chunk(self, chunk):
+        """
+        Fold one chunk of events into the per-user state.
+
+        Args:
+            chunk (pd.DataFrame): Events with parsed event_timestamp
+        """
+        self.rows_read += len(chunk)
+
+        chunk = self._filter_chunk(chunk)
+        self.rows_kept += len(chunk)
+        if len(chunk) == 0:
+            return
+
+        chunk_users = users = chunk['user_id'].to_numpy(np.int64)
+        timestamps = chunk['event_timestamp'].to_numpy('datetime64[ns]').view(np.int64)
+        event_codes = self._encode('event_type', chunk['event_type'])
+        if len(self._dictionaries['event_type']) > MAX_EVENT_TYPES:
+            raise ValueError(f"Streaming mode supports at most {MAX_EVENT_TYPES} event types")
+
+        attributes = {column: self._encode(column, chunk[column]) for column in ATTRIBUTE_COLUMNS}
+        session_hashes = pd.util.hash_pandas_object(chunk['session_id'], index=False).to_numpy()
+
+        order = np.lexsort((timestamps, users))
+        users, timestamps, event_codes = users[order], timestamps[order], event_codes[order]
+        starts = group_starts(users)
+
+        step_by_code = np.array(
+            [FUNNEL_ORDER.get(event, np.nan) for event in self._dictionaries['event_type']],
+            dtype=float
+        )
+        event_bits = np.left_shift(np.uint64(1), event_codes.astype(np.uint64))
+
+        partial = {
+            'user_id': users[starts],
+            'first_event': timestamps[starts],
+            'last_event': np.maximum.reduceat(timestamps, starts),
+            'total_events': np.diff(np.append(starts, len(users))),
+            'event_mask': np.bitwise_or.reduceat(event_bits, starts),
+            'max_funnel_step': np.fmax.reduceat(step_by_code[event_codes], starts)
+        }
+        for column, codes in attributes.items():
+            partial[column] = codes[order][starts]
+
+        self._extend_partial(partial, timestamps, session_hashes[order], starts)
+        self._count_sessions(partial, users, session_hashes[order], chunk_users)
+        self._merge_state(partial)
+
+    def _filter_chunk(self, chunk):
+        """Drop incomplete and duplicate events from a chunk."""
+        chunk = chunk.dropna(subset=['user_id', 'event_type', 'event_timestamp'])
+        return chunk.drop_duplicates(subset=['user_id', 'event_type', 'event_timestamp'])
+
+    def _extend_partial(self, partial, timestamps, session_hashes, starts):
+        """Hook for subclasses to add per-user columns from a sorted chunk."""
+
+    def _merge_extras(self, state, combined, starts):
+        """Hook for subclasses to merge the per-user columns they added."""
+
+    def _count_sessions(self, partial, users, session_hashes, chunk_users):
+        """
+        Add the number of new distinct sessions of every user in a sorted chunk.
+
+        Only the last user's session keys are kept for the next chunk, so a
+        user_id that decreases within or across chunks raises a ValueError.
+
+        Args:
+            partial (dict): The chunk's per-user rows
+            users (np.ndarray): User id per event, sorted by user
+            session_hashes (np.ndarray): uint64 session key per event
+            chunk_users (np.ndarray): User id per event in input order; the
+                last user's sessions may continue in the next chunk
+        """
+        if chunk_users[0] < self._last_user or np.any(chunk_users[1:] < chunk_users[:-1]):
+            raise ValueError(
+                "Streaming mode needs events sorted by user_id; sort the export "
+                "or load it without chunksize"
+            )
+        last_user = self._last_user = chunk_users[-1]
+
+        open_users, open_hashes = self._open_sessions
+        users = np.concatenate([open_users, users])
+        session_hashes = np.concatenate([open_hashes, session_hashes])
+
+        order = np.lexsort((session_hashes, users))
+        users, session_hashes = users[order], session_hashes[order]
+        keep = np.ones(len(users), dtype=bool)
+        keep[1:] = (users[1:] != users[:-1]) | (session_hashes[1:] != session_hashes[:-1])
+        users, session_hashes = users[keep], session_hashes[keep]
+
+        starts = group_starts(users)
+        counts = np.diff(np.append(starts, len(users)))
+        session_count = counts[np.searchsorted(users[starts], partial['user_id'])]
+
+        # The carried-over sessions were counted with the previous chunk
+        if len(open_users):
+            session_count[partial['user_id'] == open_users[0]] -= len(open_users)
+        partial['session_count'] = session_count
+
+        still_open = users == last_user
+        self._open_sessions = (users[still_open], session_hashes[still_open])
+
+    def _merge_state(self, partial):
+        """Merge a chunk's per-user rows into the running state (both sorted by user)."""
+        if self._state is None:
+            self._state = partial
+            return
+
+        # Every user has at most one state row and one chunk row; the merge
+        # puts them next to each other, the state row first
+        state_positions, partial_positions = merge_positions(self._state['user_id'], partial['user_id'])
+        combined = {}
+        for key, values in partial.items():
+            merged = np.empty(len(state_positions) + len(partial_positions), dtype=values.dtype)
+            merged[state_positions] = self._state[key]
+            merged[partial_positions] = values
+            combined[key] = merged
+        starts = group_starts(combined['user_id'])
+
+        # The row with the earliest event carries the first-touch attributes
+        pairs = np.flatnonzero(np.diff(np.append(starts, len(combined['user_id']))) == 2)
+        first_rows = starts.copy()
+        later = combined['first_event'][starts[pairs] + 1] < combined['first_event'][starts[pairs]]
+        first_rows[pairs[later]] += 1
+
+        state = {key: combined[key][first_rows] for key in ['user_id', 'first_event'] + ATTRIBUTE_COLUMNS}
+        state['last_event'] = np.maximum.reduceat(combined['last_event'], starts)
+        state['total_events'] = np.add.reduceat(combined['total_events'], starts)
+        state['event_mask'] = np.bitwise_or.reduceat(combined['event_mask'], starts)
+        state['max_funnel_step'] = np.fmax.reduceat(combined['max_funnel_step'], starts)
+        if 'session_count' in combined:
+            state['session_count'] = np.add.reduceat(combined['session_count'], starts)
+        self._merge_extras(state, combined, starts)
+        self._state = state
+
+    def _decode(self, column, codes):
+        """Turn dictionary codes back into a categorical column."""
+        categories = list(self._dictionaries[column])
+        return pd.Categorical.from_codes(codes, categories=categories)
+
+    def _event_flags(self, event_type):
+        """Return a 0/1 array marking users who had the given event type."""
+        code = self._dictionaries['event_type'].get(event_type)
+        if code is None:
+            return np.zeros(len(self._state['user_id']), dtype=np.int64)
+        bits = np.right_shift(self._state['event_mask'], np.uint64(code)) & np.uint64(1)
+        return bits.astype(np.int64)
+
+    def _session_counts(self):
+        """Return the number of distinct sessions of every user in the state."""
+        return self._state['session_count']
+
+    def journey_summary(self):
+        """
+        Build the user journey summary from the streamed state.
+
+        Returns:
+            pd.DataFrame: Same columns as DataPreprocessor.create_user_journey_summary
+        """
+        state = self._state
+        total_sessions = self._session_counts()
+
+        summary = pd.DataFrame({
+            'user_id': state['user_id'],
+            'first_event': pd.to_datetime(state['first_event']),
+            'last_event': pd.to_datetime(state['last_event']),
+            'total_events': state['total_events'],
+            'unique_event_types': popcount(state['event_mask']),
+            'max_funnel_step': state['max_funnel_step'],
+            'total_sessions': total_sessions
+        })
+        for column in ATTRIBUTE_COLUMNS:
+            summary[column] = self._decode(column, state[column])
+
+        summary['session_duration_hours'] = (
+            (summary['last_event'] - summary['first_event']).dt.total_seconds() / 3600
+        )
+
+        for flag, event_type in self.conversion_flags.items():
+            summary[flag] = self._event_flags(event_type)
+
+        return summary
+
+    def funnel_engine(self):
+        """
+        Build a FunnelEngine from the streamed event type masks.
+
+        Returns:
+            FunnelEngine: Engine over the streamed users
+        """
+        reached = np.column_stack([self._event_flags(step).astype(bool) for step in self.steps])
+        return FunnelEngine.from_reached(self._state['user_id'], reached, steps=self.steps)
+
+    def date_range(self):
+        """Return the earliest and latest event timestamps seen."""
+        return (
+            pd.Timestamp(self._state['first_event'].min()),
+            pd.Timestamp(self._state['last_event'].max())
+        )
@@ -0,0 +1,275 @@
+"""
+Funnel Engine Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Compute funnel step reach for every user in a single pass over the events
+"""
+
+import numpy as np
+import pandas as pd
+
+from timestamp_parser import timestamp_nanos
+
+# Funnel step ordering shared by the preprocessing and visualization modules
+FUNNEL_ORDER = {
+    'landing_page_view': 1,
+    'signup_page_view': 2,
+    'email_verification': 3,
+    'profile_setup': 4,
+    'first_product_view': 5,
+    'add_to_cart': 6,
+    'checkout_start': 7,
+    'payment_info_entered': 8,
+    'purchase_completed': 9,
+    'app_download': 10,
+    'first_login_app': 11
+}
+
+# Core onboarding funnel reported in the metrics and charts
+FUNNEL_STEPS = [
+    'landing_page_view', 'signup_page_view', 'email_verification',
+    'profile_setup', 'first_product_view', 'add_to_cart',
+    'checkout_start', 'payment_info_entered', 'purchase_completed'
+]
+
+# Journey summary flags: output column -> event type that sets it
+CONVERSION_FLAGS = {
+    'converted_to_purchase': 'purchase_completed',
+    'downloaded_app': 'app_download',
+    'completed_signup': 'email_verification'
+}
+
+# Sentinel reach time for users who never reached a step in ordered mode
+NOT_REACHED = np.iinfo(np.int64).max
+
+
+class FunnelEngine:
+    """
+    Shared funnel computation engine.
+
+    I built this engine so that the preprocessing pipeline and the visualizer
+    read their numbers from one user x step presence matrix. The matrix is
+    filled in a single pass over the events using categorical codes and kept
+    bit-packed (one bit per user and step) so it stays small at millions of users.
+
+    In ordered mode a user only reaches a step if every previous step happened
+    before it, optionally within a conversion window measured from the first step.
+    """
+
+    def __init__(self, steps=None, ordered=False, conversion_window=None):
+        """
+        Initialize the engine.
+
+        Args:
+            steps (list): Ordered funnel event types (defaults to FUNNEL_STEPS)
+            ordered (bool): Require steps to happen in funnel order
+            conversion_window (str or timedelta): Maximum time from the first step
+                to any later step in ordered mode, e.g. '7D' (no limit if None)
+        """
+        self.steps = list(steps) if steps is not None else list(FUNNEL_STEPS)
+        self.ordered = ordered or conversion_window is not None
+        self.conversion_window = (
+            pd.Timedelta(conversion_window) if conversion_window is not None else None
+        )
+        self.user_ids = None
+        self.reach_times = None
+        self.presence = None
+        self.step_users = None
+        self.total_users = 0
+
+    @classmethod
+    def from_reached(cls, user_ids, reached, steps=None):
+        """
+        Build an engine from an already computed presence matrix.
+
+        Args:
+            user_ids (array-like): User ids, one per matrix row
+            reached (np.ndarray): Boolean array of shape (users, steps)
+            steps (list): Funnel event types matching the matrix columns
+
+        Returns:
+            FunnelEngine: Engine with the given presence matrix
+        """
+        engine = cls(steps=steps)
+        engine.user_ids = pd.Index(user_ids)
+        engine._store(np.asarray(reached, dtype=bool))
+        return engine
+
+    @classmethod
+    def from_counts(cls, step_users, total_users, steps=None):
+        """
+        Build an engine from per-step user counts only (e.g. sketch estimates).
+
+        The engine has no presence matrix, so only the count based methods
+        (users_at_step, metrics, step_summary) are available.
+
+        Args:
+            step_users (array-like): Users reaching each step
+            total_users (int): Users in the whole population
+            steps (list): Funnel event types matching step_users
+
+        Returns:
+            FunnelEngine: Engine with the given counts
+        """
+        engine = cls(steps=steps)
+        engine.step_users = np.asarray(step_users, dtype=np.int64)
+        engine.total_users = int(total_users)
+        return engine
+
+    def fit(self, events_df, user_index=None):
+        """
+        Build the user x step presence matrix from an events frame.
+
+        Args:
+            events_df (pd.DataFrame): Events with user_id and event_type columns
+            user_index (UserIndex): Offset index of events_df when it is sorted by
+                user and time; replaces the user factorization and the order check
+
+        Returns:
+            FunnelEngine: The fitted engine
+        """
+        if user_index is not None:
+            user_codes, self.user_ids = user_index.user_codes(), pd.Index(user_index.user_ids)
+        else:
+            user_codes, self.user_ids = pd.factorize(events_df['user_id'], sort=True)
+        step_codes = pd.Categorical(events_df['event_type'], categories=self.steps).codes
+
+        valid = (user_codes >= 0) & (step_codes >= 0)
+
+        if self.ordered:
+            timestamps = timestamp_nanos(events_df['event_timestamp'])
+            self.reach_times = self._ordered_reach_times(
+                user_codes[valid], step_codes[valid], timestamps[valid], presorted=user_index is not None
+            )
+            self._store(self.reach_times != NOT_REACHED)
+            return self
+
+        reached = np.zeros((len(self.user_ids), len(self.steps)), dtype=bool)
+        reached[user_codes[valid], step_codes[valid]] = True
+
+        self._store(reached)
+        return self
+
+    def _ordered_reach_times(self, user_codes, step_codes, timestamps, presorted=False):
+        """
+        Find when each user reached each step under the ordered-funnel rules.
+
+        Events are scanned as sorted arrays: one stable counting sort groups the
+        events by step while keeping them in (user, timestamp) order, so each step
+        only looks at its own events and the first qualifying event per user is
+        simply the first one after a user boundary. Total work is linear in the
+        number of events.
+
+        Args:
+            user_codes (np.ndarray): Dense user codes per event
+            step_codes (np.ndarray): Funnel step codes per event
+            timestamps (np.ndarray): Event times as int64 nanoseconds
+            presorted (bool): Events are known to be in (user, time) order
+
+        Returns:
+            np.ndarray: int64 array (users, steps) of reach times, NOT_REACHED if never
+        """
+        # Events from clean_user_events are already sorted by user and time
+        in_order = presorted or np.all(
+            (user_codes[1:] > user_codes[:-1])
+            | ((user_codes[1:] == user_codes[:-1]) & (timestamps[1:] >= timestamps[:-1]))
+        )
+        if not in_order:
+            order = np.lexsort((timestamps, user_codes))
+            user_codes, step_codes, timestamps = user_codes[order], step_codes[order], timestamps[order]
+
+        by_step = np.argsort(step_codes, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(step_codes, minlength=len(self.steps)))])
+
+        n_users = len(self.user_ids)
+        reach_times = np.full((n_users, len(self.steps)), NOT_REACHED, dtype=np.int64)
+        previous = np.full(n_users, np.iinfo(np.int64).min, dtype=np.int64)
+        deadline = np.full(n_users, NOT_REACHED, dtype=np.int64)
+
+        for k in range(len(self.steps)):
+            idx = by_step[bounds[k]:bounds[k + 1]]
+            users, times = user_codes[idx], timestamps[idx]
+
+            eligible = (times >= previous[users]) & (times <= deadline[users])
+            users, times = users[eligible], times[eligible]
+
+            first = np.ones(len(users), dtype=bool)
+            first[1:] = users[1:] != users[:-1]
+            reach_times[users[first], k] = times[first]
+
+            previous = reach_times[:, k]
+            if k == 0 and self.conversion_window is not None:
+                deadline = np.where(
+                    previous != NOT_REACHED,
+                    previous + self.conversion_window.value,
+                    np.iinfo(np.int64).min
+                )
+
+        return reach_times
+
+    def _store(self, reached):
+        """Pack the boolean presence matrix and cache per-step user counts."""
+        self.presence = np.packbits(reached, axis=1)
+        self.step_users = reached.sum(axis=0).astype(np.int64)
+        self.total_users = len(self.user_ids)
+
+    def reached_matrix(self):
+        """
+        Return the unpacked presence matrix.
+
+        Returns:
+            np.ndarray: Boolean array of shape (users, steps)
+        """
+        return np.unpackbits(self.presence, axis=1, count=len(self.steps)).astype(bool)
+
+    def users_at_step(self):
+        """
+        Return the number of distinct users reaching each step.
+
+        Returns:
+            pd.Series: User counts indexed by event type
+        """
+        return pd.Series(self.step_users, index=self.steps, name='users_at_step')
+
+    def metrics(self):
+        """
+        Derive step conversion, overall conversion and drop-off for every step.
+
+        Returns:
+            pd.DataFrame: One row per funnel step
+        """
+        users = self.step_users.astype(float)
+
+        previous = np.concatenate([users[:1], users[:-1]])
+        step_conversion = np.divide(users, previous, out=np.zeros_like(users), where=previous > 0) * 100
+        overall_conversion = np.divide(users, users[0], out=np.zeros_like(users), where=users[0] > 0) * 100
+
+        step_conversion[0] = 100.0
+        overall_conversion[0] = 100.0
+        drop_off = 100 - step_conversion
+        drop_off[0] = 0
+
+        return pd.DataFrame({
+            'step': np.arange(1, len(self.steps) + 1),
+            'event_type': self.steps,
+            'event_label': [event.replace('_', ' ').title() for event in self.steps],
+            'users_at_step': self.step_users,
+            'step_conversion_rate': step_conversion,
+            'overall_conversion_rate': overall_conversion,
+            'drop_off_rate': drop_off
+        })
+
+    def step_summary(self):
+        """
+        Summarize users and conversion rate (against all users) for every step.
+
+        Returns:
+            dict: Step event type -> {'users', 'conversion_rate'}
+        """
+        total = self.total_users
+        return {
+            event: {
+                'users': int(users),
+                'conversion_rate': (users / total) * 100 if total > 0 else 0
+            }
+            for event, users in zip(self.steps, self.step_users)
+        }
@@ -0,0 +1,327 @@
+"""
+Incremental Pipeline Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Merge each new day of events into persisted per-user journey state
+"""
+
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from event_stream import EventStreamAggregator, group_starts, merge_sorted, popcount, read_event_chunks
+from timestamp_parser import parse_timestamp_column
+
+NANOS_PER_DAY = 86_400_000_000_000
+
+# Week activity and session sketches are kept as one uint64 bitmap per user
+BITMAP_BITS = 64
+
+# Days of the dedup key index kept in memory after a save (behind the newest
+# event seen); older days are reloaded from their files when a late event needs them
+KEY_CACHE_DAYS = 7
+
+STATE_FILE = 'journey_state.npz'
+KEYS_DIR = 'event_keys'
+META_FILE = 'journey_state.json'
+
+
+def event_keys(events_df):
+    """
+    Hash (user_id, event_type, event_timestamp) into one uint64 per event.
+
+    Args:
+        events_df (pd.DataFrame): Events with parsed event_timestamp
+
+    Returns:
+        np.ndarray: uint64 dedup keys
+    """
+    key_columns = pd.DataFrame({
+        'user_id': events_df['user_id'].to_numpy(np.int64),
+        'event_type': events_df['event_type'].astype(str).to_numpy(),
+        'event_timestamp': events_df['event_timestamp'].to_numpy('datetime64[ns]').view(np.int64)
+    })
+    return pd.util.hash_pandas_object(key_columns, index=False).to_numpy()
+
+
+def week_index(timestamps):
+    """Return Monday-based week numbers since the epoch for int64 nanosecond times."""
+    return (timestamps // NANOS_PER_DAY + 3) // 7
+
+
+def _shift_bits(bitmaps, shifts):
+    """Shift uint64 bitmaps left, dropping bitmaps shifted past BITMAP_BITS."""
+    inside = shifts < BITMAP_BITS
+    shifted = np.left_shift(bitmaps, np.minimum(shifts, BITMAP_BITS - 1).astype(np.uint64))
+    return np.where(inside, shifted, np.uint64(0))
+
+
+class IncrementalJourneyStore(EventStreamAggregator):
+    """
+    Persisted per-user journey state updated one batch of events at a time.
+
+    I built this for the nightly job: instead of reprocessing the full history,
+    the new day's events are folded into the stored per-user state (first/last
+    event, event counts, event type bitmask, max funnel step, first-touch
+    attributes) with the same merge rules as the streaming loader. The state
+    also keeps a 64-bit linear-counting sketch of each user's sessions and a
+    bitmap of the weeks (since the user's cohort week) in which they were active,
+    which is enough to rebuild the journey summary, funnel metrics and weekly
+    cohort retention without touching old events.
+
+    Late events simply move first_event/cohort week backwards during the merge.
+    Duplicates are caught by sorted indexes of 64-bit event key hashes, one file
+    per event day, so an event that is delivered twice on different nights is
+    only counted once. A night only loads the days its events fall on (recent
+    days stay in memory), so the nightly cost does not grow with the stored
+    history, however late an event arrives. An optional lateness cutoff drops
+    events older than that behind the newest stored event, with a warning.
+    """
+
+    def __init__(self, state_dir, steps=None, conversion_flags=None, lateness=None):
+        """
+        Open (or create) the persisted state.
+
+        Args:
+            state_dir (str): Directory holding the state files
+            steps (list): Funnel event types for the funnel metrics
+            conversion_flags (dict): Journey flag column -> event type
+            lateness (str or timedelta): Optional cutoff: events further behind
+                the newest stored event are dropped as expired (by default
+                every late event is deduplicated and merged)
+        """
+        super().__init__(steps=steps, conversion_flags=conversion_flags)
+        self.state_dir = state_dir
+        self.lateness = pd.Timedelta(lateness) if lateness is not None else None
+        self.high_water_mark = np.iinfo(np.int64).min
+        self.saved_high_water_mark = self.high_water_mark
+        self.duplicates_skipped = 0
+        self.late_events = 0
+        self.expired_events = 0
+
+        self._day_keys = {}
+        self._changed_days = set()
+        self._load()
+
+    def _load(self):
+        """Restore the persisted state if it exists."""
+        meta_path = os.path.join(self.state_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            return
+
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+
+        self._dictionaries = {
+            column: {value: code for code, value in enumerate(values)}
+            for column, values in meta['dictionaries'].items()
+        }
+        self.high_water_mark = self.saved_high_water_mark = meta['high_water_mark']
+
+        with np.load(os.path.join(self.state_dir, STATE_FILE)) as arrays:
+            self._state = {name: arrays[name] for name in arrays.files}
+
+    def save(self):
+        """Persist the state, dictionaries and the changed days of the dedup key index."""
+        if self._state is None:
+            return
+
+        os.makedirs(os.path.join(self.state_dir, KEYS_DIR), exist_ok=True)
+
+        np.savez(os.path.join(self.state_dir, STATE_FILE), **self._state)
+        for day in self._changed_days:
+            np.save(self._keys_path(day), self._day_keys[day])
+        self._changed_days = set()
+
+        # Older days are reloaded from their files if a late event needs them
+        self.saved_high_water_mark = self.high_water_mark
+        first_cached_day = self.high_water_mark // NANOS_PER_DAY - KEY_CACHE_DAYS
+        self._day_keys = {day: keys for day, keys in self._day_keys.items() if day >= first_cached_day}
+
+        with open(os.path.join(self.state_dir, META_FILE), 'w') as meta_file:
+            json.dump({
+                'dictionaries': {column: list(lookup) for column, lookup in self._dictionaries.items()},
+                'high_water_mark': int(self.high_water_mark),
+                'users': len(self._state['user_id'])
+            }, meta_file, indent=2)
+
+    def append(self, events_df):
+        """
+        Merge a batch of events into the state (call save() to persist it).
+
+        Args:
+            events_df (pd.DataFrame): New events
+
+        Returns:
+            dict: Batch statistics
+        """
+        before = self._counters()
+
+        events_df = events_df.copy()
+        events_df['event_timestamp'] = parse_timestamp_column(events_df['event_timestamp'])
+        self.add_chunk(events_df)
+
+        return self._batch_stats(before)
+
+    def append_csv(self, events_path, chunksize=1_000_000):
+        """
+        Merge a day's events file into the state and persist it.
+
+        Args:
+            events_path (str): Path to the new events CSV file
+            chunksize (int): Rows per chunk
+
+        Returns:
+            dict: Batch statistics
+        """
+        before = self._counters()
+
+        for chunk in read_event_chunks(events_path, chunksize):
+            self.add_chunk(chunk)
+        self.save()
+
+        return self._batch_stats(before)
+
+    def _counters(self):
+        """Return the running row counters."""
+        return {
+            'rows_read': self.rows_read,
+            'new_events': self.rows_kept,
+            'duplicates_skipped': self.duplicates_skipped,
+            'late_events': self.late_events,
+            'expired_events': self.expired_events
+        }
+
+    def _batch_stats(self, before):
+        """Return how much the row counters moved since `before`."""
+        return {name: value - before[name] for name, value in self._counters().items()}
+
+    def _horizon(self):
+        """
+        Oldest event time that is still deduplicated and merged.
+
+        Without a lateness cutoff every event is. The horizon trails the newest
+        event of the saved state, so it does not move while a batch (e.g. an
+        unordered backfill) is being appended.
+        """
+        if self.lateness is None or self.saved_high_water_mark == np.iinfo(np.int64).min:
+            return np.iinfo(np.int64).min
+        return self.saved_high_water_mark - self.lateness.value
+
+    def _keys_path(self, day):
+        """Return the key index file of one event day."""
+        return os.path.join(self.state_dir, KEYS_DIR, f"{np.datetime64(int(day), 'D')}.npy")
+
+    def _keys_of_day(self, day):
+        """Return the sorted keys of one event day, loading them on first use."""
+        if day not in self._day_keys:
+            path = self._keys_path(day)
+            self._day_keys[day] = np.load(path) if os.path.exists(path) else np.zeros(0, dtype=np.uint64)
+        return self._day_keys[day]
+
+    def _filter_chunk(self, chunk):
+        """Drop incomplete, expired and in-batch duplicate events and events seen before."""
+        chunk = super()._filter_chunk(chunk)
+
+        timestamps = chunk['event_timestamp'].to_numpy('datetime64[ns]').view(np.int64)
+        expired = timestamps < self._horizon()
+        if expired.any():
+            warnings.warn(
+                f"Dropped {int(expired.sum())} events more than {self.lateness} behind the newest "
+                "stored event; they are not merged into the journey state"
+            )
+            self.expired_events += int(expired.sum())
+            chunk, timestamps = chunk[~expired], timestamps[~expired]
+
+        # Look the keys up day by day in that day's sorted index, then merge
+        # the new keys into it
+        keys = event_keys(chunk)
+        days = timestamps // NANOS_PER_DAY
+        order = np.argsort(days, kind='stable')
+        bounds = np.append(group_starts(days[order]), len(order))
+
+        seen = np.zeros(len(keys), dtype=bool)
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            rows = order[low:high]
+            day = int(days[rows[0]])
+            known = self._keys_of_day(day)
+
+            position = np.searchsorted(known, keys[rows])
+            found = position < len(known)
+            found[found] = known[position[found]] == keys[rows][found]
+            seen[rows] = found
+
+            if not found.all():
+                self._day_keys[day] = merge_sorted(known, np.sort(keys[rows][~found]))
+                self._changed_days.add(day)
+
+        self.duplicates_skipped += int(seen.sum())
+        chunk, timestamps = chunk[~seen], timestamps[~seen]
+
+        if len(timestamps):
+            self.late_events += int((timestamps < self.high_water_mark).sum())
+            self.high_water_mark = max(self.high_water_mark, int(timestamps.max()))
+
+        return chunk
+
+    def _extend_partial(self, partial, timestamps, session_hashes, starts):
+        """Add the week activity bitmap and session sketch for a sorted chunk."""
+        counts = np.diff(np.append(starts, len(timestamps)))
+        weeks = week_index(timestamps)
+        first_week = weeks[starts]
+
+        offsets = weeks - np.repeat(first_week, counts)
+        week_bits = _shift_bits(np.ones(len(weeks), dtype=np.uint64), offsets)
+        session_bits = np.left_shift(np.uint64(1), session_hashes % np.uint64(BITMAP_BITS))
+
+        partial['first_week'] = first_week
+        partial['active_weeks'] = np.bitwise_or.reduceat(week_bits, starts)
+        partial['session_sketch'] = np.bitwise_or.reduceat(session_bits, starts)
+
+    def _merge_extras(self, state, combined, starts):
+        """Merge week bitmaps (re-based on the earliest cohort week) and sketches."""
+        counts = np.diff(np.append(starts, len(combined['user_id'])))
+        cohort_week = np.minimum.reduceat(combined['first_week'], starts)
+
+        shifts = combined['first_week'] - np.repeat(cohort_week, counts)
+        shifted = _shift_bits(combined['active_weeks'], shifts)
+
+        state['first_week'] = cohort_week
+        state['active_weeks'] = np.bitwise_or.reduceat(shifted, starts)
+        state['session_sketch'] = np.bitwise_or.reduceat(combined['session_sketch'], starts)
+
+    def _count_sessions(self, partial, users, session_hashes, chunk_users):
+        """Sessions are tracked by the per-user sketch: a user's sessions span nights."""
+
+    def _session_counts(self):
+        """Estimate distinct sessions per user from the linear-counting sketch."""
+        empty = BITMAP_BITS - popcount(self._state['session_sketch'])
+        empty = np.maximum(empty, 1)
+        estimate = -BITMAP_BITS * np.log(empty / BITMAP_BITS)
+        return np.maximum(np.rint(estimate), 1).astype(np.int64)
+
+    def cohort_retention(self, horizon=13):
+        """
+        Weekly cohort retention from the stored week bitmaps.
+
+        Args:
+            horizon (int): Number of weeks after the cohort week (at most 64)
+
+        Returns:
+            pd.DataFrame: Retention rate per cohort week (rows) and week number
+        """
+        horizon = min(horizon, BITMAP_BITS)
+        active = (
+            self._state['active_weeks'][:, None] >> np.arange(horizon, dtype=np.uint64)
+        ) & np.uint64(1)
+
+        cohort_start = (self._state['first_week'] * 7 - 3).astype('datetime64[D]')
+        activity = pd.DataFrame(active.astype(np.int64), columns=range(horizon))
+        activity['cohort_group'] = pd.to_datetime(cohort_start)
+
+        grouped = activity.groupby('cohort_group')
+        retention = grouped.sum().div(grouped.size(), axis=0)
+        retention.columns.name = 'period_number'
+        return retention
@@ -0,0 +1,204 @@
+"""
+Instrumentation Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Record per-stage timing, memory and row counts of the preprocessing pipeline
+"""
+
+import contextlib
+import functools
+import json
+import os
+import resource
+import sys
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+PROC_STATUS = '/proc/self/status'
+PROC_CLEAR_REFS = '/proc/self/clear_refs'
+
+
+def _current_peak_rss():
+    """Peak resident set size of the process in bytes."""
+    try:
+        with open(PROC_STATUS) as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _reset_peak_rss():
+    """Reset the peak RSS counter (Linux only); returns whether it worked."""
+    try:
+        with open(PROC_CLEAR_REFS, 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _size(value):
+    """Rows and (shallow) bytes of a frame, store or dict; (None, None) if unknown."""
+    if value is None:
+        return None, None
+    if isinstance(value, pd.DataFrame):
+        return len(value), int(value.memory_usage(index=True, deep=False).sum())
+    if hasattr(value, 'nbytes') and hasattr(value, '__len__'):
+        return len(value), int(value.nbytes)
+    if hasattr(value, '__len__'):
+        return len(value), None
+    return None, None
+
+
+def _total(values):
+    """Sum of the known values, or None if none are known."""
+    known = [value for value in values if value is not None]
+    return sum(known) if known else None
+
+
+class Instrumentation:
+    """
+    Pluggable per-stage instrumentation for DataPreprocessor.
+
+    I attach one of these to a preprocessor to find the slow stage of a given
+    run. Each instrumented stage produces one record with wall and CPU time,
+    peak RSS and the rows and bytes of its input and output frames. Records are
+    kept in memory, handed to every registered callback and optionally appended
+    to a JSON-lines metrics file. The preprocessor's progress messages go
+    through log(), so verbose=False silences them in batch jobs.
+
+    With no instrumentation attached (the default) or enabled=False, stages run
+    without any measurement.
+    """
+
+    def __init__(self, enabled=True, verbose=True, callbacks=None, metrics_path=None):
+        """
+        Initialize the instrumentation.
+
+        Args:
+            enabled (bool): Record stage metrics
+            verbose (bool): Print progress messages
+            callbacks (list): Functions called with every stage record (dict)
+            metrics_path (str): JSON-lines file that stage records are appended to
+        """
+        self.enabled = enabled
+        self.verbose = verbose
+        self.callbacks = list(callbacks or [])
+        self.metrics_path = metrics_path
+        self.records = []
+        self._depth = 0
+
+    def add_callback(self, callback):
+        """
+        Register a function called with every stage record.
+
+        Args:
+            callback (callable): Receives the record dict
+        """
+        self.callbacks.append(callback)
+
+    def log(self, message):
+        """Print a progress message unless running silently."""
+        if self.verbose:
+            print(message)
+
+    @contextlib.contextmanager
+    def stage(self, name, owner=None, inputs=(), outputs=()):
+        """
+        Measure one pipeline stage.
+
+        Args:
+            name (str): Stage name
+            owner (object): Object holding the stage's input/output attributes
+            inputs (list): Attribute names read by the stage
+            outputs (list): Attribute names written by the stage
+
+        Yields:
+            dict: The record, which the stage may annotate
+        """
+        if not self.enabled:
+            yield {}
+            return
+
+        sizes_in = [_size(getattr(owner, attribute, None)) for attribute in inputs]
+        outermost = self._depth == 0
+        peak_reset = _reset_peak_rss() if outermost else False
+
+        record = {
+            'stage': name,
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'depth': self._depth
+        }
+        self._depth += 1
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            self._depth -= 1
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            sizes_out = [_size(getattr(owner, attribute, None)) for attribute in outputs]
+
+            record.update({
+                'wall_seconds': round(wall, 6),
+                'cpu_seconds': round(cpu, 6),
+                'peak_rss_mb': round(_current_peak_rss() / 1024 ** 2, 1),
+                'peak_rss_scope': 'stage' if peak_reset else 'process',
+                'rows_in': _total(rows for rows, _ in sizes_in),
+                'rows_out': _total(rows for rows, _ in sizes_out),
+                'bytes_in': _total(size for _, size in sizes_in),
+                'bytes_out': _total(size for _, size in sizes_out)
+            })
+            self._emit(record)
+
+    def _emit(self, record):
+        """Keep a finished record and hand it to the callbacks and metrics file."""
+        self.records.append(record)
+
+        for callback in self.callbacks:
+            callback(record)
+
+        if self.metrics_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.metrics_path)), exist_ok=True)
+            with open(self.metrics_path, 'a') as metrics_file:
+                metrics_file.write(json.dumps(record) + '\n')
+
+    def summary(self):
+        """
+        Return the recorded stages.
+
+        Returns:
+            pd.DataFrame: One row per stage record
+        """
+        return pd.DataFrame(self.records)
+
+
+def instrumented(name, inputs=(), outputs=()):
+    """
+    Decorate a DataPreprocessor method as an instrumented stage.
+
+    The wrapper only checks self.instrumentation; when it is None or disabled
+    the method is called directly.
+
+    Args:
+        name (str): Stage name
+        inputs (list): Attribute names read by the stage
+        outputs (list): Attribute names written by the stage
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = self.instrumentation
+            if instrumentation is None or not instrumentation.enabled:
+                return method(self, *args, **kwargs)
+
+            with instrumentation.stage(name, self, inputs, outputs):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,120 @@
+"""
+Parallel Preprocessing Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Run event cleaning and journey summaries on user_id shards in a process pool
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import build_user_journey_summary
+from event_store import EventStore
+from sessionization import DEFAULT_SESSION_TIMEOUT, Sessionizer
+
+
+def shard_ids(user_ids, n_shards):
+    """
+    Hash-partition users into shards.
+
+    Args:
+        user_ids (np.ndarray): User id of every event
+        n_shards (int): Number of shards
+
+    Returns:
+        np.ndarray: Shard number of every event
+    """
+    hashes = pd.util.hash_array(np.asarray(user_ids, dtype=np.int64))
+    return (hashes % np.uint64(n_shards)).astype(np.int32)
+
+
+def _process_shard(shard_dir, conversion_flags=None, session_timeout=DEFAULT_SESSION_TIMEOUT):
+    """
+    Clean one shard and build its journey summaries (runs in a worker process).
+
+    Sessions are reconstructed per user from inactivity gaps, so a shard counts
+    the same sessions as the whole data set would. The cleaned events are
+    written back next to the input so only the per-user summary travels back
+    to the parent process.
+    """
+    store = EventStore.from_binary(shard_dir).cleaned()
+    store.to_binary(os.path.join(shard_dir, 'cleaned'))
+
+    events = store.to_frame(store.columns + ['funnel_step'])
+    user_index = store.user_index()
+    sessions = Sessionizer(session_timeout).fit(events, user_index=user_index).event_sessions
+    return build_user_journey_summary(events, conversion_flags, user_index, session_ids=sessions)
+
+
+def run_parallel_preprocessing(preprocessor, n_workers=None, n_shards=None, conversion_flags=None,
+                               session_timeout=DEFAULT_SESSION_TIMEOUT):
+    """
+    Run clean_user_events, sessionization and create_user_journey_summary on user_id shards.
+
+    Every per-user computation is independent across users, so I hash-partition
+    the events by user_id, write each shard in the EventStore binary layout
+    (workers memory-map it, no large frames are pickled to them), process the
+    shards in a process pool and merge the results. Results match the EventStore path of DataPreprocessor.
+
+    Args:
+        preprocessor (DataPreprocessor): Preprocessor with loaded user events
+        n_workers (int): Worker processes (defaults to the CPU count)
+        n_shards (int): Number of user shards (defaults to n_workers)
+        conversion_flags (dict): Journey flag column -> event type
+        session_timeout (str or timedelta): Inactivity gap that ends a session
+
+    Returns:
+        pd.DataFrame: User journey summary
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    n_shards = n_shards or n_workers
+
+    preprocessor._log(f"⚙️ Preprocessing {n_shards} user shards on {n_workers} workers...")
+
+    store = preprocessor.event_store
+    if store is None:
+        store = EventStore.from_frame(preprocessor.user_events)
+    initial_rows = len(store)
+
+    with tempfile.TemporaryDirectory(prefix='funnel_shards_') as work_dir:
+        shards = shard_ids(store.user_id, n_shards)
+        order = np.argsort(shards, kind='stable')
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(shards, minlength=n_shards))])
+
+        shard_dirs = []
+        for shard in range(n_shards):
+            if bounds[shard] == bounds[shard + 1]:
+                continue
+            shard_dir = os.path.join(work_dir, f"shard_{shard:04d}")
+            store.take(order[bounds[shard]:bounds[shard + 1]]).to_binary(shard_dir)
+            shard_dirs.append(shard_dir)
+
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            summaries = list(pool.map(
+                _process_shard, shard_dirs,
+                [conversion_flags] * len(shard_dirs), [session_timeout] * len(shard_dirs)
+            ))
+
+        # Each cleaned shard is sorted by user, so a stable sort of the
+        # concatenation only has to merge n_shards sorted runs
+        cleaned = EventStore.concat([
+            EventStore.from_binary(os.path.join(shard_dir, 'cleaned')) for shard_dir in shard_dirs
+        ])
+        cleaned = cleaned.take(np.argsort(cleaned.user_id, kind='stable'))
+        cleaned.sorted_by_user = True
+
+    preprocessor.event_store = cleaned
+    preprocessor.user_events = cleaned.to_frame(cleaned.columns + ['funnel_step'])
+    preprocessor.user_index = cleaned.user_index()
+    preprocessor.user_journey_summary = (
+        pd.concat(summaries, ignore_index=True).sort_values('user_id').reset_index(drop=True)
+    )
+
+    cleaned_rows = len(cleaned)
+    preprocessor._log(f"✅ Cleaned events: {initial_rows} → {cleaned_rows} rows ({initial_rows-cleaned_rows} removed)")
+    preprocessor._log(f"✅ Created journey summaries for {len(preprocessor.user_journey_summary)} users")
+
+    return preprocessor.user_journey_summary
@@ -0,0 +1,311 @@
+"""
+Path Mining Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Top-K user journey paths and step transition matrices with bounded memory
+"""
+
+import numpy as np
+import pandas as pd
+
+from event_store import BLOCK_USERS, SEGMENT_COLUMNS, sorted_user_runs
+from event_stream import group_starts
+from funnel_engine import FUNNEL_ORDER
+from timestamp_parser import timestamp_nanos
+
+# Distinct paths tracked per segment; counts are exact while a segment has
+# no more distinct paths than this
+DEFAULT_CAPACITY = 4096
+
+PATH_SEPARATOR = ' → '
+
+# Pseudo event types framing every journey in the transition matrices
+START_STATE = 'start'
+EXIT_STATE = 'exit'
+OTHER_EVENT = 'other'
+
+
+class HeavyHitters:
+    """
+    Mergeable Misra-Gries summary of the most frequent int64 keys.
+
+    I keep at most capacity (key, count) pairs. A batch is folded in by adding
+    its exact counts; when more than capacity keys remain, the (capacity+1)-th
+    largest count is subtracted from every key and non-positive keys are
+    dropped. Each reported count is a lower bound that is at most
+    total / (capacity + 1) below the true count, and two summaries built on
+    any split of the data merge the same way.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """
+        Initialize an empty summary.
+
+        Args:
+            capacity (int): Maximum number of keys kept
+        """
+        self.capacity = capacity
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.total = 0
+        self.error = 0
+
+    def add(self, keys, counts=None):
+        """
+        Fold a batch of keys (with optional counts) into the summary.
+
+        Args:
+            keys (np.ndarray): int64 keys
+            counts (np.ndarray): Count of every key (1 each if None)
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        counts = np.ones(len(keys), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self.total += int(counts.sum())
+
+        keys = np.concatenate([self.keys, keys])
+        counts = np.concatenate([self.counts, counts])
+        order = np.argsort(keys, kind='stable')
+        keys, counts = keys[order], counts[order]
+        starts = group_starts(keys)
+        keys, counts = keys[starts], np.add.reduceat(counts, starts) if len(starts) else counts
+
+        if len(keys) > self.capacity:
+            threshold = np.partition(counts, len(counts) - self.capacity - 1)[len(counts) - self.capacity - 1]
+            counts = counts - threshold
+            keep = counts > 0
+            keys, counts = keys[keep], counts[keep]
+            self.error += int(threshold)
+
+        self.keys, self.counts = keys, counts
+
+    def merge(self, other):
+        """
+        Fold another summary into this one.
+
+        Args:
+            other (HeavyHitters): Summary of another block or shard
+
+        Returns:
+            HeavyHitters: This summary
+        """
+        total, error, before = self.total + other.total, self.error + other.error, self.error
+        self.add(other.keys, other.counts)
+        self.total, self.error = total, error + (self.error - before)
+        return self
+
+    def top(self, k):
+        """
+        Return the k keys with the largest counts.
+
+        Returns:
+            tuple: (keys, counts) in decreasing count order
+        """
+        order = np.lexsort((self.keys, -self.counts))[:k]
+        return self.keys[order], self.counts[order]
+
+
+class PathMiner:
+    """
+    Top-K journey paths and transition matrices per segment.
+
+    I reduce every user's time-ordered events to their path: the sequence of
+    event types with consecutive repeats collapsed, truncated to max_length
+    steps. A path is packed into one int64 (a few bits per event type, first
+    event in the lowest bits), so counting paths is counting integers. Events
+    are processed in one pass over the user and time sorted array, user block
+    by user block, into HeavyHitters summaries (bounded memory) and exact
+    event type transition counts including the start and exit of the journey.
+    """
+
+    def __init__(self, event_types=None, segments=None, capacity=DEFAULT_CAPACITY):
+        """
+        Initialize an empty miner.
+
+        Args:
+            event_types (list): Event types with their own code (defaults to the
+                FUNNEL_ORDER events; any other type is encoded as 'other')
+            segments (list): First-touch attributes to break down by
+                (defaults to SEGMENT_COLUMNS)
+            capacity (int): Distinct paths tracked per segment
+        """
+        self.event_types = list(event_types) if event_types is not None else list(FUNNEL_ORDER)
+        self.segments = list(segments) if segments is not None else list(SEGMENT_COLUMNS)
+        self.capacity = capacity
+
+        # Codes 1..n are the event types, n+1 is 'other'; 0 ends a path
+        self.states = [START_STATE] + self.event_types + [OTHER_EVENT, EXIT_STATE]
+        self.bits = (len(self.event_types) + 1).bit_length()
+        self.max_length = 63 // self.bits
+
+        self.path_counts = {}
+        self.transitions = {}
+
+    def _encode(self, event_types):
+        """Event type codes (1..n, n+1 for other types and missing values)."""
+        codes = pd.Categorical(event_types, categories=self.event_types).codes.astype(np.int64)
+        return np.where(codes >= 0, codes + 1, len(self.event_types) + 1)
+
+    def fit(self, events, user_index=None, block_users=BLOCK_USERS):
+        """
+        Mine the paths of a set of events.
+
+        Args:
+            events (pd.DataFrame or EventStore): Events with user_id,
+                event_timestamp, event_type and the segment columns
+            user_index (UserIndex): Offset index when events are cleaned and
+                sorted by user and time (skips the sort)
+            block_users (int): Users encoded at a time
+
+        Returns:
+            PathMiner: The updated miner
+        """
+        users = events['user_id'].to_numpy(np.int64)
+        codes = self._encode(events['event_type'])
+        segments = {column: pd.Categorical(events[column]) for column in self.segments}
+
+        order, starts = sorted_user_runs(users, timestamp_nanos(events['event_timestamp']), user_index)
+        users, codes = users[order], codes[order]
+        segment_codes = {column: values.codes[order] for column, values in segments.items()}
+
+        bounds = np.append(starts[::block_users], len(users))
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            block_segments = {
+                column: pd.Categorical.from_codes(segment_codes[column][low:high], dtype=segments[column].dtype)
+                for column in self.segments
+            }
+            self._add_block(users[low:high], codes[low:high], block_segments)
+
+        return self
+
+    def _add_block(self, users, codes, segments):
+        """Encode and count the paths of the users in one block."""
+        if len(users) == 0:
+            return
+
+        # Collapse consecutive repeats; a user's first event is always kept
+        keep = np.ones(len(users), dtype=bool)
+        keep[1:] = (users[1:] != users[:-1]) | (codes[1:] != codes[:-1])
+        users, codes = users[keep], codes[keep]
+        starts = group_starts(users)
+        lengths = np.diff(np.append(starts, len(users)))
+
+        position = np.arange(len(users)) - np.repeat(starts, lengths)
+        shift = (np.minimum(position, self.max_length - 1) * self.bits).astype(np.int64)
+        packed = np.where(position < self.max_length, np.left_shift(codes, shift), 0)
+        paths = np.bitwise_or.reduceat(packed, starts)
+
+        # Transition keys from * n_states + to, framed by start and exit
+        n_states = len(self.states)
+        same_user = users[1:] == users[:-1]
+        ends = np.append(starts[1:], len(users)) - 1
+        transitions = np.concatenate([
+            codes[starts],
+            codes[:-1][same_user] * n_states + codes[1:][same_user],
+            codes[ends] * n_states + (n_states - 1)
+        ])
+        user_rank = np.repeat(np.arange(len(starts)), lengths)
+        journey = np.concatenate([np.arange(len(starts)), user_rank[:-1][same_user], np.arange(len(starts))])
+
+        groups = [('all', 'all', np.ones(len(starts), dtype=bool))]
+        for column, values in segments.items():
+            first_touch = values[keep][starts]
+            for code, value in enumerate(first_touch.categories):
+                members = first_touch.codes == code
+                if members.any():
+                    groups.append((column, value, members))
+
+        for dimension, value, members in groups:
+            key = (dimension, value)
+            if key not in self.path_counts:
+                self.path_counts[key] = HeavyHitters(self.capacity)
+                self.transitions[key] = np.zeros(n_states * n_states, dtype=np.int64)
+
+            distinct, counts = np.unique(paths[members], return_counts=True)
+            self.path_counts[key].add(distinct, counts)
+            self.transitions[key] += np.bincount(transitions[members[journey]], minlength=n_states * n_states)
+
+    def merge(self, other):
+        """
+        Fold another miner (same event types) into this one, e.g. of another shard.
+
+        Args:
+            other (PathMiner): Miner over other users
+
+        Returns:
+            PathMiner: This miner
+        """
+        if other.states != self.states:
+            raise ValueError("Only miners with the same event types can be merged")
+
+        for key, counter in other.path_counts.items():
+            if key not in self.path_counts:
+                self.path_counts[key] = HeavyHitters(self.capacity)
+                self.transitions[key] = np.zeros_like(other.transitions[key])
+            self.path_counts[key].merge(counter)
+            self.transitions[key] += other.transitions[key]
+        return self
+
+    def decode(self, path):
+        """
+        Turn a packed path back into its event types.
+
+        Args:
+            path (int): Packed path
+
+        Returns:
+            list: Event types in order
+        """
+        mask = (1 << self.bits) - 1
+        steps = []
+        path = int(path)
+        while path:
+            steps.append(self.states[path & mask])
+            path >>= self.bits
+        return steps
+
+    def top_paths(self, k=10, dimension='all', value='all'):
+        """
+        Most common paths of a segment.
+
+        Args:
+            k (int): Number of paths
+            dimension (str): 'all' or a segment column
+            value: Segment value ('all' for dimension 'all')
+
+        Returns:
+            pd.DataFrame: rank, path, length, users and share of the segment's users
+        """
+        counter = self.path_counts.get((dimension, value))
+        if counter is None:
+            raise KeyError(f"No paths for {dimension}={value}")
+
+        paths, users = counter.top(k)
+        steps = [self.decode(path) for path in paths]
+        return pd.DataFrame({
+            'rank': np.arange(1, len(paths) + 1),
+            'path': [PATH_SEPARATOR.join(path) for path in steps],
+            'length': [len(path) for path in steps],
+            'users': users,
+            'user_share': users / counter.total * 100 if counter.total else users * 0.0
+        })
+
+    def transition_matrix(self, dimension='all', value='all'):
+        """
+        Event type transition counts of a segment (Sankey links).
+
+        Args:
+            dimension (str): 'all' or a segment column
+            value: Segment value ('all' for dimension 'all')
+
+        Returns:
+            pd.DataFrame: Transitions from the row state to the column state,
+                with 'start' rows and 'exit' columns framing the journeys
+        """
+        counts = self.transitions.get((dimension, value))
+        if counts is None:
+            raise KeyError(f"No transitions for {dimension}={value}")
+
+        n_states = len(self.states)
+        matrix = pd.DataFrame(
+            counts.reshape(n_states, n_states), index=self.states, columns=self.states
+        )
+        return matrix.loc[self.states[:-1], self.states[1:]]
@@ -0,0 +1,428 @@
+"""
+Segment Index Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Compressed user bitmaps per attribute value and funnel step for drill-down funnels
+"""
+
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from event_stream import group_starts, popcount
+from funnel_engine import FUNNEL_STEPS, FunnelEngine
+
+# User ids are split into containers of 2**16 ids by their high bits
+CONTAINER_BITS = 16
+WORDS_PER_CONTAINER = (1 << CONTAINER_BITS) // 64
+LOW_MASK = (1 << CONTAINER_BITS) - 1
+
+# Containers with fewer users are stored as sorted id arrays, fuller ones as
+# 1024-word bitmaps (the array takes more memory beyond this point)
+ARRAY_CONTAINER_LIMIT = 4096
+
+# Event attributes indexed from the events (users with any event of the value)
+EVENT_ATTRIBUTES = ['platform', 'country', 'traffic_source']
+
+# Attributes indexed from user_demographics
+DEMOGRAPHIC_ATTRIBUTES = ['age_group', 'gender', 'annual_income_range', 'is_premium_user']
+
+
+def _container_rows(sorted_ids, keys):
+    """
+    Ids of the given containers and the row of their container.
+
+    Container bounds come from two binary searches per key (not per id).
+
+    Returns:
+        tuple: (ids within the containers, row in keys of every id)
+    """
+    low = np.searchsorted(sorted_ids, keys << CONTAINER_BITS)
+    lengths = np.searchsorted(sorted_ids, (keys + 1) << CONTAINER_BITS) - low
+    rows = np.repeat(np.arange(len(keys)), lengths)
+    if len(rows) == len(sorted_ids):
+        return sorted_ids, rows
+
+    positions = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(low, lengths)
+    return sorted_ids[positions], rows
+
+
+def _set_bits(keys, ids, words=None):
+    """Set the sorted unique ids falling in the given containers in their words (len(keys), WORDS_PER_CONTAINER)."""
+    if words is None:
+        words = np.zeros((len(keys), WORDS_PER_CONTAINER), dtype=np.uint64)
+    ids, rows = _container_rows(ids, keys)
+    if len(ids) == 0:
+        return words
+
+    flat = rows * WORDS_PER_CONTAINER + ((ids & LOW_MASK) >> 6)
+    bits = np.left_shift(np.uint64(1), (ids & 63).astype(np.uint64))
+
+    # ids are sorted, so the bits of one word are adjacent
+    starts = group_starts(flat)
+    words.ravel()[flat[starts]] |= np.bitwise_or.reduceat(bits, starts)
+    return words
+
+
+def _test_bits(keys, words, ids):
+    """Whether each id is set in the bitmap containers (keys, words)."""
+    found = np.zeros(len(ids), dtype=bool)
+    if len(keys) == 0 or len(ids) == 0:
+        return found
+
+    # Container keys span at most 2**16 values for 32-bit ids, so a direct
+    # key -> row table replaces a binary search per id
+    rows_by_key = np.full(int(keys[-1]) + 2, -1, dtype=np.int64)
+    rows_by_key[keys] = np.arange(len(keys))
+    rows = rows_by_key[np.minimum(ids >> CONTAINER_BITS, len(rows_by_key) - 1)]
+
+    inside = np.flatnonzero(rows >= 0)
+    word = words[rows[inside], (ids[inside] & LOW_MASK) >> 6]
+    found[inside] = (word >> (ids[inside] & 63).astype(np.uint64)) & np.uint64(1) == 1
+    return found
+
+
+def _words_to_ids(keys, words):
+    """Sorted ids set in the bitmap containers (keys, words)."""
+    bits = np.unpackbits(words.astype('<u8').view(np.uint8).ravel(), bitorder='little')
+    positions = np.flatnonzero(bits)
+    return (keys[positions >> CONTAINER_BITS] << CONTAINER_BITS) | (positions & LOW_MASK)
+
+
+def _sorted_unique(values):
+    """Sorted distinct values (a sort and one comparison, no hashing)."""
+    values = np.sort(values)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
+
+
+def _container_keys(sorted_ids):
+    """Distinct container keys of sorted ids."""
+    chunks = sorted_ids >> CONTAINER_BITS
+    return chunks[group_starts(chunks)]
+
+
+def _sorted_member(sorted_values, values):
+    """Whether each value occurs in a sorted array."""
+    if len(sorted_values) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return sorted_values[positions] == values
+
+
+class UserBitmap:
+    """
+    Compressed set of user ids in the style of a roaring bitmap.
+
+    Ids are split into containers by their high 16 bits. A container holding
+    fewer than ARRAY_CONTAINER_LIMIT users is kept as a sorted id array (the
+    array containers of a bitmap are stored concatenated in one sorted int64
+    array); a fuller one as 1024 uint64 words. Small segments therefore cost a
+    few bytes per user and large ones 1 bit per possible id in their range.
+
+    Set operations work on all containers at once: the containers involved are
+    expanded to words and combined word by word, and the result is stored
+    back in the cheaper layout per container.
+    """
+
+    def __init__(self, dense_keys, dense_words, sparse):
+        """
+        Initialize a bitmap from its containers (see from_ids).
+
+        Args:
+            dense_keys (np.ndarray): Sorted int64 keys of the bitmap containers
+            dense_words (np.ndarray): uint64 words (len(dense_keys), 1024)
+            sparse (np.ndarray): Sorted int64 ids of the array containers
+        """
+        self.dense_keys = dense_keys
+        self.dense_words = dense_words
+        self.sparse = sparse
+        self._count = None
+
+    @classmethod
+    def from_ids(cls, user_ids, assume_unique=False):
+        """
+        Build a bitmap from user ids.
+
+        Args:
+            user_ids (array-like): Non-negative integer user ids
+            assume_unique (bool): Ids are already sorted and unique
+
+        Returns:
+            UserBitmap: Bitmap of the ids
+        """
+        ids = np.asarray(user_ids, dtype=np.int64)
+        if not assume_unique:
+            ids = _sorted_unique(ids)
+        if len(ids) and ids[0] < 0:
+            raise ValueError("UserBitmap only holds non-negative user ids")
+        return cls._build(np.zeros(0, dtype=np.int64), np.zeros((0, WORDS_PER_CONTAINER), np.uint64), ids)
+
+    @classmethod
+    def _build(cls, dense_keys, dense_words, sparse):
+        """Normalize containers: demote sparse bitmap containers, promote full arrays."""
+        counts = popcount(dense_words.ravel()).reshape(dense_words.shape).sum(axis=1)
+        demote = counts < ARRAY_CONTAINER_LIMIT
+        if demote.any():
+            demoted = _words_to_ids(dense_keys[demote], dense_words[demote])
+            sparse = np.sort(np.concatenate([sparse, demoted]))
+            dense_keys, dense_words = dense_keys[~demote], dense_words[~demote]
+
+        chunks = sparse >> CONTAINER_BITS
+        starts = group_starts(chunks)
+        sizes = np.diff(np.append(starts, len(sparse)))
+        promote = sizes >= ARRAY_CONTAINER_LIMIT
+        if promote.any():
+            promoted_keys = chunks[starts[promote]]
+            promoted = np.repeat(promote, sizes)
+            keys = np.concatenate([dense_keys, promoted_keys])
+            words = np.concatenate([dense_words, _set_bits(promoted_keys, sparse[promoted])])
+            order = np.argsort(keys)
+            dense_keys, dense_words, sparse = keys[order], words[order], sparse[~promoted]
+
+        return cls(dense_keys, dense_words, sparse)
+
+    @property
+    def keys(self):
+        """Sorted keys of all non-empty containers."""
+        return np.union1d(self.dense_keys, _container_keys(self.sparse))
+
+    def __len__(self):
+        if self._count is None:
+            self._count = int(popcount(self.dense_words.ravel()).sum()) + len(self.sparse)
+        return self._count
+
+    def __and__(self, other):
+        return intersect([self, other])
+
+    def __or__(self, other):
+        return union([self, other])
+
+    @property
+    def nbytes(self):
+        """Memory held by the containers in bytes."""
+        return self.dense_keys.nbytes + self.dense_words.nbytes + self.sparse.nbytes
+
+    def contains(self, user_ids):
+        """
+        Test membership of user ids.
+
+        Args:
+            user_ids (array-like): Integer user ids
+
+        Returns:
+            np.ndarray: Boolean array, True where the id is in the bitmap
+        """
+        ids = np.asarray(user_ids, dtype=np.int64)
+        return _test_bits(self.dense_keys, self.dense_words, ids) | _sorted_member(self.sparse, ids)
+
+    def to_ids(self):
+        """
+        Return the user ids in the bitmap.
+
+        Returns:
+            np.ndarray: Sorted int64 ids
+        """
+        return np.sort(np.concatenate([_words_to_ids(self.dense_keys, self.dense_words), self.sparse]))
+
+
+def _densify(bitmap, keys):
+    """Words of a bitmap over the given sorted container keys (absent containers are empty)."""
+    words = np.zeros((len(keys), WORDS_PER_CONTAINER), dtype=np.uint64)
+    present = _sorted_member(bitmap.dense_keys, keys)
+    words[present] = bitmap.dense_words[np.searchsorted(bitmap.dense_keys, keys[present])]
+    return _set_bits(keys, bitmap.sparse, words)
+
+
+def _intersect_words(bitmaps):
+    """Container keys present in every operand and the AND of their words."""
+    keys = reduce(np.intersect1d, [bitmap.keys for bitmap in bitmaps])
+    words = _densify(bitmaps[0], keys)
+    for bitmap in bitmaps[1:]:
+        words &= _densify(bitmap, keys)
+    return keys, words
+
+
+def intersect(bitmaps):
+    """
+    Intersect several bitmaps at once.
+
+    Only containers present in every operand can hold common users; there the
+    array containers are turned into words and all operands are ANDed word by
+    word, as roaring does for array x bitmap containers.
+
+    Args:
+        bitmaps (list): UserBitmap operands
+
+    Returns:
+        UserBitmap: Users present in every operand
+    """
+    keys, words = _intersect_words(bitmaps)
+    return UserBitmap._build(keys, words, np.zeros(0, dtype=np.int64))
+
+
+def intersection_count(bitmaps):
+    """
+    Count the users present in every bitmap without building the result.
+
+    Args:
+        bitmaps (list): UserBitmap operands
+
+    Returns:
+        int: Size of the intersection
+    """
+    _, words = _intersect_words(bitmaps)
+    return int(popcount(words.ravel()).sum())
+
+
+def union(bitmaps):
+    """
+    Unite several bitmaps at once.
+
+    Args:
+        bitmaps (list): UserBitmap operands
+
+    Returns:
+        UserBitmap: Users present in any operand
+    """
+    keys = reduce(np.union1d, [bitmap.keys for bitmap in bitmaps]).astype(np.int64)
+    words = np.zeros((len(keys), WORDS_PER_CONTAINER), dtype=np.uint64)
+    for bitmap in bitmaps:
+        words |= _densify(bitmap, keys)
+    return UserBitmap._build(keys, words, np.zeros(0, dtype=np.int64))
+
+
+class SegmentIndex:
+    """
+    Bitmap index for drill-down funnels.
+
+    I keep one UserBitmap per value of every event and demographic attribute
+    and one per funnel step. The funnel of any segment, e.g. mobile users from
+    Germany via paid_search aged 25-34, is then the intersection of the
+    segment's attribute bitmaps with each step bitmap plus a popcount, without
+    touching the events again.
+    """
+
+    def __init__(self, steps=None):
+        """
+        Initialize an empty index.
+
+        Args:
+            steps (list): Ordered funnel event types (defaults to FUNNEL_STEPS)
+        """
+        self.steps = list(steps) if steps is not None else list(FUNNEL_STEPS)
+        self.users = None
+        self.bitmaps = {}
+        self.step_bitmaps = []
+
+    def fit(self, events, demographics=None, funnel_engine=None):
+        """
+        Build the bitmaps.
+
+        Args:
+            events (pd.DataFrame or EventStore): Events (or one row per user, e.g.
+                the journey summary) with user_id and the EVENT_ATTRIBUTES columns
+            demographics (pd.DataFrame): user_demographics, optional
+            funnel_engine (FunnelEngine): Fitted engine whose presence matrix
+                defines the step bitmaps (e.g. ordered mode); otherwise a user
+                reaches a step when they have an event of that type
+
+        Returns:
+            SegmentIndex: The fitted index
+        """
+        user_ids = events['user_id'].to_numpy(np.int64)
+        self.users = UserBitmap.from_ids(user_ids)
+
+        self.bitmaps = {
+            column: self._value_bitmaps(user_ids, events[column]) for column in EVENT_ATTRIBUTES
+        }
+        if demographics is not None:
+            demographic_ids = demographics['user_id'].to_numpy(np.int64)
+            for column in DEMOGRAPHIC_ATTRIBUTES:
+                if column in demographics.columns:
+                    self.bitmaps[column] = self._value_bitmaps(demographic_ids, demographics[column])
+
+        if funnel_engine is not None and funnel_engine.presence is not None:
+            reached = funnel_engine.reached_matrix()
+            engine_ids = np.asarray(funnel_engine.user_ids, dtype=np.int64)
+            self.step_bitmaps = [
+                UserBitmap.from_ids(engine_ids[reached[:, position]])
+                for position in range(len(funnel_engine.steps))
+            ]
+            self.steps = list(funnel_engine.steps)
+        else:
+            by_step = self._value_bitmaps(user_ids, events['event_type'])
+            self.step_bitmaps = [by_step.get(step, UserBitmap.from_ids([])) for step in self.steps]
+
+        return self
+
+    @staticmethod
+    def _value_bitmaps(user_ids, values):
+        """One bitmap per distinct value, from a single sort by (value, user)."""
+        codes, uniques = pd.factorize(values)
+        keep = codes >= 0
+        codes, user_ids = codes[keep], user_ids[keep]
+
+        order = np.lexsort((user_ids, codes))
+        codes, user_ids = codes[order], user_ids[order]
+        distinct = np.ones(len(codes), dtype=bool)
+        distinct[1:] = (codes[1:] != codes[:-1]) | (user_ids[1:] != user_ids[:-1])
+        codes, user_ids = codes[distinct], user_ids[distinct]
+
+        bounds = np.searchsorted(codes, np.arange(len(uniques) + 1))
+        return {
+            value: UserBitmap.from_ids(user_ids[bounds[code]:bounds[code + 1]], assume_unique=True)
+            for code, value in enumerate(uniques)
+        }
+
+    def values(self, column):
+        """Indexed values of an attribute."""
+        return list(self.bitmaps[column])
+
+    def _operands(self, filters):
+        """Bitmaps whose intersection is the segment (all users first)."""
+        operands = [self.users]
+        for column, wanted in filters.items():
+            if column not in self.bitmaps:
+                raise KeyError(f"Attribute '{column}' is not indexed")
+
+            if isinstance(wanted, (list, tuple, set)):
+                matches = [self.bitmaps[column][value] for value in wanted if value in self.bitmaps[column]]
+                operands.append(union(matches) if matches else UserBitmap.from_ids([]))
+            else:
+                operands.append(self.bitmaps[column].get(wanted, UserBitmap.from_ids([])))
+        return operands
+
+    def segment(self, **filters):
+        """
+        Bitmap of the users matching every filter.
+
+        Args:
+            **filters: Attribute -> value, or list of values (any of them),
+                e.g. platform='ios_app', country=['Germany', 'Austria']
+
+        Returns:
+            UserBitmap: Users with events matching the segment
+        """
+        operands = self._operands(filters)
+        return intersect(operands) if len(operands) > 1 else self.users
+
+    def funnel(self, **filters):
+        """
+        Funnel of a segment.
+
+        The segment's words are ANDed once and every step is one more AND and
+        popcount over the same containers; no result bitmap is built.
+
+        Args:
+            **filters: Segment filters (see segment)
+
+        Returns:
+            FunnelEngine: Count-only engine (metrics, step_summary) of the segment
+        """
+        keys, members = _intersect_words(self._operands(filters))
+        step_users = [
+            int(popcount((members & _densify(step, keys)).ravel()).sum()) for step in self.step_bitmaps
+        ]
+        return FunnelEngine.from_counts(step_users, int(popcount(members.ravel()).sum()), steps=self.steps)
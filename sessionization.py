@@ -0,0 +1,149 @@
+"""
+Sessionization Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Reconstruct sessions from inactivity gaps and compute session-level funnels
+"""
+
+import numpy as np
+import pandas as pd
+
+from event_store import sorted_user_runs
+from event_stream import group_starts
+from funnel_engine import FUNNEL_ORDER, FUNNEL_STEPS, FunnelEngine
+from timestamp_parser import timestamp_nanos
+
+# A gap longer than this between two events of a user starts a new session
+DEFAULT_SESSION_TIMEOUT = '30min'
+
+
+def session_breaks(user_ids, timestamps, timeout_nanos):
+    """
+    Mark the events that start a new session.
+
+    Args:
+        user_ids (np.ndarray): User id per event, sorted by user and time
+        timestamps (np.ndarray): int64 nanoseconds per event
+        timeout_nanos (int): Maximum gap within a session
+
+    Returns:
+        np.ndarray: Boolean array, True at the first event of every session
+    """
+    breaks = np.ones(len(user_ids), dtype=bool)
+    breaks[1:] = (user_ids[1:] != user_ids[:-1]) | (np.diff(timestamps) > timeout_nanos)
+    return breaks
+
+
+class Sessionizer:
+    """
+    Gap-based sessionization over user and time sorted events.
+
+    I do not trust the upstream session_id strings: clients drop and reuse
+    them, and hashing millions of strings is slow. Instead a session ends when
+    a user is inactive for longer than the timeout, which is one diff and one
+    cumsum over the sorted timestamps. Sessions get dense integer ids in
+    (user, time) order, and every per-session statistic is a reduceat over the
+    session boundaries.
+    """
+
+    def __init__(self, timeout=DEFAULT_SESSION_TIMEOUT, steps=None):
+        """
+        Initialize the sessionizer.
+
+        Args:
+            timeout (str or timedelta): Inactivity gap that ends a session, e.g. '30min'
+            steps (list): Funnel event types for the session funnel (defaults to FUNNEL_STEPS)
+        """
+        self.timeout = pd.Timedelta(timeout)
+        self.steps = list(steps) if steps is not None else list(FUNNEL_STEPS)
+        self.event_sessions = None
+        self.sessions = None
+        self.funnel_engine = None
+
+    def fit(self, events, user_index=None):
+        """
+        Assign every event to a session and summarize the sessions.
+
+        Args:
+            events (pd.DataFrame or EventStore): Events with user_id,
+                event_timestamp and event_type
+            user_index (UserIndex): Offset index when events are cleaned and
+                sorted by user and time (skips the sort)
+
+        Returns:
+            Sessionizer: The fitted sessionizer
+        """
+        users = events['user_id'].to_numpy(np.int64)
+        timestamps = timestamp_nanos(events['event_timestamp'])
+        event_types = pd.Categorical(events['event_type'])
+
+        # Events without a timestamp are left out of the order; they join no session
+        order, _ = sorted_user_runs(users, timestamps, user_index)
+        self.event_sessions = np.full(len(users), -1, dtype=np.int64)
+        users, timestamps = users[order], timestamps[order]
+
+        breaks = session_breaks(users, timestamps, self.timeout.value)
+        sorted_sessions = np.cumsum(breaks) - 1
+        self.event_sessions[order] = sorted_sessions
+
+        type_codes = event_types.codes[order]
+        step_by_code = np.array(
+            [FUNNEL_ORDER.get(event, np.nan) for event in event_types.categories], dtype=float
+        )
+        self.sessions = self._summarize(users, timestamps, step_by_code[type_codes], breaks)
+
+        step_codes = pd.Categorical.from_codes(type_codes, categories=event_types.categories)
+        step_codes = pd.Categorical(step_codes, categories=self.steps).codes
+        reached = np.zeros((len(self.sessions), len(self.steps)), dtype=bool)
+        on_step = step_codes >= 0
+        reached[sorted_sessions[on_step], step_codes[on_step]] = True
+        self.funnel_engine = FunnelEngine.from_reached(self.sessions['session_id'], reached, steps=self.steps)
+
+        return self
+
+    @staticmethod
+    def _summarize(users, timestamps, funnel_steps, breaks):
+        """One row per session from the sorted, timed events."""
+        starts = np.flatnonzero(breaks)
+        stops = np.append(starts[1:], len(users))
+
+        session_users = users[starts]
+        first_in_user = np.zeros(len(starts), dtype=bool)
+        first_in_user[group_starts(session_users)] = True
+        session_number = np.arange(len(starts)) - np.maximum.accumulate(
+            np.where(first_in_user, np.arange(len(starts)), 0)
+        )
+
+        session_start = timestamps[starts]
+        session_end = timestamps[stops - 1]
+        return pd.DataFrame({
+            'session_id': np.arange(len(starts), dtype=np.int64),
+            'user_id': session_users,
+            'session_number': session_number + 1,
+            'session_start': session_start.view('datetime64[ns]'),
+            'session_end': session_end.view('datetime64[ns]'),
+            'duration_minutes': (session_end - session_start) / 60e9,
+            'event_count': stops - starts,
+            'max_funnel_step': np.fmax.reduceat(funnel_steps, starts) if len(starts) else funnel_steps[:0]
+        })
+
+    def sessions_per_user(self, user_ids):
+        """
+        Count the sessions of the given users.
+
+        Args:
+            user_ids (array-like): User ids
+
+        Returns:
+            np.ndarray: int64 session counts (0 for users without sessions)
+        """
+        counts = self.sessions['user_id'].value_counts()
+        return counts.reindex(pd.Index(user_ids), fill_value=0).to_numpy(np.int64)
+
+    def metrics(self):
+        """
+        Session-level funnel and drop-off metrics.
+
+        Returns:
+            pd.DataFrame: FunnelEngine.metrics over sessions instead of users
+        """
+        return self.funnel_engine.metrics()
@@ -100,30 +100,38 @@ FROM user_journey;
 -- ==============================================
 
 -- 2. Conversion Rates by Traffic Source
+WITH user_first_event AS (
+  SELECT 
+    user_id,
+    MIN(event_timestamp) as first_event
+  FROM user_events
+  GROUP BY user_id
+)
+
 SELECT 
-  traffic_source,
-  COUNT(DISTINCT user_id) as total_users,
-  COUNT(DISTINCT CASE WHEN event_type = 'purchase_completed' THEN user_id END) as converted_users,
+  ue.traffic_source,
+  COUNT(DISTINCT ue.user_id) as total_users,
+  COUNT(DISTINCT CASE WHEN ue.event_type = 'purchase_completed' THEN ue.user_id END) as converted_users,
   ROUND(
-    COUNT(DISTINCT CASE WHEN event_type = 'purchase_completed' THEN user_id END) * 100.0 /
-    COUNT(DISTINCT user_id), 2
+    COUNT(DISTINCT CASE WHEN ue.event_type = 'purchase_completed' THEN ue.user_id END) * 100.0 /
+    COUNT(DISTINCT ue.user_id), 2
   ) as conversion_rate_percent,
 
   -- Average time to conversion
   ROUND(
     AVG(
-      CASE WHEN event_type = 'purchase_completed' 
-      THEN EXTRACT(EPOCH FROM (event_timestamp - 
-        MIN(event_timestamp) OVER (PARTITION BY user_id))) / 3600 
+      CASE WHEN ue.event_type = 'purchase_completed' 
+      THEN EXTRACT(EPOCH FROM (ue.event_timestamp - ufe.first_event)) / 3600 
       END
     ), 2
   ) as avg_time_to_conversion_hours,
 
   -- Revenue potential (assuming $50 average order value)
-  COUNT(DISTINCT CASE WHEN event_type = 'purchase_completed' THEN user_id END) * 50 as estimated_revenue
+  COUNT(DISTINCT CASE WHEN ue.event_type = 'purchase_completed' THEN ue.user_id END) * 50 as estimated_revenue
 
-FROM user_events
-GROUP BY traffic_source
+FROM user_events ue
+JOIN user_first_event ufe ON ue.user_id = ufe.user_id
+GROUP BY ue.traffic_source
 ORDER BY conversion_rate_percent DESC;
 
 -- ==============================================
@@ -119,21 +119,29 @@ ORDER BY month;
 -- ==============================================
 
 -- 4. Country Performance Analysis
+WITH user_first_event AS (
+  SELECT 
+    user_id,
+    MIN(event_timestamp) as first_event
+  FROM user_events
+  GROUP BY user_id
+)
+
 SELECT 
-  country,
-  COUNT(DISTINCT user_id) as total_users,
-  COUNT(DISTINCT CASE WHEN event_type = 'purchase_completed' THEN user_id END) as converters,
+  ue.country,
+  COUNT(DISTINCT ue.user_id) as total_users,
+  COUNT(DISTINCT CASE WHEN ue.event_type = 'purchase_completed' THEN ue.user_id END) as converters,
   ROUND(
-    COUNT(DISTINCT CASE WHEN event_type = 'purchase_completed' THEN user_id END) * 100.0 /
-    COUNT(DISTINCT user_id), 2
+    COUNT(DISTINCT CASE WHEN ue.event_type = 'purchase_completed' THEN ue.user_id END) * 100.0 /
+    COUNT(DISTINCT ue.user_id), 2
   ) as conversion_rate,
   AVG(
-    CASE WHEN event_type = 'purchase_completed' 
-    THEN EXTRACT(EPOCH FROM (event_timestamp - 
-      MIN(event_timestamp) OVER (PARTITION BY user_id))) / 3600 
+    CASE WHEN ue.event_type = 'purchase_completed' 
+    THEN EXTRACT(EPOCH FROM (ue.event_timestamp - ufe.first_event)) / 3600 
     END
   ) as avg_time_to_purchase_hours
-FROM user_events
-GROUP BY country
-HAVING COUNT(DISTINCT user_id) >= 50  -- Minimum sample size
+FROM user_events ue
+JOIN user_first_event ufe ON ue.user_id = ufe.user_id
+GROUP BY ue.country
+HAVING COUNT(DISTINCT ue.user_id) >= 50  -- Minimum sample size
 ORDER BY conversion_rate DESC;
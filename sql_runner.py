@@ -0,0 +1,315 @@
+"""
+SQL Runner Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Run the sql/ query library in-process against the cleaned data frames
+"""
+
+import glob
+import hashlib
+import importlib.util
+import os
+import re
+import sqlite3
+
+import pandas as pd
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sql')
+
+# Frame attribute on DataPreprocessor -> table name used by the queries
+QUERY_TABLES = {
+    'user_events': 'user_events',
+    'user_demographics': 'user_demographics',
+    'campaign_data': 'campaign_data'
+}
+
+# Numbered headings like "-- 2. Funnel Performance by Platform" name the blocks
+BLOCK_TITLE = re.compile(r'^--\s*\d+\.\s*(.+?)\s*$')
+
+
+def _slug(title):
+    """Turn a block heading into a lower_snake_case query name."""
+    return re.sub(r'[^0-9a-z]+', '_', title.lower()).strip('_')
+
+
+def parse_query_blocks(sql_text):
+    """
+    Split a query file into its named statements.
+
+    Every statement is named after the closest numbered heading comment above
+    it ("-- 1. Overall Funnel Performance" -> "overall_funnel_performance").
+
+    Args:
+        sql_text (str): Contents of a .sql file
+
+    Returns:
+        dict: Query name -> SQL text (in file order)
+    """
+    blocks = {}
+    title, lines = None, []
+
+    for line in sql_text.splitlines():
+        heading = BLOCK_TITLE.match(line.strip())
+        if heading and not any(not text.strip().startswith('--') and text.strip() for text in lines):
+            title, lines = heading.group(1), []
+            continue
+
+        lines.append(line)
+        code = line.split('--', 1)[0].rstrip()
+        if code.endswith(';'):
+            statement = '\n'.join(lines).strip()
+            name = _slug(title) if title else f"query_{len(blocks) + 1}"
+            blocks[name] = statement.rstrip(';').rstrip()
+            title, lines = None, []
+
+    return blocks
+
+
+def load_query_library(sql_dir=SQL_DIR):
+    """
+    Load every named query block of the .sql files in a directory.
+
+    Args:
+        sql_dir (str): Directory holding the .sql files
+
+    Returns:
+        dict: "<file>.<query name>" -> SQL text
+    """
+    library = {}
+    for path in sorted(glob.glob(os.path.join(sql_dir, '*.sql'))):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as sql_file:
+            for name, statement in parse_query_blocks(sql_file.read()).items():
+                library[f"{stem}.{name}"] = statement
+    return library
+
+
+def _closing_paren(sql, open_index):
+    """Return the index of the parenthesis closing the one at open_index."""
+    depth = 0
+    for index in range(open_index, len(sql)):
+        if sql[index] == '(':
+            depth += 1
+        elif sql[index] == ')':
+            depth -= 1
+            if depth == 0:
+                return index
+    raise ValueError("Unbalanced parentheses in query")
+
+
+def _split_top_level(expression, separator):
+    """Split an expression on a separator that is not nested in parentheses."""
+    depth = 0
+    for index, char in enumerate(expression):
+        depth += (char == '(') - (char == ')')
+        if depth == 0 and expression.startswith(separator, index):
+            return expression[:index], expression[index + len(separator):]
+    return None
+
+
+def _sqlite_call(function, argument):
+    """Render one DATE_TRUNC/EXTRACT call in SQLite syntax."""
+    if function == 'DATE_TRUNC':
+        unit, value = argument.split(',', 1)
+        unit = unit.strip().strip("'").lower()
+        if unit == 'month':
+            return f"strftime('%Y-%m-01 00:00:00', {value.strip()})"
+        if unit == 'week':
+            # Monday on or before the timestamp, as in PostgreSQL
+            return f"datetime(date({value.strip()}, '-6 days', 'weekday 1'))"
+        if unit == 'day':
+            return f"datetime(date({value.strip()}))"
+        raise ValueError(f"DATE_TRUNC unit not supported on SQLite: {unit}")
+
+    field, value = re.match(r'\s*(\w+)\s+FROM\s+(.*)$', argument, re.S | re.I).groups()
+    field = field.upper()
+    if field == 'DOW':
+        return f"CAST(strftime('%w', {value}) AS INTEGER)"
+    if field == 'WEEK':
+        return f"CAST(strftime('%W', {value}) AS INTEGER)"
+    if field == 'EPOCH':
+        inner = value.strip()
+        if inner.startswith('(') and _closing_paren(inner, 0) == len(inner) - 1:
+            inner = inner[1:-1]
+        difference = _split_top_level(inner, ' - ')
+        if difference:
+            return f"((julianday({difference[0].strip()}) - julianday({difference[1].strip()})) * 86400)"
+        return f"((julianday({inner}) - 2440587.5) * 86400)"
+    raise ValueError(f"EXTRACT field not supported on SQLite: {field}")
+
+
+def translate_for_sqlite(sql):
+    """
+    Rewrite the PostgreSQL date functions used by the query library for SQLite.
+
+    Args:
+        sql (str): PostgreSQL-flavoured query
+
+    Returns:
+        str: Equivalent SQLite query
+    """
+    call = re.compile(r'\b(DATE_TRUNC|EXTRACT)\s*\(', re.I)
+    match = call.search(sql)
+    while match:
+        open_index = match.end() - 1
+        close_index = _closing_paren(sql, open_index)
+        argument = translate_for_sqlite(sql[open_index + 1:close_index])
+        replacement = _sqlite_call(match.group(1).upper(), argument)
+        sql = sql[:match.start()] + replacement + sql[close_index + 1:]
+        match = call.search(sql, match.start() + len(replacement))
+    return sql
+
+
+def data_version(frames):
+    """
+    Content hash of a set of frames, used to key cached query results.
+
+    Args:
+        frames (dict): Table name -> DataFrame
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    for name in sorted(frames):
+        digest.update(name.encode())
+        digest.update(pd.util.hash_pandas_object(frames[name], index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+class SQLQueryRunner:
+    """
+    In-process SQL engine over the cleaned frames.
+
+    I use this to run the canonical queries in sql/ directly from Python, so
+    the SQL and pandas numbers can be compared without a database server. The
+    frames are registered in DuckDB when it is installed (vectorized,
+    multi-threaded, PostgreSQL-compatible date functions) and otherwise copied
+    into an in-memory SQLite database, with the date functions rewritten.
+
+    Results are cached by engine, data version and query text, so re-running a
+    query on unchanged data returns the cached frame.
+    """
+
+    def __init__(self, frames, engine=None, version=None, sql_dir=SQL_DIR):
+        """
+        Initialize the runner.
+
+        Args:
+            frames (dict): Table name -> DataFrame (e.g. user_events)
+            engine (str): 'duckdb' or 'sqlite'; defaults to duckdb when installed
+            version (str): Data version for the result cache (defaults to a
+                content hash of the frames)
+            sql_dir (str): Directory holding the .sql query library
+        """
+        if engine is None:
+            engine = 'duckdb' if importlib.util.find_spec('duckdb') else 'sqlite'
+        if engine not in ('duckdb', 'sqlite'):
+            raise ValueError(f"Unknown SQL engine: {engine}")
+
+        self.engine = engine
+        self.queries = load_query_library(sql_dir)
+        self.version = version or data_version(frames)
+        self._results = {}
+        self._connection = self._connect(frames)
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor, **kwargs):
+        """
+        Create a runner over a DataPreprocessor's cleaned frames.
+
+        The source files' cache key is used as data version when the
+        preprocessor has a columnar cache, which avoids hashing the frames.
+
+        Args:
+            preprocessor (DataPreprocessor): Preprocessor with loaded data
+            **kwargs: Extra SQLQueryRunner options
+
+        Returns:
+            SQLQueryRunner: Runner over the preprocessor's frames
+        """
+        frames = {
+            table: getattr(preprocessor, attribute)
+            for attribute, table in QUERY_TABLES.items()
+            if getattr(preprocessor, attribute) is not None
+        }
+        if 'version' not in kwargs and preprocessor.cache is not None and preprocessor.source_paths:
+            kwargs['version'] = preprocessor.cache.cache_key(preprocessor.source_paths)
+
+        return cls(frames, **kwargs)
+
+    def _connect(self, frames):
+        """Load the frames into a fresh in-memory database."""
+        if self.engine == 'duckdb':
+            import duckdb
+
+            connection = duckdb.connect(':memory:')
+            for table, frame in frames.items():
+                # Registered frames are scanned in place, without a copy
+                connection.register(table, frame)
+            return connection
+
+        connection = sqlite3.connect(':memory:')
+        for table, frame in frames.items():
+            frame = frame.copy()
+            for column in frame.columns:
+                if isinstance(frame[column].dtype, pd.CategoricalDtype):
+                    frame[column] = frame[column].astype(object)
+                elif pd.api.types.is_datetime64_any_dtype(frame[column]):
+                    frame[column] = frame[column].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+            frame.to_sql(table, connection, index=False)
+        return connection
+
+    def _cache_key(self, sql):
+        """Key of a query result: engine, data version and query text."""
+        return hashlib.sha256(f"{self.engine}|{self.version}|{sql}".encode()).hexdigest()
+
+    def execute(self, sql):
+        """
+        Run a SQL statement (PostgreSQL dialect) and return its result.
+
+        Args:
+            sql (str): Query text
+
+        Returns:
+            pd.DataFrame: Query result
+        """
+        key = self._cache_key(sql)
+        if key not in self._results:
+            if self.engine == 'duckdb':
+                result = self._connection.execute(sql).df()
+            else:
+                result = pd.read_sql_query(translate_for_sqlite(sql), self._connection)
+            self._results[key] = result
+
+        return self._results[key].copy()
+
+    def run(self, name):
+        """
+        Run a named query from the library.
+
+        Args:
+            name (str): "<file>.<query name>", e.g. "funnel_analysis.overall_funnel_performance"
+
+        Returns:
+            pd.DataFrame: Query result
+        """
+        if name not in self.queries:
+            raise KeyError(f"Unknown query: {name}")
+        return self.execute(self.queries[name])
+
+    def run_all(self, prefix=''):
+        """
+        Run every library query whose name starts with a prefix.
+
+        Args:
+            prefix (str): e.g. "cohort_analysis." for one file
+
+        Returns:
+            dict: Query name -> result
+        """
+        print(f"🗄️ Running SQL query library on {self.engine}...")
+
+        results = {name: self.run(name) for name in self.queries if name.startswith(prefix)}
+
+        print(f"✅ Ran {len(results)} queries")
+        return results
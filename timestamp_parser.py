@@ -0,0 +1,252 @@
+"""
+Timestamp Parser Module for User Onboarding Funnel Analysis
+Author: Data Analyst Portfolio Project 2024-2025
+Purpose: Decode fixed-format timestamps straight from their bytes into int64 nanoseconds
+"""
+
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+# Accepted layouts: 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM:SS' and the latter with a
+# '.f' to '.ffffff' fraction ('T' may replace the space)
+DATE_WIDTH = 10
+SECONDS_WIDTH = 19
+MAX_WIDTH = 26
+
+# Sentinel for missing timestamps; viewing it as datetime64 gives NaT
+NAT = np.iinfo(np.int64).min
+
+NANOS_PER_SECOND = 10 ** 9
+NANOS_PER_DAY = 86_400 * NANOS_PER_SECOND
+
+# Rows decoded at a time, which bounds the temporary arrays
+BLOCK_ROWS = 1 << 18
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+# Shorter rows are completed from this template, so a date alone decodes as
+# midnight and '.5' as 500000 microseconds
+TEMPLATE = np.frombuffer(b'0000-00-00 00:00:00.000000', dtype=np.uint8)
+VALID_WIDTHS = [DATE_WIDTH, SECONDS_WIDTH] + list(range(SECONDS_WIDTH + 2, MAX_WIDTH + 1))
+
+DIGIT_COLUMNS = np.array([0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18, 20, 21, 22, 23, 24, 25])
+SEPARATORS = {4: b'-', 7: b'-', 13: b':', 16: b':', 19: b'.'}
+FIELDS = ['year', 'month', 'day', 'hour', 'minute', 'second', 'microsecond']
+FIELD_DIGITS = [4, 2, 2, 2, 2, 2, 6]
+
+# Digit -> field weights: one matrix product turns the digits into all fields
+FIELD_WEIGHTS = np.zeros((len(DIGIT_COLUMNS), len(FIELDS)), dtype=np.float32)
+FIELD_WEIGHTS[np.arange(len(DIGIT_COLUMNS)), np.repeat(np.arange(len(FIELDS)), FIELD_DIGITS)] = np.concatenate([
+    10.0 ** np.arange(count - 1, -1, -1) for count in FIELD_DIGITS
+])
+
+# Years whose every instant fits in int64 nanoseconds; the partial years at
+# the edges of that range go through the pd.to_datetime fallback
+MIN_YEAR, MAX_YEAR = 1678, 2261
+
+# Days per month of a non-leap year, index 0 unused
+MONTH_DAYS = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+
+
+def days_from_civil(year, month, day):
+    """
+    Days since 1970-01-01 of proleptic Gregorian dates (vectorized).
+
+    Args:
+        year (np.ndarray): int64 years
+        month (np.ndarray): int64 months, 1-12
+        day (np.ndarray): int64 days of month, 1-31
+
+    Returns:
+        np.ndarray: int64 day numbers
+    """
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146_097 + day_of_era - 719_468
+
+
+def _arrow_strings(values):
+    """A string column as a pyarrow string array (no copy if already Arrow-backed), or None."""
+    if not HAS_PYARROW:
+        return None
+    import pyarrow as pa
+
+    array = values.array if isinstance(values, pd.Series) else values
+    if not isinstance(array, (pa.Array, pa.ChunkedArray)):
+        try:
+            if hasattr(array, '__arrow_array__'):
+                # pyarrow-backed pandas strings hand over their buffers without a copy
+                array = pa.array(array)
+            else:
+                array = pa.array(np.asarray(array, dtype=object), type=pa.string(), from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return None
+
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks() if array.num_chunks != 1 else array.chunk(0)
+    if not (pa.types.is_string(array.type) or pa.types.is_large_string(array.type)):
+        return None
+    return array
+
+
+def _arrow_text(array):
+    """Offsets, data bytes and validity of a pyarrow string array."""
+    import pyarrow as pa
+
+    offset_type = np.int64 if pa.types.is_large_string(array.type) else np.int32
+    _, offset_buffer, data_buffer = array.buffers()
+    offsets = np.frombuffer(offset_buffer, dtype=offset_type)[array.offset:array.offset + len(array) + 1]
+    data = np.frombuffer(data_buffer, dtype=np.uint8) if data_buffer is not None else np.zeros(0, np.uint8)
+    valid = array.is_valid().to_numpy(zero_copy_only=False)
+    return offsets.astype(np.int64), data, valid
+
+
+def _pandas_timestamps(values):
+    """Parse timestamp strings with pd.to_datetime, converting offsets to UTC."""
+    parsed = pd.to_datetime(pd.Series(values, copy=False), format='ISO8601', utc=True)
+    return parsed.dt.as_unit('ns').to_numpy('datetime64[ns]').view(np.int64)
+
+
+def _padded_rows(offsets, data, start, stop):
+    """
+    Bytes of rows start..stop as a (rows, MAX_WIDTH) uint8 matrix.
+
+    When every row has the full width (the normal case for an export) this is
+    a reshaped view of the data buffer; otherwise rows are gathered and
+    completed from TEMPLATE.
+
+    Returns:
+        tuple: (matrix, lengths)
+    """
+    bounds = offsets[start:stop + 1]
+    lengths = np.diff(bounds)
+    rows = stop - start
+
+    if rows and lengths.min() == lengths.max() == MAX_WIDTH:
+        return data[bounds[0]:bounds[-1]].reshape(rows, MAX_WIDTH), lengths
+
+    inside = np.arange(MAX_WIDTH) < lengths[:, None]
+    positions = np.where(inside, bounds[:-1, None] + np.arange(MAX_WIDTH), 0)
+    block = np.where(inside, data[positions] if len(data) else 0, TEMPLATE).astype(np.uint8)
+    return block, lengths
+
+
+def decode_block(block, lengths):
+    """
+    Decode one block of fixed-format timestamps.
+
+    Args:
+        block (np.ndarray): uint8 matrix (rows, MAX_WIDTH), short rows completed
+            from TEMPLATE
+        lengths (np.ndarray): Byte length of every row
+
+    Returns:
+        tuple: (int64 nanoseconds, bool mask of rows in a supported layout)
+    """
+    # Bytes below '0' wrap around, so one comparison checks every digit
+    digits = block[:, DIGIT_COLUMNS] - np.uint8(ord('0'))
+    ok = (digits <= 9).all(axis=1) & np.isin(lengths, VALID_WIDTHS)
+    for column, separator in SEPARATORS.items():
+        ok &= block[:, column] == ord(separator)
+    ok &= (block[:, 10] == ord(' ')) | (block[:, 10] == ord('T'))
+
+    fields = (digits @ FIELD_WEIGHTS).astype(np.int64)
+    year, month, day, hour, minute, second, micros = fields.T
+
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = MONTH_DAYS[np.clip(month, 0, 12)] + (leap & (month == 2))
+    ok &= (year >= MIN_YEAR) & (year <= MAX_YEAR)
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+    ok &= (hour < 24) & (minute < 60) & (second < 60)
+
+    nanos = (
+        days_from_civil(year, month, day) * NANOS_PER_DAY
+        + ((hour * 60 + minute) * 60 + second) * NANOS_PER_SECOND
+        + micros * 1000
+    )
+    return np.where(ok, nanos, NAT), ok
+
+
+def parse_timestamps(values, block_rows=BLOCK_ROWS):
+    """
+    Parse timestamp strings into int64 epoch nanoseconds.
+
+    With pyarrow the strings are decoded from their raw bytes (the Arrow
+    buffers of a pyarrow-backed column, so no Python object per row) by
+    Arrow's compiled string cast, or, when the cast rejects a row, by
+    decode_block in blocks of block_rows. Rows in another layout, e.g. with a
+    UTC offset, fall back to pd.to_datetime and are converted to UTC. Without
+    pyarrow the whole column goes through pd.to_datetime, which is faster than
+    copying every row into a byte buffer. Missing values become NAT.
+
+    Args:
+        values (pd.Series or array-like): Timestamp strings
+        block_rows (int): Rows decoded per block
+
+    Returns:
+        np.ndarray: int64 nanoseconds since the epoch
+    """
+    array = _arrow_strings(values)
+    if array is None:
+        return _pandas_timestamps(values)
+
+    import pyarrow as pa
+
+    # Arrow's string -> timestamp cast is a compiled parser for these same
+    # layouts; a column it rejects is decoded below row by row
+    try:
+        return array.cast(pa.timestamp('ns')).cast(pa.int64()).fill_null(NAT).to_numpy()
+    except pa.ArrowInvalid:
+        offsets, data, valid = _arrow_text(array)
+
+    n_rows = len(offsets) - 1
+    nanos = np.empty(n_rows, dtype=np.int64)
+    parsed = np.empty(n_rows, dtype=bool)
+    for start in range(0, n_rows, block_rows):
+        stop = min(start + block_rows, n_rows)
+        block, lengths = _padded_rows(offsets, data, start, stop)
+        nanos[start:stop], parsed[start:stop] = decode_block(block, lengths)
+
+    nanos[~valid] = NAT
+    fallback = np.flatnonzero(valid & ~parsed)
+    if len(fallback):
+        nanos[fallback] = _pandas_timestamps(pd.Series(values, copy=False).iloc[fallback])
+
+    return nanos
+
+
+def parse_timestamp_column(column):
+    """
+    Parse a timestamp column into datetime64[ns].
+
+    Args:
+        column (pd.Series): Timestamp strings (already parsed columns pass through)
+
+    Returns:
+        pd.Series: datetime64[ns] column with the same index and name
+    """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column
+    return pd.Series(
+        parse_timestamps(column).view('datetime64[ns]'), index=column.index, name=column.name, copy=False
+    )
+
+
+def timestamp_nanos(column):
+    """
+    Return a timestamp column as int64 epoch nanoseconds.
+
+    Args:
+        column (pd.Series): Parsed or unparsed timestamps
+
+    Returns:
+        np.ndarray: int64 nanoseconds, NAT where missing
+    """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return pd.Series(column, copy=False).to_numpy('datetime64[ns]').view(np.int64)
+    return parse_timestamps(column)
@@ -4,6 +4,8 @@ Author: Data Analyst Portfolio Project 2024-2025
 Purpose: Generate comprehensive visualizations for funnel analysis
 """
 
+import os
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,113 +14,275 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 import warnings
+from aggregate_cube import AggregateCube
+from conversion_stats import (
+    ANALYTIC_MIN_TRIALS, DEFAULT_CONFIDENCE, DEFAULT_RESAMPLES, funnel_intervals, group_rate_statistics
+)
+from cohort_engine import PERIOD_ADJECTIVES, PERIOD_LABELS, CohortEngine
+from data_preprocessing import BINARY_EVENTS_DIR, DATA_SOURCES
+from distinct_sketch import DEFAULT_RELATIVE_ERROR, SketchCube
+from event_cache import ColumnarCache, source_key
+from event_store import EventStore
+from funnel_engine import FunnelEngine
+from timestamp_parser import parse_timestamp_column
 warnings.filterwarnings('ignore')
 
 # Set style for matplotlib
 plt.style.use('default')
 sns.set_palette("husl")
 
+class lazy_metric:
+    """
+    Memoized FunnelVisualizer metric that is recomputed only when stale.
+
+    The decorated method runs on first access and its result is cached on the
+    instance. Assigning the attribute overrides the cached value (None clears
+    it). Invalidating one of the declared dependencies, e.g. by replacing
+    events_df, also drops this metric and everything computed from it.
+    """
+
+    def __init__(self, *dependencies):
+        """
+        Initialize the metric.
+
+        Args:
+            *dependencies (str): Attributes or metrics the value is derived from
+        """
+        self.dependencies = dependencies
+        self.compute = None
+        self.name = None
+
+    def __call__(self, compute):
+        self.compute = compute
+        self.__doc__ = compute.__doc__
+        return self
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        if '_metric_dependents' not in owner.__dict__:
+            owner._metric_dependents = {}
+        for dependency in self.dependencies:
+            owner._metric_dependents.setdefault(dependency, []).append(name)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        cache = instance.__dict__.setdefault('_metric_cache', {})
+        if self.name not in cache:
+            cache[self.name] = self.compute(instance)
+        return cache[self.name]
+
+    def __set__(self, instance, value):
+        instance._invalidate(self.name)
+        cache = instance.__dict__.setdefault('_metric_cache', {})
+        cache.pop(self.name, None)
+        if value is not None:
+            cache[self.name] = value
+
+
 class FunnelVisualizer:
     """
     Comprehensive visualization class for funnel analysis.
 
     I created this class to generate publication-ready charts for my portfolio.
     All visualizations are designed to tell a clear story about user behavior.
+
+    The chart metrics are computed lazily: constructing the visualizer does no
+    work, and each chart only builds the aggregates it reads. Results are
+    memoized until the events frame is replaced.
     """
 
-    def __init__(self, user_events_df, user_demographics_df, campaign_df):
+    def __init__(self, user_events_df, user_demographics_df, campaign_df, funnel_engine=None,
+                 ordered_funnel=False, conversion_window=None, approximate=False,
+                 relative_error=DEFAULT_RELATIVE_ERROR, confidence=DEFAULT_CONFIDENCE,
+                 resamples=DEFAULT_RESAMPLES):
         """
         Initialize visualizer with data.
 
         Args:
-            user_events_df (pd.DataFrame): Cleaned user events data
+            user_events_df (pd.DataFrame or EventStore): Cleaned user events data
             user_demographics_df (pd.DataFrame): User demographics data
             campaign_df (pd.DataFrame): Campaign performance data
+            funnel_engine (FunnelEngine): Optional engine already fitted on the same
+                events (e.g. DataPreprocessor.funnel_engine) to avoid recomputing it
+            ordered_funnel (bool): Only count steps reached in funnel order
+            conversion_window (str or timedelta): Time limit from landing to each
+                later step for the ordered funnel, e.g. '7D'
+            approximate (bool): Estimate distinct users with HyperLogLog sketches
+                instead of exact counts (the ordered funnel and cohort heatmap
+                always use exact counts)
+            relative_error (float): Target relative standard error in approximate mode
+            confidence (float): Confidence level of the rate intervals and
+                significance tests drawn on the charts
+            resamples (int): Bootstrap resamples for rates of small groups
         """
         self.events_df = user_events_df
         self.demographics_df = user_demographics_df
         self.campaign_df = campaign_df
+        self.ordered_funnel = ordered_funnel
+        self.conversion_window = conversion_window
+        self.approximate = approximate
+        self.relative_error = relative_error
+        self.confidence = confidence
+        self.resamples = resamples
+
+        # Seeds the lazy funnel engine; dropped again if the events are replaced
+        if funnel_engine is not None:
+            self.funnel_engine = funnel_engine
+
+    @classmethod
+    def from_cache(cls, cache_dir, source_paths, **kwargs):
+        """
+        Create a visualizer from the preprocessing pipeline's columnar cache.
 
-        # Create processed datasets for analysis
-        self._prepare_analysis_data()
-
-    def _prepare_analysis_data(self):
-        """Prepare data for visualization analysis."""
-
-        # Calculate funnel metrics
-        self.funnel_data = self._calculate_funnel_metrics()
+        Args:
+            cache_dir (str): Cache directory used by DataPreprocessor
+            source_paths (list): Raw events, demographics and campaign CSV paths
+            **kwargs: Extra FunnelVisualizer options
 
-        # Platform performance data
-        self.platform_data = self._calculate_platform_metrics()
+        Returns:
+            FunnelVisualizer: Visualizer over the cached frames, or None if the
+                cache is missing or out of date
+        """
+        frames = ColumnarCache(cache_dir).load(
+            source_paths, ['user_events', 'user_demographics', 'campaign_data']
+        )
+        if frames is None:
+            return None
+
+        return cls(frames['user_events'], frames['user_demographics'], frames['campaign_data'], **kwargs)
+
+    @property
+    def events_df(self):
+        """Cleaned user events frame the metrics are computed from."""
+        return self._events_df
+
+    @events_df.setter
+    def events_df(self, events):
+        """Replace the events and drop every metric derived from them."""
+        if isinstance(events, EventStore):
+            self.event_store = events
+            events = events.to_frame()
+        else:
+            self.event_store = None
+
+        self._events_df = events
+        self._invalidate('events_df')
+
+    def _invalidate(self, name):
+        """Forget the cached metrics that depend, directly or not, on name."""
+        cache = self.__dict__.setdefault('_metric_cache', {})
+        stale = list(self._metric_dependents.get(name, ()))
+        while stale:
+            dependent = stale.pop()
+            cache.pop(dependent, None)
+            stale.extend(self._metric_dependents.get(dependent, ()))
 
-        # Time-based analysis data
-        self.time_data = self._calculate_time_metrics()
+    def _prepare_analysis_data(self):
+        """Compute every chart metric up front (they are otherwise computed on first use)."""
+        for name in ['cube', 'funnel_data', 'platform_data', 'platform_significance', 'time_data']:
+            getattr(self, name)
+
+    @lazy_metric('events_df')
+    def cube(self):
+        """Single-pass aggregate of the raw events; every chart rolls it up."""
+        cube = SketchCube(relative_error=self.relative_error) if self.approximate else AggregateCube()
+        return cube.fit(self.event_store if self.event_store is not None else self.events_df)
+
+    @lazy_metric('events_df', 'cube')
+    def funnel_engine(self):
+        """Funnel engine over the events (ordered, sketched or exact)."""
+        engine = FunnelEngine(ordered=self.ordered_funnel, conversion_window=self.conversion_window)
+
+        # The ordered funnel needs event timestamps; the unordered one only
+        # needs the distinct (user, event type) pairs held by the cube
+        if engine.ordered:
+            return engine.fit(self.events_df)
+        if self.approximate:
+            step_users = self.cube.distinct_users(['event_type']).reindex(engine.steps, fill_value=0)
+            return FunnelEngine.from_counts(step_users.to_numpy(), self.cube.total_users(), steps=engine.steps)
+        return engine.fit(self.cube.to_frame(['user_id', 'event_type']))
+
+    @lazy_metric('funnel_engine')
+    def funnel_data(self):
+        """Core funnel conversion metrics."""
+        return self._calculate_funnel_metrics()
+
+    @lazy_metric('cube')
+    def platform_statistics(self):
+        """Platform metrics with rate intervals, and the pairwise platform tests."""
+        return self._calculate_platform_metrics()
+
+    @lazy_metric('platform_statistics')
+    def platform_data(self):
+        """Platform performance metrics."""
+        return self.platform_statistics[0]
+
+    @lazy_metric('platform_statistics')
+    def platform_significance(self):
+        """Pairwise significance tests of the platform signup and conversion rates."""
+        return self.platform_statistics[1]
+
+    @lazy_metric('cube')
+    def time_data(self):
+        """Monthly distinct users per event type."""
+        return self._calculate_time_metrics()
 
     def _calculate_funnel_metrics(self):
-        """Calculate core funnel conversion metrics."""
-
-        funnel_events = [
-            'landing_page_view', 'signup_page_view', 'email_verification',
-            'profile_setup', 'first_product_view', 'add_to_cart',
-            'checkout_start', 'payment_info_entered', 'purchase_completed'
-        ]
-
-        funnel_metrics = []
-
-        for i, event in enumerate(funnel_events):
-            users_at_step = self.events_df[self.events_df['event_type'] == event]['user_id'].nunique()
-
-            if i == 0:
-                step_conversion = 100.0
-                overall_conversion = 100.0
-            else:
-                previous_users = funnel_metrics[i-1]['users_at_step']
-                step_conversion = (users_at_step / previous_users) * 100 if previous_users > 0 else 0
-                total_users = funnel_metrics[0]['users_at_step']
-                overall_conversion = (users_at_step / total_users) * 100 if total_users > 0 else 0
-
-            funnel_metrics.append({
-                'step': i + 1,
-                'event_type': event,
-                'event_label': event.replace('_', ' ').title(),
-                'users_at_step': users_at_step,
-                'step_conversion_rate': step_conversion,
-                'overall_conversion_rate': overall_conversion,
-                'drop_off_rate': 100 - step_conversion if i > 0 else 0
-            })
-
-        return pd.DataFrame(funnel_metrics)
+        """Calculate core funnel conversion metrics with their confidence intervals."""
+
+        intervals = funnel_intervals(self.funnel_engine, self.confidence, self.resamples)
+        return self.funnel_engine.metrics().merge(intervals, on='event_type', how='left')
 
     def _calculate_platform_metrics(self):
         """Calculate platform-specific performance metrics."""
 
-        platform_metrics = []
+        users = self.cube.distinct_users(['platform', 'event_type']).unstack(fill_value=0)
+        users = users.reindex(columns=['landing_page_view', 'signup_page_view', 'purchase_completed'], fill_value=0)
 
-        for platform in self.events_df['platform'].unique():
-            platform_events = self.events_df[self.events_df['platform'] == platform]
+        platform_metrics = pd.DataFrame({
+            'platform': users.index.astype(str),
+            'visitors': users['landing_page_view'].to_numpy(),
+            'signups': users['signup_page_view'].to_numpy(),
+            'purchases': users['purchase_completed'].to_numpy()
+        })
 
-            visitors = platform_events[platform_events['event_type'] == 'landing_page_view']['user_id'].nunique()
-            signups = platform_events[platform_events['event_type'] == 'signup_page_view']['user_id'].nunique()
-            purchases = platform_events[platform_events['event_type'] == 'purchase_completed']['user_id'].nunique()
+        visitors = platform_metrics['visitors'].where(platform_metrics['visitors'] > 0)
+        platform_metrics['signup_rate'] = (platform_metrics['signups'] / visitors * 100).fillna(0)
+        platform_metrics['conversion_rate'] = (platform_metrics['purchases'] / visitors * 100).fillna(0)
 
-            platform_metrics.append({
-                'platform': platform,
-                'visitors': visitors,
-                'signups': signups,
-                'purchases': purchases,
-                'signup_rate': (signups / visitors * 100) if visitors > 0 else 0,
-                'conversion_rate': (purchases / visitors * 100) if visitors > 0 else 0
-            })
+        rates = {'signup_rate': ('signups', 'visitors'), 'conversion_rate': ('purchases', 'visitors')}
+        return group_rate_statistics(
+            platform_metrics, rates, 'platform', indicators=self._platform_indicators(platform_metrics),
+            confidence=self.confidence, resamples=self.resamples
+        )
 
-        return pd.DataFrame(platform_metrics)
+    def _platform_indicators(self, platform_metrics):
+        """
+        Per-user landing, signup and purchase flags of the small platforms.
+
+        Only platforms with fewer than ANALYTIC_MIN_TRIALS visitors are
+        bootstrapped, so only their users are expanded. Sketches keep no
+        users; approximate mode relies on the analytic intervals alone.
+        """
+        small = platform_metrics.loc[platform_metrics['visitors'] < ANALYTIC_MIN_TRIALS, 'platform']
+        if self.approximate or small.empty:
+            return None
+
+        columns = {'landing_page_view': 'visitors', 'signup_page_view': 'signups', 'purchase_completed': 'purchases'}
+        rows = self.cube.to_frame(['user_id', 'platform', 'event_type'])
+        rows = rows[rows['event_type'].isin(list(columns)) & rows['platform'].astype(str).isin(small)]
+
+        indicators = pd.crosstab([rows['platform'].astype(str), rows['user_id']], rows['event_type']) > 0
+        indicators = indicators.reindex(columns=list(columns), fill_value=False).rename(columns=columns)
+        return indicators.reset_index()
 
     def _calculate_time_metrics(self):
         """Calculate time-based performance metrics."""
 
         # Monthly trends
-        monthly_data = self.events_df.groupby([
-            self.events_df['event_timestamp'].dt.to_period('M'), 'event_type'
-        ])['user_id'].nunique().reset_index()
+        monthly_data = self.cube.distinct_users(['month', 'event_type']).reset_index()
+        monthly_data = monthly_data.rename(columns={'month': 'event_timestamp'})
 
         monthly_data['month'] = monthly_data['event_timestamp'].astype(str)
 
@@ -132,54 +296,17 @@ class FunnelVisualizer:
         that clearly demonstrates user drop-off at each stage.
         """
 
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
-
-        # Funnel bar chart
-        bars = ax1.barh(range(len(self.funnel_data)), self.funnel_data['users_at_step'], 
-                       color=plt.cm.Blues(np.linspace(0.9, 0.4, len(self.funnel_data))))
-
-        ax1.set_yticks(range(len(self.funnel_data)))
-        ax1.set_yticklabels(self.funnel_data['event_label'])
-        ax1.set_xlabel('Number of Users')
-        ax1.set_title('User Onboarding Funnel - Absolute Numbers', fontsize=14, fontweight='bold')
-        ax1.grid(axis='x', alpha=0.3)
-
-        # Add value labels on bars
-        for i, bar in enumerate(bars):
-            width = bar.get_width()
-            ax1.text(width + width*0.01, bar.get_y() + bar.get_height()/2, 
-                    f'{int(width):,}', ha='left', va='center', fontweight='bold')
-
-        # Conversion rate chart
-        ax2.plot(range(len(self.funnel_data)), self.funnel_data['overall_conversion_rate'], 
-                marker='o', linewidth=3, markersize=8, color='#2E86AB')
-        ax2.fill_between(range(len(self.funnel_data)), self.funnel_data['overall_conversion_rate'], 
-                        alpha=0.3, color='#2E86AB')
-
-        ax2.set_xticks(range(len(self.funnel_data)))
-        ax2.set_xticklabels(self.funnel_data['event_label'], rotation=45, ha='right')
-        ax2.set_ylabel('Conversion Rate (%)')
-        ax2.set_title('Cumulative Conversion Rates', fontsize=14, fontweight='bold')
-        ax2.grid(alpha=0.3)
-
-        # Add percentage labels
-        for i, rate in enumerate(self.funnel_data['overall_conversion_rate']):
-            ax2.annotate(f'{rate:.1f}%', 
-                        (i, rate), 
-                        textcoords="offset points", 
-                        xytext=(0,10), 
-                        ha='center', fontweight='bold')
-
-        plt.tight_layout()
-
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            print(f"💾 Saved funnel chart to {save_path}")
+        fig = render_funnel_chart(**self._funnel_chart_data())
+        _save_figure(fig, save_path, 'funnel chart')
 
         plt.show()
 
         return fig
 
+    def _funnel_chart_data(self):
+        """Data drawn by create_funnel_chart."""
+        return {'funnel_data': self.funnel_data}
+
     def create_platform_comparison(self, save_path=None):
         """
         Create platform performance comparison charts.
@@ -188,135 +315,64 @@ class FunnelVisualizer:
         for user acquisition and conversion.
         """
 
-        fig, axes = plt.subplots(2, 2, figsize=(15, 12))
-
-        # Visitors by platform
-        axes[0,0].bar(self.platform_data['platform'], self.platform_data['visitors'], 
-                     color=['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4'])
-        axes[0,0].set_title('Visitors by Platform', fontweight='bold')
-        axes[0,0].set_ylabel('Number of Visitors')
-        axes[0,0].tick_params(axis='x', rotation=45)
+        fig = render_platform_comparison(**self._platform_comparison_data())
+        _save_figure(fig, save_path, 'platform comparison')
 
-        # Add value labels
-        for i, v in enumerate(self.platform_data['visitors']):
-            axes[0,0].text(i, v + v*0.02, f'{v:,}', ha='center', fontweight='bold')
+        plt.show()
 
-        # Conversion rates by platform  
-        axes[0,1].bar(self.platform_data['platform'], self.platform_data['conversion_rate'],
-                     color=['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4'])
-        axes[0,1].set_title('Conversion Rate by Platform', fontweight='bold')
-        axes[0,1].set_ylabel('Conversion Rate (%)')
-        axes[0,1].tick_params(axis='x', rotation=45)
+        return fig
 
-        # Add percentage labels
-        for i, v in enumerate(self.platform_data['conversion_rate']):
-            axes[0,1].text(i, v + v*0.02, f'{v:.1f}%', ha='center', fontweight='bold')
+    def _platform_comparison_data(self):
+        """Data drawn by create_platform_comparison."""
 
         # Platform funnel comparison
-        platform_funnel_data = []
-        for platform in self.platform_data['platform'].unique():
-            platform_events = self.events_df[self.events_df['platform'] == platform]
-
-            for event_type in ['landing_page_view', 'signup_page_view', 'email_verification', 'purchase_completed']:
-                count = platform_events[platform_events['event_type'] == event_type]['user_id'].nunique()
-                platform_funnel_data.append({
-                    'platform': platform,
-                    'event_type': event_type.replace('_', ' ').title(),
-                    'users': count
-                })
-
-        platform_funnel_df = pd.DataFrame(platform_funnel_data)
-        pivot_data = platform_funnel_df.pivot(index='event_type', columns='platform', values='users')
-
-        pivot_data.plot(kind='bar', ax=axes[1,0], width=0.8)
-        axes[1,0].set_title('User Progression by Platform', fontweight='bold')
-        axes[1,0].set_ylabel('Number of Users')
-        axes[1,0].tick_params(axis='x', rotation=45)
-        axes[1,0].legend(title='Platform')
-
-        # Platform conversion funnel percentages
-        conversion_matrix = pivot_data.div(pivot_data.iloc[0], axis=1) * 100
-        conversion_matrix.plot(kind='line', ax=axes[1,1], marker='o', linewidth=2)
-        axes[1,1].set_title('Conversion Rate Progression by Platform', fontweight='bold')
-        axes[1,1].set_ylabel('Conversion Rate (%)')
-        axes[1,1].tick_params(axis='x', rotation=45)
-        axes[1,1].legend(title='Platform')
-        axes[1,1].grid(alpha=0.3)
-
-        plt.tight_layout()
-
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            print(f"💾 Saved platform comparison to {save_path}")
-
-        plt.show()
+        funnel_events = ['landing_page_view', 'signup_page_view', 'email_verification', 'purchase_completed']
+        pivot_data = self.cube.distinct_users(
+            ['event_type', 'platform'], where={'event_type': funnel_events}
+        ).unstack(fill_value=0).reindex(index=funnel_events, fill_value=0)
+        pivot_data = pivot_data.reindex(columns=self.platform_data['platform'], fill_value=0)
+        pivot_data.index = [event_type.replace('_', ' ').title() for event_type in pivot_data.index]
+        pivot_data.index.name = 'event_type'
+        pivot_data.columns.name = 'platform'
 
-        return fig
+        return {
+            'platform_data': self.platform_data, 'pivot_data': pivot_data,
+            'significance': self.platform_significance
+        }
 
-    def create_cohort_heatmap(self, save_path=None):
+    def create_cohort_heatmap(self, save_path=None, granularity='W', horizon=13):
         """
         Create cohort retention heatmap.
 
         This advanced visualization shows user retention patterns over time,
         which is crucial for understanding long-term user engagement.
-        """
 
-        # Prepare cohort data
-        def get_period(df):
-            return df['event_timestamp'].dt.to_period('W').dt.start_time
-
-        # Get user's first session (cohort group)
-        df_cohort = self.events_df.groupby('user_id')['event_timestamp'].min().reset_index()
-        df_cohort.columns = ['user_id', 'cohort_group']
-        df_cohort['cohort_group'] = df_cohort['cohort_group'].dt.to_period('W').dt.start_time
-
-        # Get user activity periods
-        df_user_activity = self.events_df.groupby('user_id')['event_timestamp'].apply(get_period).reset_index()
-        df_user_activity = df_user_activity.drop_duplicates()
-        df_user_activity.columns = ['user_id', 'period']
-
-        # Merge cohort and activity data
-        df_cohort_table = df_cohort.merge(df_user_activity, on='user_id')
-        df_cohort_table['period_number'] = (
-            df_cohort_table['period'] - df_cohort_table['cohort_group']
-        ).dt.days / 7
-
-        # Create cohort table
-        cohort_table = df_cohort_table.groupby(['cohort_group', 'period_number'])['user_id'].nunique().reset_index()
-        cohort_sizes = df_cohort.groupby('cohort_group')['user_id'].nunique()
-
-        cohort_table = cohort_table.merge(cohort_sizes.reset_index().rename(columns={'user_id': 'cohort_size'}), 
-                                         on='cohort_group')
-        cohort_table['retention_rate'] = cohort_table['user_id'] / cohort_table['cohort_size']
-
-        # Pivot for heatmap
-        retention_table = cohort_table.pivot(index='cohort_group', 
-                                           columns='period_number', 
-                                           values='retention_rate')
+        Args:
+            save_path (str): Optional path to save the figure
+            granularity (str): 'D', 'W' or 'M' cohorts (weekly by default)
+            horizon (int): Number of periods to show after the cohort period
+        """
 
-        # Create heatmap
-        fig, ax = plt.subplots(figsize=(15, 8))
+        fig = render_cohort_heatmap(**self._cohort_heatmap_data(granularity, horizon))
+        _save_figure(fig, save_path, 'cohort heatmap')
 
-        sns.heatmap(retention_table.iloc[:, :13],  # Show first 13 weeks
-                   annot=True, 
-                   fmt='.2%',
-                   cmap='YlOrRd',
-                   ax=ax,
-                   cbar_kws={'label': 'Retention Rate'})
+        plt.show()
 
-        ax.set_title('Weekly Cohort Retention Analysis', fontsize=16, fontweight='bold', pad=20)
-        ax.set_xlabel('Week Number')
-        ax.set_ylabel('Cohort (Registration Week)')
+        return fig
 
-        plt.tight_layout()
+    def _cohort_heatmap_data(self, granularity='W', horizon=13):
+        """Data drawn by create_cohort_heatmap."""
 
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            print(f"💾 Saved cohort heatmap to {save_path}")
+        # Retention matrix from the integer cohort engine (cohorts follow
+        # individual users, so sketch mode falls back to the raw events)
+        if self.approximate:
+            cohort_events = self.event_store if self.event_store is not None else self.events_df
+        else:
+            cohort_events = self.cube.to_frame(['user_id', 'date']).rename(columns={'date': 'event_timestamp'})
 
-        plt.show()
+        retention_table = CohortEngine(granularity, horizon).fit(cohort_events).retention()
 
-        return fig
+        return {'retention_table': retention_table, 'granularity': granularity}
 
     def create_time_trends(self, save_path=None):
         """
@@ -326,62 +382,26 @@ class FunnelVisualizer:
         which is essential for identifying seasonal patterns and growth trends.
         """
 
-        fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-
-        # Monthly visitor trends
-        monthly_visitors = self.time_data[self.time_data['event_type'] == 'landing_page_view']
-        axes[0,0].plot(monthly_visitors['month'], monthly_visitors['user_id'], 
-                      marker='o', linewidth=3, markersize=8, color='#2E86AB')
-        axes[0,0].set_title('Monthly Visitor Trends', fontweight='bold')
-        axes[0,0].set_ylabel('Unique Visitors')
-        axes[0,0].tick_params(axis='x', rotation=45)
-        axes[0,0].grid(alpha=0.3)
-
-        # Monthly conversion trends
-        monthly_purchases = self.time_data[self.time_data['event_type'] == 'purchase_completed']
-        axes[0,1].plot(monthly_purchases['month'], monthly_purchases['user_id'], 
-                      marker='o', linewidth=3, markersize=8, color='#F39C12')
-        axes[0,1].set_title('Monthly Conversion Trends', fontweight='bold')
-        axes[0,1].set_ylabel('Conversions')
-        axes[0,1].tick_params(axis='x', rotation=45)
-        axes[0,1].grid(alpha=0.3)
-
-        # Day of week analysis
-        dow_data = self.events_df.groupby([
-            self.events_df['event_timestamp'].dt.day_name(), 'event_type'
-        ])['user_id'].nunique().reset_index()
-
-        dow_visitors = dow_data[dow_data['event_type'] == 'landing_page_view']
-        day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        dow_visitors = dow_visitors.set_index('event_timestamp').reindex(day_order).reset_index()
-
-        axes[1,0].bar(dow_visitors['event_timestamp'], dow_visitors['user_id'], 
-                     color='#E74C3C', alpha=0.7)
-        axes[1,0].set_title('Visitors by Day of Week', fontweight='bold')
-        axes[1,0].set_ylabel('Visitors')
-        axes[1,0].tick_params(axis='x', rotation=45)
+        fig = render_time_trends(**self._time_trends_data())
+        _save_figure(fig, save_path, 'time trends')
 
-        # Hourly activity patterns
-        hourly_data = self.events_df.groupby(
-            self.events_df['event_timestamp'].dt.hour
-        )['user_id'].nunique().reset_index()
+        plt.show()
 
-        axes[1,1].plot(hourly_data['event_timestamp'], hourly_data['user_id'], 
-                      marker='o', linewidth=2, color='#9B59B6')
-        axes[1,1].set_title('Hourly Activity Patterns', fontweight='bold')
-        axes[1,1].set_xlabel('Hour of Day')
-        axes[1,1].set_ylabel('Active Users')
-        axes[1,1].grid(alpha=0.3)
+        return fig
 
-        plt.tight_layout()
+    def _time_trends_data(self):
+        """Data drawn by create_time_trends."""
 
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            print(f"💾 Saved time trends to {save_path}")
+        # Day of week analysis
+        day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+        dow_visitors = self.cube.distinct_users(
+            ['day_of_week'], where={'event_type': ['landing_page_view']}
+        ).reindex(day_order).rename_axis('event_timestamp').reset_index()
 
-        plt.show()
+        # Hourly activity patterns
+        hourly_data = self.cube.distinct_users(['hour']).rename_axis('event_timestamp').reset_index()
 
-        return fig
+        return {'time_data': self.time_data, 'dow_visitors': dow_visitors, 'hourly_data': hourly_data}
 
     def create_campaign_performance(self, save_path=None):
         """
@@ -390,72 +410,40 @@ class FunnelVisualizer:
         This chart shows ROI and performance metrics for different marketing campaigns.
         """
 
-        fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-
-        # Campaign ROI
-        axes[0,0].barh(self.campaign_df['campaign_name'], self.campaign_df['campaign_roi'],
-                      color=['red' if x < 0 else 'green' for x in self.campaign_df['campaign_roi']])
-        axes[0,0].set_title('Campaign ROI Performance', fontweight='bold')
-        axes[0,0].set_xlabel('ROI (%)')
-        axes[0,0].axvline(x=0, color='black', linestyle='--', alpha=0.7)
-
-        # Budget vs Acquisitions
-        scatter = axes[0,1].scatter(self.campaign_df['budget'], self.campaign_df['users_acquired'],
-                                   s=self.campaign_df['conversions']*10, alpha=0.7, c=self.campaign_df['conversion_rate_percent'],
-                                   cmap='viridis')
-        axes[0,1].set_title('Budget vs User Acquisition', fontweight='bold')
-        axes[0,1].set_xlabel('Campaign Budget ($)')
-        axes[0,1].set_ylabel('Users Acquired')
-        plt.colorbar(scatter, ax=axes[0,1], label='Conversion Rate (%)')
-
-        # Channel Performance
-        channel_data = self.campaign_df.groupby('channel').agg({
-            'users_acquired': 'sum',
-            'conversions': 'sum',
-            'budget': 'sum'
-        }).reset_index()
-        channel_data['channel_conversion_rate'] = (channel_data['conversions'] / channel_data['users_acquired']) * 100
-
-        axes[1,0].bar(channel_data['channel'], channel_data['channel_conversion_rate'],
-                     color=['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4'])
-        axes[1,0].set_title('Conversion Rate by Channel', fontweight='bold')
-        axes[1,0].set_ylabel('Conversion Rate (%)')
-        axes[1,0].tick_params(axis='x', rotation=45)
-
-        # Cost metrics
-        x = np.arange(len(self.campaign_df))
-        width = 0.35
-
-        axes[1,1].bar(x - width/2, self.campaign_df['cost_per_acquisition'], width, 
-                     label='Cost per Acquisition', alpha=0.8)
-        axes[1,1].bar(x + width/2, self.campaign_df['cost_per_conversion'], width, 
-                     label='Cost per Conversion', alpha=0.8)
-
-        axes[1,1].set_title('Campaign Cost Metrics', fontweight='bold')
-        axes[1,1].set_ylabel('Cost ($)')
-        axes[1,1].set_xticks(x)
-        axes[1,1].set_xticklabels(self.campaign_df['campaign_name'], rotation=45, ha='right')
-        axes[1,1].legend()
-
-        plt.tight_layout()
-
-        if save_path:
-            plt.savefig(save_path, dpi=300, bbox_inches='tight')
-            print(f"💾 Saved campaign performance to {save_path}")
+        fig = render_campaign_performance(**self._campaign_performance_data())
+        _save_figure(fig, save_path, 'campaign performance')
 
         plt.show()
 
         return fig
 
-    def generate_all_visualizations(self, output_dir):
+    def _campaign_performance_data(self):
+        """Data drawn by create_campaign_performance."""
+        return {'campaign_df': self.campaign_df}
+
+    def generate_all_visualizations(self, output_dir, parallel=False, max_workers=None):
         """
         Generate all visualizations and save to specified directory.
 
         This is the main method I use to create all charts for my portfolio presentation.
+
+        Args:
+            output_dir (str): Directory to save the charts in
+            parallel (bool): Compute all chart data first, then render and save
+                the figures concurrently in worker processes (Agg backend)
+            max_workers (int): Worker processes in parallel mode (defaults to
+                one per chart, capped at the CPU count)
+
+        Returns:
+            dict: Chart name -> file path, or chart name -> Future resolving to
+                the file path in parallel mode
         """
 
         print("🎨 Generating comprehensive visualization suite...")
 
+        if parallel:
+            return self._render_suite_in_pool(output_dir, max_workers)
+
         # Create all visualizations
         self.create_funnel_chart(f"{output_dir}/funnel_analysis.png")
         self.create_platform_comparison(f"{output_dir}/platform_comparison.png") 
@@ -473,6 +461,283 @@ class FunnelVisualizer:
             'campaign_performance': f"{output_dir}/campaign_performance.png"
         }
 
+    def _render_suite_in_pool(self, output_dir, max_workers=None):
+        """Submit every chart of the suite to a process pool without waiting."""
+
+        # All aggregation happens here, so workers only receive small frames
+        jobs = {
+            name: (renderer, getattr(self, data_method)(), f"{output_dir}/{file_name}")
+            for name, file_name, data_method, renderer in CHART_SUITE
+        }
+
+        max_workers = max_workers or min(len(jobs), os.cpu_count() or 1)
+        pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_render_worker)
+        print(f"🚀 Rendering {len(jobs)} charts in {max_workers} worker processes...")
+
+        futures = {}
+        for name, (renderer, data, save_path) in jobs.items():
+            futures[name] = pool.submit(_render_chart_file, renderer, data, save_path)
+            futures[name].add_done_callback(
+                lambda future: print(f"💾 Saved {future.result()}") if future.exception() is None else None
+            )
+
+        # Workers keep running; callers wait on the returned futures
+        pool.shutdown(wait=False)
+        return futures
+
+def render_funnel_chart(funnel_data):
+    """Draw the funnel chart figure."""
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 8))
+
+    # Funnel bar chart
+    bars = ax1.barh(range(len(funnel_data)), funnel_data['users_at_step'], 
+                   color=plt.cm.Blues(np.linspace(0.9, 0.4, len(funnel_data))))
+
+    ax1.set_yticks(range(len(funnel_data)))
+    ax1.set_yticklabels(funnel_data['event_label'])
+    ax1.set_xlabel('Number of Users')
+    ax1.set_title('User Onboarding Funnel - Absolute Numbers', fontsize=14, fontweight='bold')
+    ax1.grid(axis='x', alpha=0.3)
+
+    # Add value labels on bars
+    for i, bar in enumerate(bars):
+        width = bar.get_width()
+        ax1.text(width + width*0.01, bar.get_y() + bar.get_height()/2, 
+                f'{int(width):,}', ha='left', va='center', fontweight='bold')
+
+    # Conversion rate chart
+    ax2.plot(range(len(funnel_data)), funnel_data['overall_conversion_rate'], 
+            marker='o', linewidth=3, markersize=8, color='#2E86AB')
+    errors = _interval_errors(funnel_data, 'overall_conversion_rate')
+    if errors is not None:
+        ax2.errorbar(range(len(funnel_data)), funnel_data['overall_conversion_rate'], yerr=errors,
+                     fmt='none', ecolor='#1B4F72', capsize=4, linewidth=1.5)
+    ax2.fill_between(range(len(funnel_data)), funnel_data['overall_conversion_rate'], 
+                    alpha=0.3, color='#2E86AB')
+
+    ax2.set_xticks(range(len(funnel_data)))
+    ax2.set_xticklabels(funnel_data['event_label'], rotation=45, ha='right')
+    ax2.set_ylabel('Conversion Rate (%)')
+    ax2.set_title('Cumulative Conversion Rates', fontsize=14, fontweight='bold')
+    ax2.grid(alpha=0.3)
+
+    # Add percentage labels
+    for i, rate in enumerate(funnel_data['overall_conversion_rate']):
+        ax2.annotate(f'{rate:.1f}%', 
+                    (i, rate), 
+                    textcoords="offset points", 
+                    xytext=(0,10), 
+                    ha='center', fontweight='bold')
+
+    plt.tight_layout()
+
+    return fig
+
+def render_platform_comparison(platform_data, pivot_data, significance=None):
+    """Draw the platform comparison figure (significance: optional pairwise tests to annotate)."""
+    fig, axes = plt.subplots(2, 2, figsize=(15, 12))
+
+    # Visitors by platform
+    axes[0,0].bar(platform_data['platform'], platform_data['visitors'], 
+                 color=['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4'])
+    axes[0,0].set_title('Visitors by Platform', fontweight='bold')
+    axes[0,0].set_ylabel('Number of Visitors')
+    axes[0,0].tick_params(axis='x', rotation=45)
+
+    # Add value labels
+    for i, v in enumerate(platform_data['visitors']):
+        axes[0,0].text(i, v + v*0.02, f'{v:,}', ha='center', fontweight='bold')
+
+    # Conversion rates by platform  
+    axes[0,1].bar(platform_data['platform'], platform_data['conversion_rate'],
+                 color=['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4'],
+                 yerr=_interval_errors(platform_data, 'conversion_rate'), capsize=5)
+    axes[0,1].set_title('Conversion Rate by Platform', fontweight='bold')
+    axes[0,1].set_ylabel('Conversion Rate (%)')
+    axes[0,1].tick_params(axis='x', rotation=45)
+
+    # Add percentage labels
+    for i, v in enumerate(platform_data['conversion_rate']):
+        axes[0,1].text(i, v + v*0.02, f'{v:.1f}%', ha='center', fontweight='bold')
+
+    # List the platform pairs whose conversion rates differ significantly
+    if significance is not None:
+        pairs = significance[(significance['rate'] == 'conversion_rate') & significance['significant']]
+        lines = [f"{row.group_a} vs {row.group_b}: {row.difference:+.1f} pts (p={row.p_value:.3f})"
+                 for row in pairs.itertuples()]
+        axes[0,1].text(0.02, 0.98, '\n'.join(lines) if lines else 'No significant differences',
+                       transform=axes[0,1].transAxes, va='top', fontsize=8,
+                       bbox=dict(boxstyle='round', facecolor='white', alpha=0.8))
+
+    pivot_data.plot(kind='bar', ax=axes[1,0], width=0.8)
+    axes[1,0].set_title('User Progression by Platform', fontweight='bold')
+    axes[1,0].set_ylabel('Number of Users')
+    axes[1,0].tick_params(axis='x', rotation=45)
+    axes[1,0].legend(title='Platform')
+
+    # Platform conversion funnel percentages
+    conversion_matrix = pivot_data.div(pivot_data.iloc[0], axis=1) * 100
+    conversion_matrix.plot(kind='line', ax=axes[1,1], marker='o', linewidth=2)
+    axes[1,1].set_title('Conversion Rate Progression by Platform', fontweight='bold')
+    axes[1,1].set_ylabel('Conversion Rate (%)')
+    axes[1,1].tick_params(axis='x', rotation=45)
+    axes[1,1].legend(title='Platform')
+    axes[1,1].grid(alpha=0.3)
+
+    plt.tight_layout()
+
+    return fig
+
+def _interval_errors(data, column):
+    """Error bar lengths below and above column from its _ci_low/_ci_high bounds, if present."""
+    if f'{column}_ci_low' not in data or f'{column}_ci_high' not in data:
+        return None
+    below = (data[column] - data[f'{column}_ci_low']).clip(lower=0).fillna(0)
+    above = (data[f'{column}_ci_high'] - data[column]).clip(lower=0).fillna(0)
+    return np.vstack([below.to_numpy(float), above.to_numpy(float)])
+
+def render_cohort_heatmap(retention_table, granularity):
+    """Draw the cohort retention heatmap figure."""
+    # Create heatmap
+    fig, ax = plt.subplots(figsize=(15, 8))
+
+    sns.heatmap(retention_table,
+               annot=True, 
+               fmt='.2%',
+               cmap='YlOrRd',
+               ax=ax,
+               cbar_kws={'label': 'Retention Rate'})
+
+    period = PERIOD_LABELS[granularity]
+    ax.set_title(f'{PERIOD_ADJECTIVES[granularity]} Cohort Retention Analysis', fontsize=16, fontweight='bold', pad=20)
+    ax.set_xlabel(f'{period} Number')
+    ax.set_ylabel(f'Cohort (Registration {period})')
+
+    plt.tight_layout()
+
+    return fig
+
+def render_time_trends(time_data, dow_visitors, hourly_data):
+    """Draw the time trends figure."""
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+
+    # Monthly visitor trends
+    monthly_visitors = time_data[time_data['event_type'] == 'landing_page_view']
+    axes[0,0].plot(monthly_visitors['month'], monthly_visitors['user_id'], 
+                  marker='o', linewidth=3, markersize=8, color='#2E86AB')
+    axes[0,0].set_title('Monthly Visitor Trends', fontweight='bold')
+    axes[0,0].set_ylabel('Unique Visitors')
+    axes[0,0].tick_params(axis='x', rotation=45)
+    axes[0,0].grid(alpha=0.3)
+
+    # Monthly conversion trends
+    monthly_purchases = time_data[time_data['event_type'] == 'purchase_completed']
+    axes[0,1].plot(monthly_purchases['month'], monthly_purchases['user_id'], 
+                  marker='o', linewidth=3, markersize=8, color='#F39C12')
+    axes[0,1].set_title('Monthly Conversion Trends', fontweight='bold')
+    axes[0,1].set_ylabel('Conversions')
+    axes[0,1].tick_params(axis='x', rotation=45)
+    axes[0,1].grid(alpha=0.3)
+
+    # Day of week analysis
+    axes[1,0].bar(dow_visitors['event_timestamp'], dow_visitors['user_id'], 
+                 color='#E74C3C', alpha=0.7)
+    axes[1,0].set_title('Visitors by Day of Week', fontweight='bold')
+    axes[1,0].set_ylabel('Visitors')
+    axes[1,0].tick_params(axis='x', rotation=45)
+
+    # Hourly activity patterns
+    axes[1,1].plot(hourly_data['event_timestamp'], hourly_data['user_id'], 
+                  marker='o', linewidth=2, color='#9B59B6')
+    axes[1,1].set_title('Hourly Activity Patterns', fontweight='bold')
+    axes[1,1].set_xlabel('Hour of Day')
+    axes[1,1].set_ylabel('Active Users')
+    axes[1,1].grid(alpha=0.3)
+
+    plt.tight_layout()
+
+    return fig
+
+def render_campaign_performance(campaign_df):
+    """Draw the campaign performance figure."""
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+
+    # Campaign ROI
+    axes[0,0].barh(campaign_df['campaign_name'], campaign_df['campaign_roi'],
+                  color=['red' if x < 0 else 'green' for x in campaign_df['campaign_roi']])
+    axes[0,0].set_title('Campaign ROI Performance', fontweight='bold')
+    axes[0,0].set_xlabel('ROI (%)')
+    axes[0,0].axvline(x=0, color='black', linestyle='--', alpha=0.7)
+
+    # Budget vs Acquisitions
+    scatter = axes[0,1].scatter(campaign_df['budget'], campaign_df['users_acquired'],
+                               s=campaign_df['conversions']*10, alpha=0.7, c=campaign_df['conversion_rate_percent'],
+                               cmap='viridis')
+    axes[0,1].set_title('Budget vs User Acquisition', fontweight='bold')
+    axes[0,1].set_xlabel('Campaign Budget ($)')
+    axes[0,1].set_ylabel('Users Acquired')
+    plt.colorbar(scatter, ax=axes[0,1], label='Conversion Rate (%)')
+
+    # Channel Performance
+    channel_data = campaign_df.groupby('channel').agg({
+        'users_acquired': 'sum',
+        'conversions': 'sum',
+        'budget': 'sum'
+    }).reset_index()
+    channel_data['channel_conversion_rate'] = (channel_data['conversions'] / channel_data['users_acquired']) * 100
+
+    axes[1,0].bar(channel_data['channel'], channel_data['channel_conversion_rate'],
+                 color=['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4'])
+    axes[1,0].set_title('Conversion Rate by Channel', fontweight='bold')
+    axes[1,0].set_ylabel('Conversion Rate (%)')
+    axes[1,0].tick_params(axis='x', rotation=45)
+
+    # Cost metrics
+    x = np.arange(len(campaign_df))
+    width = 0.35
+
+    axes[1,1].bar(x - width/2, campaign_df['cost_per_acquisition'], width, 
+                 label='Cost per Acquisition', alpha=0.8)
+    axes[1,1].bar(x + width/2, campaign_df['cost_per_conversion'], width, 
+                 label='Cost per Conversion', alpha=0.8)
+
+    axes[1,1].set_title('Campaign Cost Metrics', fontweight='bold')
+    axes[1,1].set_ylabel('Cost ($)')
+    axes[1,1].set_xticks(x)
+    axes[1,1].set_xticklabels(campaign_df['campaign_name'], rotation=45, ha='right')
+    axes[1,1].legend()
+
+    plt.tight_layout()
+
+    return fig
+
+
+# Chart name, file name, FunnelVisualizer data method and renderer of the full suite
+CHART_SUITE = [
+    ('funnel_chart', 'funnel_analysis.png', '_funnel_chart_data', render_funnel_chart),
+    ('platform_comparison', 'platform_comparison.png', '_platform_comparison_data', render_platform_comparison),
+    ('cohort_heatmap', 'cohort_retention_heatmap.png', '_cohort_heatmap_data', render_cohort_heatmap),
+    ('time_trends', 'time_trends_analysis.png', '_time_trends_data', render_time_trends),
+    ('campaign_performance', 'campaign_performance.png', '_campaign_performance_data', render_campaign_performance)
+]
+
+def _init_render_worker():
+    """Use the non-interactive Agg backend in chart worker processes."""
+    plt.switch_backend('Agg')
+
+def _render_chart_file(renderer, data, save_path):
+    """Render one chart to a file (runs in a worker process)."""
+    fig = renderer(**data)
+    fig.savefig(save_path, dpi=300, bbox_inches='tight')
+    plt.close(fig)
+    return save_path
+
+def _save_figure(fig, save_path, label):
+    """Save a chart figure at publication resolution."""
+    if save_path:
+        fig.savefig(save_path, dpi=300, bbox_inches='tight')
+        print(f"💾 Saved {label} to {save_path}")
+
 def main():
     """
     Main visualization generation pipeline.
@@ -481,13 +746,23 @@ def main():
     for potential employers and clients.
     """
 
-    # Load processed data
-    events_df = pd.read_csv('../data/user_events.csv')
-    demographics_df = pd.read_csv('../data/user_demographics.csv')
-    campaign_df = pd.read_csv('../data/campaign_data.csv')
-
-    # Initialize visualizer
-    visualizer = FunnelVisualizer(events_df, demographics_df, campaign_df)
+    # Reuse the cleaned data cached by data_preprocessing.py when it is current
+    visualizer = FunnelVisualizer.from_cache('../data/processed/cache', DATA_SOURCES)
+
+    if visualizer is None:
+        # Load processed data (memory-mapped cleaned events when they were
+        # exported from the current raw files)
+        binary_dir = f'../data/processed/{BINARY_EVENTS_DIR}'
+        if EventStore.binary_source_key(binary_dir) == source_key(DATA_SOURCES):
+            events_df = EventStore.from_binary(binary_dir)
+        else:
+            events_df = pd.read_csv('../data/user_events.csv')
+            events_df['event_timestamp'] = parse_timestamp_column(events_df['event_timestamp'])
+        demographics_df = pd.read_csv('../data/user_demographics.csv')
+        campaign_df = pd.read_csv('../data/campaign_data.csv')
+
+        # Initialize visualizer
+        visualizer = FunnelVisualizer(events_df, demographics_df, campaign_df)
 
     # Generate all visualizations
     visualizer.generate_all_visualizations('../visualizations')